@@ -0,0 +1,292 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Batch
+# Runs the node enumeration and the paving search on many catalogues of quads (read from JSON or CSV files)
+# on a pool of processes. The results are written to a SQLite file as soon as a catalogue is done,
+# a run is known by the digest of the quads and of the settings of the search: the ones already done are skipped,
+# so an interrupted batch is resumed by running it again. A catalogue that cannot be read is recorded as an error
+# --------------------------------------------------------- #
+
+import ast
+import csv
+import hashlib
+import json
+import math
+import operator
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import PavingGraph as pg
+import Quadrangle as qd
+import Serialization as se
+from PavingSearch import PavingSearch
+from Scheduler import policy_for
+from Transposition import catalogue_key
+
+DONE = ("solved", "exhausted", "budget") # a catalogue with one of these status is not run again
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogues (
+    hash TEXT PRIMARY KEY, name TEXT, source TEXT, quads TEXT, catalogue TEXT, options TEXT,
+    status TEXT NOT NULL DEFAULT 'pending', started REAL, seconds REAL, explored INTEGER, error TEXT);
+CREATE TABLE IF NOT EXISTS nodes (
+    hash TEXT NOT NULL, valence INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (hash, valence));
+CREATE TABLE IF NOT EXISTS pavings (
+    hash TEXT NOT NULL, number INTEGER NOT NULL, quads INTEGER, complete INTEGER, area REAL, data BLOB,
+    PRIMARY KEY (hash, number));
+CREATE INDEX IF NOT EXISTS catalogues_status ON catalogues (status);
+CREATE INDEX IF NOT EXISTS catalogues_catalogue ON catalogues (catalogue);
+"""
+
+
+# Catalogues
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+              ast.Pow: operator.pow, ast.USub: operator.neg, ast.UAdd: operator.pos}
+_NAMES = {"pi": math.pi}
+_FUNCTIONS = {name: getattr(math, name) for name in ["sqrt", "cos", "sin", "tan", "acos", "asin", "atan"]}
+_FUNCTIONS.update(arccos=math.acos, arcsin=math.asin, arctan=math.atan)
+
+
+def number(value):
+    """ A number, or a formula made of numbers, pi, + - * / ** and sqrt, cos, arccos... ("2*pi/3", "arccos(1/3)")
+    The formula is computed with floats (an integer power such as 9**9**9 would take forever),
+    a result out of range or a division by zero is a ValueError"""
+    if not isinstance(value, str):
+        return float(value)
+
+    def evaluate(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, ast.Name) and node.id in _NAMES:
+            return _NAMES[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](evaluate(node.operand))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            return _FUNCTIONS[node.func.id](evaluate(node.args[0]))
+        raise ValueError(f"not a number: {value!r}")
+    try:
+        return float(evaluate(ast.parse(value.strip(), mode="eval").body))
+    except ArithmeticError as error:
+        raise ValueError(f"{value!r}: {error}") from None
+
+
+def _quad(description):
+    """ A quad from {"id": ..., "angles": [alpha, beta, gamma, delta], "sides": [a, b, c, d]}"""
+    angles, sides = description["angles"], description["sides"]
+    if len(angles) != 4 or len(sides) != 4:
+        raise ValueError(f"a quad has 4 angles and 4 sides: {description!r}")
+    return qd.Quad(description["id"], *map(number, angles), *map(number, sides))
+
+
+def read_json(path):
+    """ The catalogues of a JSON file: a list of {"name": ..., "quads": [quad, ...], "init": id of the first quad},
+    or a dict {name: [quad, ...]}, or one catalogue.
+    Returns the catalogues [(name, quads, init)] and the errors [(name, message)] of the ones that cannot be read"""
+    with open(path) as file:
+        data = json.load(file)
+    if isinstance(data, dict) and "quads" in data:
+        data = [data]
+    elif isinstance(data, dict):
+        data = [{"name": name, "quads": quads} for name, quads in data.items()]
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list or a dict of catalogues")
+    catalogues, errors = [], []
+    for k, entry in enumerate(data):
+        name = entry.get("name", f"{os.path.basename(path)}:{k}") if isinstance(entry, dict) \
+            else f"{os.path.basename(path)}:{k}"
+        try:
+            catalogues.append((name, [_quad(q) for q in entry["quads"]], entry.get("init")))
+        except (AttributeError, KeyError, TypeError, ValueError, SyntaxError) as error:
+            errors.append((name, f"{type(error).__name__}: {error}"))
+    return catalogues, errors
+
+
+def read_csv(path):
+    """ The catalogues of a CSV file with the columns catalogue, id, alpha, beta, gamma, delta, a, b, c, d
+    (one row per quad, the first quad of a catalogue is the first one of the search).
+    Returns the catalogues and the errors as read_json, a catalogue with a row that cannot be read is an error"""
+    catalogues, errors = {}, {}
+    with open(path, newline="") as file:
+        for line, row in enumerate(csv.DictReader(file), 2):
+            name = row.get("catalogue") or f"{os.path.basename(path)}:{line}"
+            try:
+                quad = _quad({"id": row["id"], "angles": [row[x] for x in qd.ANGLES],
+                              "sides": [row[x] for x in "abcd"]})
+            except (KeyError, TypeError, ValueError, SyntaxError) as error:
+                errors.setdefault(name, f"line {line}, {type(error).__name__}: {error}")
+                continue
+            catalogues.setdefault(name, []).append(quad)
+    return ([(name, quads, None) for name, quads in catalogues.items() if name not in errors],
+            list(errors.items()))
+
+
+def read(path):
+    return read_csv(path) if path.lower().endswith(".csv") else read_json(path)
+
+
+def catalogue_hash(quads):
+    return catalogue_key(quads).hex()
+
+
+def run_hash(quads, init, options):
+    """ The key of a run in the store: the digest of the quads, of the first quad and of the settings of the search"""
+    settings = json.dumps(dict(options, init=init), sort_keys=True, default=str).encode()
+    return hashlib.blake2b(catalogue_key(quads) + settings, digest_size=16).hexdigest()
+
+
+def _error_hash(source, name):
+    """ The key of a catalogue that cannot be read"""
+    return hashlib.blake2b(f"{source}\0{name}".encode(), digest_size=16).hexdigest()
+
+
+# Store
+
+class Store:
+    """ The SQLite file of the results: the status of each catalogue, its number of nodes of each valence
+    and the pavings found (as Serialization records). Only the main process writes to it"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, hash, name, source, quads, options=None):
+        """ Records a run of a catalogue (nothing is done if it is known already)"""
+        description = json.dumps([{"id": q.id, "angles": q.angles, "sides": q.sides} for q in quads])
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO catalogues (hash, name, source, quads, catalogue, options) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)",
+                                    (hash, name, source, description, catalogue_hash(quads) if quads else None,
+                                     None if options is None else json.dumps(options, sort_keys=True, default=str)))
+
+    def status(self, hash):
+        row = self.connection.execute("SELECT status FROM catalogues WHERE hash = ?", (hash,)).fetchone()
+        return None if row is None else row[0]
+
+    def start(self, hash):
+        with self.connection:
+            self.connection.execute("UPDATE catalogues SET status = 'running', started = ? WHERE hash = ?",
+                                    (time.time(), hash))
+
+    def finish(self, hash, result):
+        """ Writes the result of a catalogue (see solve), in one transaction"""
+        with self.connection:
+            c = self.connection
+            c.execute("DELETE FROM nodes WHERE hash = ?", (hash,))
+            c.execute("DELETE FROM pavings WHERE hash = ?", (hash,))
+            c.executemany("INSERT INTO nodes VALUES (?, ?, ?)",
+                          [(hash, valence, count) for valence, count in result["nodes"].items()])
+            c.executemany("INSERT INTO pavings VALUES (?, ?, ?, ?, ?, ?)",
+                          [(hash, k, n, complete, area, data)
+                           for k, (n, complete, area, data) in enumerate(result["pavings"])])
+            c.execute("UPDATE catalogues SET status = ?, seconds = ?, explored = ?, error = ? WHERE hash = ?",
+                      (result["status"], result["seconds"], result["explored"], result.get("error"), hash))
+
+    def counts(self):
+        """ Number of catalogues of each status"""
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM catalogues GROUP BY status"))
+
+    def pavings(self, hash):
+        """ The pavings found for a catalogue"""
+        rows = self.connection.execute("SELECT data FROM pavings WHERE hash = ? ORDER BY number", (hash,))
+        return [se.loads(data) for (data,) in rows]
+
+
+# Runner
+
+def solve(task):
+    """ Node enumeration and paving search of one catalogue, run by a process of the pool
+    Returns a dict: status, nodes {valence: count}, pavings [(quads, complete, area, record)], seconds, explored"""
+    quads, init, options = task
+    start = time.perf_counter()
+    result = {"nodes": {}, "pavings": [], "explored": 0}
+    try:
+        for valence in options["valences"]:
+            result["nodes"][valence] = len(pg.possible_noeud(quads, valence))
+        first = quads[0] if init is None else next((q for q in quads if q.id == init), None)
+        if first is None:
+            raise ValueError(f"no quad {init!r} in the catalogue")
+        search = PavingSearch(quads, first, seuil=options["seuil"], max_results=options["max_results"],
+                              max_depth=options["max_depth"], budget=options["budget"], policy=options["policy"])
+        for graphe, complete in search:
+            result["pavings"].append((len(graphe._faces), int(complete), graphe.area(), se.dumps(graphe)))
+        result["explored"] = search.n_explored
+        if result["pavings"]:
+            result["status"] = "solved"
+        elif options["budget"] is not None and search.n_explored >= options["budget"]:
+            result["status"] = "budget"
+        else:
+            result["status"] = "exhausted"
+    except Exception as error:
+        result.update(status="error", error=f"{type(error).__name__}: {error}")
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(paths, db, workers=None, valences=(3, 4, 5, 6), coverage=0.8, max_results=1, max_depth=None,
+              budget=None, policy=None, force=False, log=print):
+    """ Runs every catalogue of the files that is not done yet with these settings (see DONE, force=True runs
+    them all again), the results are written to the SQLite file db as they come.
+    The catalogues and files that cannot be read are recorded with the status "error".
+    Returns the number of catalogues run"""
+    seuil = coverage * 4 * np.pi - 1e-6
+    options = {"valences": list(valences), "seuil": seuil, "max_results": max_results,
+               "max_depth": max_depth, "budget": budget, "policy": policy_for(policy, seuil)}
+    store = Store(db)
+    todo, seen, n_errors = [], set(), 0
+    for path in paths:
+        try:
+            catalogues, errors = read(path)
+        except (OSError, ValueError) as error:
+            catalogues, errors = [], [(os.path.basename(path), f"{type(error).__name__}: {error}")]
+        for name, message in errors:
+            hash = _error_hash(path, name)
+            store.add(hash, name, path, [])
+            store.finish(hash, {"status": "error", "error": message, "nodes": {}, "pavings": [], "seconds": 0.,
+                                "explored": 0})
+            log(f"{name} ({path}): cannot be read, {message}")
+            n_errors += 1
+        for name, quads, init in catalogues:
+            hash = run_hash(quads, init, options)
+            if hash in seen:
+                continue
+            seen.add(hash)
+            store.add(hash, name, path, quads, dict(options, init=init))
+            if force or store.status(hash) not in DONE:
+                todo.append((hash, name, quads, init))
+    log(f"{len(todo)} catalogues to run, {len(seen) - len(todo)} done already, {n_errors} cannot be read")
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            pending = iter(todo)
+            running = {}
+            while True:
+                for hash, name, quads, init in pending:
+                    store.start(hash)
+                    running[executor.submit(solve, (quads, init, options))] = (hash, name)
+                    if len(running) >= 2 * executor._max_workers:
+                        break
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    hash, name = running.pop(future)
+                    result = future.result()
+                    store.finish(hash, result)
+                    log(f"{name} ({hash[:8]}): {result['status']}, {len(result['pavings'])} pavings, "
+                        f"{result['seconds']:.2f}s")
+    finally:
+        store.close()
+    return len(todo)
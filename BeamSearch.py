@@ -0,0 +1,153 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Beam search
+# For catalogues too large for the depth first search: at each step only the best pavings (the beam) are extended,
+# they are scored by their area and by how much of the angle around the points of their boundary is filled.
+# A little seeded noise is added to the scores, and the search is started again with other seeds (restarts)
+# until the time budget is spent, on a pool of processes if asked. A restart that is not cut by the time budget
+# only depends on the seed and its number
+# --------------------------------------------------------- #
+
+import heapq
+import pickle
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import Canonical as cn
+import PavingGraph as pg
+from Bounds import Bounds
+from Scheduler import Scheduler
+
+
+def score(graphe, aire, weight=0.5):
+    """ Area covered (fraction of the sphere) plus weight times the mean fraction of 2pi already filled
+    around the points of the boundary (1 + weight for a closed paving)"""
+    s_point, s_angle, sub0 = graphe._s_point, graphe._s_angle, graphe._v_sub0
+    points = {s_point[sub0[vertex.id]] for vertex in graphe.exterior_vertices()}
+    if not points:
+        return aire / (4 * np.pi) + weight
+    return aire / (4 * np.pi) + weight * sum(s_angle[p] for p in points) / (2 * np.pi * len(points))
+
+
+def restart_seed(seed, k):
+    """ The seed of restart k"""
+    return random.Random(seed * 1000003 + k).getrandbits(64)
+
+
+def beam(quadrangles, quad_init, width=8, seed=0, seuil=4*np.pi - 1e-6, max_depth=200, noise=0.05,
+         policy="constrained", bound=True, deadline=None, weight=0.5):
+    """ One beam search: at each step the children of the pavings of the beam are scored (plus noise times
+    a random number drawn from seed) and the width best ones make the next beam.
+
+    Returns (finished, found), found being the complete pavings (closed or covering more than seuil)
+    as (score, signature, pickled paving, True) or, if there is none, the best paving of the beams as
+    (score, signature, pickled paving, False).
+    finished is False if the search was stopped by the deadline (a time.monotonic() value),
+    found is then what was found before it"""
+    rng = random.Random(seed)
+    scheduler = Scheduler(quadrangles, policy, seed)
+    bounds = Bounds(quadrangles, seuil=seuil) if bound else None
+    root = pg.PavingGraph()
+    root.add_first_quad(quad_init)
+    level = [(root, root.area())]
+    seen = {cn.graph_signature(root)}
+    found = {}
+    best = (score(root, root.area(), weight), min(seen), root)
+
+    def result(finished):
+        if not found:
+            return finished, [(best[0], best[1], pickle.dumps(best[2]), False)]
+        return finished, list(found.values())
+
+    for _ in range(max_depth):
+        children = []
+        for parent, (graphe, aire) in enumerate(level):
+            if deadline is not None and time.monotonic() > deadline:
+                return result(False)
+            for vertex_id, quad in scheduler.placements(graphe):
+                if bounds is not None and not bounds.quad_ok(graphe, aire, vertex_id, quad):
+                    continue
+                checkpoint = graphe.checkpoint()
+                if graphe.add_quad(quad, vertex_id):
+                    signature = cn.graph_signature(graphe)
+                    child_aire = aire + quad.area()
+                    if signature not in seen:
+                        seen.add(signature)
+                        value = score(graphe, child_aire, weight)
+                        if child_aire > seuil or not graphe.exterior_vertices():
+                            found[signature] = (value, signature, pickle.dumps(graphe), True)
+                        elif bounds is None or bounds.paving_ok(graphe, child_aire):
+                            children.append((value + noise * rng.random(), signature, value, parent, vertex_id,
+                                             quad, child_aire))
+                graphe.rollback(checkpoint)
+        if not children:
+            break
+        next_level = []
+        for _, signature, value, parent, vertex_id, quad, child_aire in heapq.nlargest(width, children,
+                                                                                    key=lambda c: c[:2]):
+            child = pg.PavingGraph()
+            child.copy(level[parent][0])
+            child.add_quad(quad, vertex_id)
+            child.clear_journal()
+            next_level.append((child, child_aire))
+            if (value, signature) > best[:2]:
+                best = (value, signature, child)
+        level = next_level
+    return result(True)
+
+
+def _run(task):
+    """ Restart k of a beam search, run by a process of the pool"""
+    k, options = task
+    return k, beam(**options)
+
+
+def beam_search(quadrangles, quad_init, width=8, seed=0, restarts=None, time_budget=None, workers=0,
+                n_results=10, seuil=4*np.pi - 1e-6, max_depth=200, noise=0.05, policy="constrained", bound=True):
+    """ Beam searches with the seeds of restarts 0, 1, 2... (see beam), until restarts were run
+    or time_budget seconds went by (one restart if neither is given, restart 0 is always started),
+    on workers processes (0: in this process)
+
+    Returns at most n_results (paving, complete) pairs, the best first: the complete pavings by score,
+    then the best incomplete ones. The pavings found by the restarts cut by the time budget are kept:
+    without a time budget, the result only depends on seed and restarts"""
+    if restarts is None and time_budget is None:
+        restarts = 1
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    options = {"quadrangles": list(quadrangles), "quad_init": quad_init, "width": width, "seuil": seuil,
+               "max_depth": max_depth, "noise": noise, "policy": policy, "bound": bound, "deadline": deadline}
+    results = {}
+
+    def more(k):
+        return (restarts is None or k < restarts) and (k == 0 or deadline is None or time.monotonic() < deadline)
+
+    k = 0
+    if workers == 0:
+        while more(k):
+            results[k] = beam(seed=restart_seed(seed, k), **options)
+            k += 1
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            running = set()
+            while True:
+                while more(k) and len(running) < 2 * executor._max_workers:
+                    running.add(executor.submit(_run, (k, dict(options, seed=restart_seed(seed, k)))))
+                    k += 1
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    r, result = future.result()
+                    results[r] = result
+
+    pavings = {}
+    for r in sorted(results):
+        for value, signature, data, complete in results[r][1]:
+            pavings.setdefault(signature, (not complete, -value, signature, data))
+    ranked = sorted(pavings.values())[:n_results]
+    return [(pickle.loads(data), not incomplete) for incomplete, _, _, data in ranked]
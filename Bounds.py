@@ -0,0 +1,88 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Bounds
+# Necessary conditions for a paving to be completed into a paving of the whole sphere:
+# the area left (4pi minus the area of the paving) has to be a sum of quad areas,
+# and the angle left around each point of the boundary has to be a sum of quad angles.
+# A paving that only has to cover seuil may keep points that cannot be closed on its boundary,
+# it is then only asked not to go over the sphere
+# --------------------------------------------------------- #
+
+from collections import Counter
+
+import numpy as np
+
+import Canonical as cn
+import Tolerance as tl
+
+WHOLE_SPHERE = 4 * np.pi - 1e-3 # a search with seuil above this only gives closed pavings
+
+
+def fillable(amount, small, large, eps=None):
+    """ Whether amount can be a sum of values between small and large (0 is the empty sum),
+    up to eps (the angle tolerance of the policy by default, see Tolerance)"""
+    if eps is None:
+        eps = tl.policy.angle
+    if abs(amount) <= eps:
+        return True
+    if amount < 0 or large <= 0:
+        return False
+    k = max(1, np.ceil((amount - eps) / large)) # the smallest number of values reaching amount
+    return k * small <= amount + eps
+
+
+class Bounds:
+    """ Bounds of the search with a list of quads, the pavings and quads discarded are counted in stats
+    eps is the angle tolerance of the policy by default (see Tolerance).
+    With seuil below the whole sphere, the pavings covering more than seuil are accepted: only the areas above 4pi,
+    the negative angles left, and the areas below seuil when no quad has a positive area are refused"""
+
+    def __init__(self, quadrangles, eps=None, seuil=4 * np.pi):
+        quad_dispo = cn.unique_rotations(quadrangles)
+        areas = [quad.area() for quad in quad_dispo]
+        angles = [angle for quad in quad_dispo for angle in quad.angles]
+        self.min_area, self.max_area = min(areas), max(areas)
+        self.min_angle, self.max_angle = min(angles), max(angles)
+        self.eps = tl.policy.angle if eps is None else eps
+        self.seuil, self.closed = seuil, seuil >= WHOLE_SPHERE
+        self.stats = Counter()
+
+    def area_ok(self, aire):
+        """ The area left can be filled with the quads"""
+        if not self.closed:
+            return 4 * np.pi - aire >= -self.eps and (aire > self.seuil or self.max_area > self.eps)
+        return fillable(4 * np.pi - aire, self.min_area, self.max_area, self.eps)
+
+    def angle_ok(self, gap):
+        """ The angle left around a point can be filled with quad corners"""
+        if not self.closed:
+            return gap >= -self.eps
+        return fillable(gap, self.min_angle, self.max_angle, self.eps)
+
+    def paving_ok(self, graphe, aire):
+        """ Checks the area left and the angle left at both ends of each side of the boundary"""
+        if not self.area_ok(aire):
+            self.stats["paving area"] += 1
+            return False
+        for vertex in graphe.exterior_vertices():
+            p1, p2 = vertex.points
+            if not (self.angle_ok(graphe.remaining_angle(p1)) and self.angle_ok(graphe.remaining_angle(p2))):
+                self.stats["paving angle"] += 1
+                return False
+        return True
+
+    def quad_ok(self, graphe, aire, vertex_id, quad):
+        """ Whether quad can be added on the boundary side vertex_id (its first side, as in PavingGraph.add_quad)
+        without making the area or the angle left at the ends of the side impossible to fill"""
+        self.stats["quads"] += 1
+        if not self.area_ok(aire + quad.area()):
+            self.stats["quad area"] += 1
+            return False
+        # In add_quad, the corner beta goes at the first point of the side and alpha at the second one
+        if not (self.angle_ok(graphe.remaining_angle(graphe._v_sub0[vertex_id]) - quad.beta) and
+                self.angle_ok(graphe.remaining_angle(graphe._v_sub1[vertex_id]) - quad.alpha)):
+            self.stats["quad angle"] += 1
+            return False
+        return True
@@ -0,0 +1,181 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Canonical forms
+# A node or a paving can be written in many ways (rotation of the chain of a node, order in which the quads
+# of a paving were added, rotation of the quads...), here we compute a hashable signature that is the same
+# for all of them, so that we only explore each of them once
+# --------------------------------------------------------- #
+
+from collections import deque
+
+import numpy as np
+
+import Tolerance as tl
+
+ANGLES = ["alpha", "beta", "gamma", "delta"]
+
+_quad_keys = {}
+
+
+def quad_key(quad):
+    """ The original (not rotated) quad, as the pair of the tuples of its angles and of its sides:
+    the ids are only names, two quads with the same id may differ and the ids may not be comparable.
+    The same key object is given back for the same quad, so that the signatures holding it share it"""
+    key = (tuple(quad.original_angles), tuple(quad.original_sides))
+    key = _quad_keys.setdefault(key, key)
+    if len(_quad_keys) > 1 << 16:
+        _quad_keys.clear()
+    return key
+
+
+def corner_key(quad, angle):
+    """ The corner of the original (not rotated) quad, as a (quad key, corner index) pair"""
+    return quad_key(quad), (ANGLES.index(angle) + quad.rotation) % 4
+
+
+def min_rotation(cycle):
+    """ The smallest of the rotations of a cycle (a tuple)"""
+    cycle = tuple(cycle)
+    return min((cycle[i:] + cycle[:i] for i in range(len(cycle))), default=())
+
+
+def node_signature(noeud, reflexion=False):
+    """ Signature of a node (a list of [quad, angle]), the same for all the rotations of the chain
+
+    With reflexion=True the node read in the other direction has the same signature
+    (the quads are then considered as their own mirror image)"""
+    cycle = [corner_key(quad, angle) for quad, angle in noeud]
+    signature = min_rotation(cycle)
+    if reflexion:
+        signature = min(signature, min_rotation(cycle[::-1]))
+    return signature
+
+
+def unique_nodes(noeuds, reflexion=False):
+    """ Keeps one node for each signature, in the order they are given"""
+    vus = set()
+    uniques = []
+    for noeud in noeuds:
+        signature = node_signature(noeud, reflexion)
+        if signature not in vus:
+            vus.add(signature)
+            uniques.append(noeud)
+    return uniques
+
+
+def canonical_rows(keys, reflexion=False):
+    """ For an (M, L) integer array of cycles, mask of the rows to keep so that each cycle is kept once:
+    the row has to be its smallest rotation, and the first of the rows equal to it"""
+    keys = np.asarray(keys)
+    M, L = keys.shape
+    if M == 0 or L == 0:
+        return np.ones(M, dtype=bool)
+    rows = np.arange(M)
+    keep = np.ones(M, dtype=bool)
+    variants = [np.roll(keys, -r, axis=1) for r in range(1, L)]
+    if reflexion:
+        mirrored = keys[:, ::-1]
+        variants += [np.roll(mirrored, -r, axis=1) for r in range(L)]
+    for variant in variants:
+        diff = variant != keys
+        first = np.argmax(diff, axis=1)
+        keep &= ~(diff.any(axis=1) & (variant[rows, first] < keys[rows, first]))
+    _, first_rows = np.unique(keys[keep], axis=0, return_index=True)
+    mask = np.zeros(M, dtype=bool)
+    mask[np.flatnonzero(keep)[np.sort(first_rows)]] = True
+    return mask
+
+
+def unique_rotations(quadrangles):
+    """ The quads with their four rotations, without the rotations that give back the same quad
+    (a square is given once, a rectangle twice) and without the quads given twice (with the same angles and sides)"""
+    quad_dispo = []
+    vus = set()
+    for quad in quadrangles:
+        for k in range(4):
+            rotated = quad.rotate(k)
+            key = (tuple(rotated.angles), tuple(rotated.sides))
+            if key not in vus:
+                vus.add(key)
+                quad_dispo.append(rotated)
+    return quad_dispo
+
+
+_periods = {}
+
+
+def rotation_period(quad):
+    """ Smallest number of rotations giving back the same quad (the key of unique_rotations):
+    1 for a square, 2 for a rectangle, 4 for a quad without symmetry"""
+    angles, sides = quad.original_angles, quad.original_sides
+    key = (tuple(angles), tuple(sides))
+    period = _periods.get(key)
+    if period is None:
+        period = next(p for p in (1, 2, 4) if angles[p:] + angles[:p] == angles and sides[p:] + sides[:p] == sides)
+        if len(_periods) > 1 << 16:
+            _periods.clear()
+        _periods[key] = period
+    return period
+
+
+def boundary_signature(graphe, eps=None):
+    """ Signature of the boundary of a paving: each cycle of the boundary is written as the cyclic sequence of
+    (length of the side, angle left at its first point), rounded to twice the length and angle tolerances
+    of the policy (see Tolerance) or to 2*eps, from its smallest rotation"""
+    eps_length, eps_angle = (tl.policy.length, tl.policy.angle) if eps is None else (eps, eps)
+
+    def rounded(x, eps):
+        return int(np.rint(x / (2 * eps)))
+    length, sub0 = graphe._v_length, graphe._v_sub0
+    return tuple(sorted(min_rotation((rounded(length[id], eps_length),
+                                      rounded(graphe.remaining_angle(sub0[id]), eps_angle))
+                                     for id in cycle) for cycle in graphe.boundary()))
+
+
+def _face_code(faces, keys, periods, adjacency, start_face, start_side, direction):
+    """ Breadth first walk through the faces of a paving from one side of one face,
+    the faces are numbered in the order they are met, and each face is written as
+    its (quad key, original side index modulo the rotation period of the quad) followed by the numbers
+    of its four neighbours (-1 if there is none): the sides a symmetric quad can be entered from are the same"""
+    labels = {start_face: 0}
+    queue = deque([(start_face, start_side)])
+    code = []
+    while queue:
+        f, s = queue.popleft()
+        quad, sides = faces[f]
+        code.append((keys[f], (s + quad.rotation) % periods[f]))
+        for k in range(4):
+            side = (s + direction * k) % 4
+            neighbour = None
+            for g, t in adjacency[sides[side]]:
+                if g != f:
+                    neighbour = (g, t)
+            if neighbour is None:
+                code.append(-1)
+                continue
+            g, t = neighbour
+            if g not in labels:
+                labels[g] = len(labels)
+                queue.append((g, t))
+            code.append(labels[g])
+    return tuple(code)
+
+
+def graph_signature(graphe, reflexion=False):
+    """ Signature of a paving, the same whatever the order in which its quads were added
+
+    Each face is read from each of its sides and the smallest of the codes is kept.
+    With reflexion=True the mirror image of the paving has the same signature
+    (the quads are then considered as their own mirror image)"""
+    faces = graphe._faces
+    adjacency = {}
+    for f, (quad, sides) in enumerate(faces):
+        for s, vertex_id in enumerate(sides):
+            adjacency.setdefault(vertex_id, []).append((f, s))
+    keys = [quad_key(quad) for quad, _ in faces]
+    periods = [rotation_period(quad) for quad, _ in faces]
+    directions = (1, -1) if reflexion else (1,)
+    return min((_face_code(faces, keys, periods, adjacency, f, s, direction)
+                for f in range(len(faces)) for s in range(4) for direction in directions), default=())
@@ -0,0 +1,138 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Embedding
+# Places the quads of a paving on the unit sphere, from their angles and side lengths.
+# Each quad is drawn in its own frame (a rotation of the sphere), the frame of a quad is the frame of the quad
+# it was reached from times a rotation that only depends on that quad: the frames of all the quads are
+# computed with a few batches of matrix products
+# --------------------------------------------------------- #
+
+from collections import deque
+
+import numpy as np
+
+
+class Embedding:
+    """ Positions of a paving on the unit sphere
+
+    corners: (F, 4, 3) position of the corners A, B, C, D of each face (in the order of graphe._faces)
+    corner_points: (F, 4) real life point (see PavingGraph.fan_labels) of each corner
+    points, positions: the real life points and their positions (mean of the corners at the point)
+    errors: for each point, the largest distance between a corner at the point and its position,
+    0 (up to rounding) if the quads close up around the point"""
+
+    def __init__(self, corners, corner_points):
+        self.corners = corners
+        self.corner_points = corner_points
+        self.points, inverse = np.unique(corner_points.ravel(), return_inverse=True)
+        flat = corners.reshape(-1, 3)
+        counts = np.bincount(inverse, minlength=len(self.points))[:, None]
+        mean = np.stack([np.bincount(inverse, weights=flat[:, k], minlength=len(self.points))
+                         for k in range(3)], axis=1) / np.maximum(counts, 1)
+        norms = np.linalg.norm(mean, axis=1, keepdims=True)
+        self.positions = mean / np.where(norms > 0, norms, 1)
+        distances = np.linalg.norm(flat - self.positions[inverse], axis=1)
+        self.errors = np.zeros(len(self.points))
+        np.maximum.at(self.errors, inverse, distances)
+
+    @property
+    def max_error(self):
+        return float(self.errors.max()) if len(self.errors) else 0.
+
+    def meetings(self, eps=1e-6):
+        """ Number of pairs of distinct points at the same position (up to eps): a boundary touching itself
+        at a point gives two points there, as add_quad only joins the fans of a point when they close"""
+        close = np.linalg.norm(self.positions[:, None] - self.positions[None], axis=2) <= eps
+        return int((close.sum() - len(self.points)) // 2)
+
+    def position(self, point):
+        return self.positions[np.searchsorted(self.points, point)]
+
+
+def _walk(angles, sides, start):
+    """ Walks around each quad from the start of its side start, in the frame where that point is (0, 0, 1)
+    and the side leaves it in the direction (1, 0, 0), turning left at each corner
+
+    Returns the positions of the corners (F, 4, 3) and, for each side, the frame in which the neighbour
+    across the side starts its own walk: its end point, going back along the side (F, 4, 3, 3)"""
+    F = len(start)
+    rows = np.arange(F)
+    p = np.tile([0., 0., 1.], (F, 1))
+    t = np.tile([1., 0., 0.], (F, 1))
+    corners = np.zeros((F, 4, 3))
+    frames = np.zeros((F, 4, 3, 3))
+    corners[rows, start] = p
+    for k in range(4):
+        side = (start + k) % 4
+        arc = sides[rows, side][:, None]
+        p, t = np.cos(arc) * p + np.sin(arc) * t, -np.sin(arc) * p + np.cos(arc) * t
+        corner = (side + 1) % 4
+        corners[rows, corner] = p
+        back = -t
+        frames[rows, side] = np.stack([back, np.cross(p, back), p], axis=2)
+        # Turn left by pi - angle around p (Rodrigues, t being orthogonal to p)
+        turn = (np.pi - angles[rows, corner])[:, None]
+        t = np.cos(turn) * t + np.sin(turn) * np.cross(p, t)
+    return corners, frames
+
+
+def _spanning_tree(faces):
+    """ Breadth first tree of the faces through their shared sides:
+    parent face, side of the parent and side of the face for each face (-1 for the root and unreached faces)"""
+    F = len(faces)
+    users = {}
+    for f, (_, sides) in enumerate(faces):
+        for s, vertex in enumerate(sides):
+            users.setdefault(vertex, []).append((f, s))
+    parent, parent_side, side = np.full(F, -1), np.full(F, -1), np.full(F, -1)
+    reached = np.zeros(F, dtype=bool)
+    reached[0] = True
+    order = [0]
+    queue = deque([0])
+    while queue:
+        f = queue.popleft()
+        for s, vertex in enumerate(faces[f][1]):
+            for g, t in users[vertex]:
+                if not reached[g]:
+                    reached[g] = True
+                    parent[g], parent_side[g], side[g] = f, s, t
+                    order.append(g)
+                    queue.append(g)
+    return parent, parent_side, side, np.array(order)
+
+
+def embed(graphe):
+    """ Embedding of a paving, the first quad has its corner A at (0, 0, 1) and its side AB going to (1, 0, 0)
+
+    Each quad is walked from the side it shares with its parent in a breadth first tree,
+    the frames of the quads are composed along the tree by pointer doubling (log(depth) batched matrix products)"""
+    faces = graphe._faces
+    F = len(faces)
+    if F == 0:
+        return Embedding(np.zeros((0, 4, 3)), np.zeros((0, 4), dtype=np.int64))
+    angles = np.array([quad.angles for quad, _ in faces], dtype=np.float64)
+    sides = np.array([quad.sides for quad, _ in faces], dtype=np.float64)
+    parent, parent_side, start, order = _spanning_tree(faces)
+    start = np.maximum(start, 0)
+    local, child_frames = _walk(angles, sides, start)
+
+    # Frame of each face relative to its parent, then relative to the root
+    root = order[0]
+    frames = np.tile(np.eye(3), (F, 1, 1))
+    linked = parent >= 0
+    frames[linked] = child_frames[parent[linked], parent_side[linked]]
+    ancestor = np.where(linked, parent, root)
+    while (ancestor != root).any():
+        frames = np.matmul(frames[ancestor], frames)
+        ancestor = ancestor[ancestor]
+    corners = np.einsum("fij,fkj->fki", frames, local)
+
+    # Real life point of each corner: the point shared by the two sides of the quad at the corner
+    points = graphe.fan_labels()
+    vertices = np.array([face_sides for _, face_sides in faces], dtype=np.int64)
+    p0, p1 = points[graphe._vert.numpy("sub0")[vertices]], points[graphe._vert.numpy("sub1")[vertices]]
+    previous0, previous1 = np.roll(p0, 1, axis=1), np.roll(p1, 1, axis=1)
+    corner_points = np.where((p0 == previous0) | (p0 == previous1), p0, p1)
+    return Embedding(corners, corner_points)
@@ -0,0 +1,143 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Fans
+# The corners around a point of a paving being built form a chain (a fan), which has to become a node
+# (see possible_noeud) once the paving is finished. The chain can be finished iff some chain of corners of the
+# catalogue goes from the free side at its last end back to the free side at its first end, with the angle left:
+# only the two free sides and the angle left matter, not the corners already there.
+# The table of the (free sides, angle left) that can be finished is computed once per catalogue and kept on disk
+# --------------------------------------------------------- #
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+import Canonical as cn
+import Tolerance as tl
+from Transposition import catalogue_key
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pavings")
+
+
+class FanTable:
+    """ The fans that can be finished with the corners of a catalogue
+
+    A fan goes from its first subvertex to its last one along blue edges, each corner going from its right side
+    (cote_droite) to its left side (cote_gauche). completes(last side, first side, angle left) is True iff a chain
+    of corners goes from a side of the length of the last side to a side of the length of the first one,
+    with angles adding up to the angle left.
+    The side lengths are grouped in classes (equal for the tolerance policy), the angles are counted in units
+    of pi/denominator when they are all snapped (exact), else in steps of twice the angle tolerance"""
+
+    def __init__(self, quadrangles, tolerance=None, max_states=1 << 22):
+        self.tolerance = tol = tl.policy if tolerance is None else tolerance
+        quads = cn.unique_rotations(quadrangles)
+        angles = np.array([quad.angles for quad in quads], dtype=np.float64).ravel()
+        left = np.array([[quad.cote_gauche(j) for j in range(4)] for quad in quads], dtype=np.float64).ravel()
+        right = np.array([[quad.cote_droite(j) for j in range(4)] for quad in quads], dtype=np.float64).ravel()
+        self._classes(np.concatenate((left, right)))
+        units = tol.units(angles)
+        self.exact = units is not None
+        self._step = tol.unit if self.exact else 2 * tol.angle
+        self._completions = self._search(angles, units, [self.side(x) for x in left], [self.side(x) for x in right],
+                                         max_states)
+
+    def _classes(self, lengths):
+        """ Groups the lengths that are equal for the tolerance, the class of a length is found with a dict
+        of the length rounded to 2 * tolerance (the rounded values next to it are in the dict too)"""
+        tol = self.tolerance
+        self._width = 2 * tol.length
+        self._lookup = {}
+        values = np.unique(lengths)
+        n = -1
+        for k, value in enumerate(values):
+            if k == 0 or value - values[k - 1] > tol.length:
+                n += 1
+            q = int(np.rint(value / self._width))
+            for key in (q - 1, q, q + 1):
+                self._lookup.setdefault(key, n)
+        self.n_sides = n + 1
+
+    def side(self, length):
+        """ Class of a side length, None if no quad has a side of this length"""
+        return self._lookup.get(int(round(length / self._width)))
+
+    def _search(self, angles, units, left, right, max_states):
+        """ The codes of the (last side, first side, angle) that can be finished, breadth first from each side"""
+        tol = self.tolerance
+        S = self.n_sides
+        if self.exact:
+            values, limit, resolution = [int(u) for u in units], tol.turn, 1
+        else:
+            # Sums are kept in steps much smaller than the tolerance, so that the rounding errors do not add up
+            resolution = tol.angle / 64
+            values, limit = [int(round(a / resolution)) for a in angles], int((2 * np.pi + tol.angle) / resolution)
+        following = [[] for _ in range(S)] # corners that can follow a side: (side they end on, angle)
+        for value, r, l in zip(values, right, left):
+            following[r].append((l, value))
+        completions = set()
+        n_states = 0
+        for start in range(S):
+            layer = {(start, 0)}
+            seen = set()
+            while layer:
+                next_layer = set()
+                for side, total in layer:
+                    for end, value in following[side]:
+                        state = (end, total + value)
+                        if state[1] <= limit and state not in seen:
+                            seen.add(state)
+                            next_layer.add(state)
+                layer = next_layer
+            n_states += len(seen)
+            if n_states > max_states:
+                raise ValueError(f"more than {max_states} fan states, the catalogue is too large for a FanTable")
+            for end, total in seen:
+                if self.exact:
+                    completions.add(self._code(start, end, total))
+                else:
+                    q = int(round(total * resolution / self._step))
+                    completions.update(self._code(start, end, key) for key in (q - 1, q, q + 1))
+        return completions
+
+    def _code(self, last, first, key):
+        return (key * self.n_sides + last) * self.n_sides + first
+
+    def __len__(self):
+        return len(self._completions)
+
+    def completes(self, last_length, first_length, gap):
+        """ Whether a fan whose free sides have these lengths (at its last and first subvertices)
+        can be finished with corners adding up to the angle gap"""
+        last, first = self.side(last_length), self.side(first_length)
+        if last is None or first is None:
+            return False
+        return self._code(last, first, int(round(gap / self._step))) in self._completions
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+    @classmethod
+    def cached(cls, quadrangles, tolerance=None, cache_dir=CACHE_DIR):
+        """ The table of the catalogue, read from cache_dir if it was computed before, else computed and saved there
+        The file name is a digest of the quads (see Transposition.catalogue_key) and of the tolerance"""
+        tolerance = tl.policy if tolerance is None else tolerance
+        name = hashlib.blake2b(catalogue_key(quadrangles) + repr(tolerance).encode(), digest_size=16).hexdigest()
+        path = os.path.join(cache_dir, name + ".fans")
+        if os.path.exists(path):
+            return cls.load(path)
+        table = cls(quadrangles, tolerance)
+        os.makedirs(cache_dir, exist_ok=True)
+        table.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return table
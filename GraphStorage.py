@@ -0,0 +1,122 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Graph storage
+# The vertices, subvertices and edges of a PavingGraph are not stored as python objects
+# but as rows of preallocated columns (one column per attribute), a Vertex, SubVertex or Edge is only a view on a row
+# --------------------------------------------------------- #
+
+from array import array
+
+import numpy as np
+
+from IdPool import IdPool
+
+NONE = -1 # id stored in a column for None
+
+
+class Table:
+    """ Columns of one kind of object, object i is row i of every column
+
+    Columns are python arrays (typecode 'i' for ids, 'd' for lengths and angles, 'b' for small codes)
+    so that reading one value is fast, they can be read as numpy arrays with numpy().
+    The rows are given by an IdPool, the table has a 'used' column telling which rows are taken.
+    The capacity is doubled when a row beyond it is needed"""
+
+    def __init__(self, columns, capacity=64):
+        """ columns is a dict {name: (typecode, default value)}"""
+        self._defaults = dict(columns, used=("b", 0))
+        self._columns = {name: array(typecode, [default]) * capacity
+                         for name, (typecode, default) in self._defaults.items()}
+        self._capacity = capacity
+        self._pool = IdPool()
+
+    @property
+    def rows(self):
+        """ Rows from here on have never been used"""
+        return self._pool.high
+
+    def __len__(self):
+        return len(self._pool)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def column(self, name):
+        """ The column itself (not a copy), it is extended in place when the table grows"""
+        return self._columns[name]
+
+    def _grow(self):
+        while self._pool.high > self._capacity:
+            for name, (typecode, default) in self._defaults.items():
+                self._columns[name].extend(array(typecode, [default]) * self._capacity)
+            self._capacity *= 2
+
+    def allocate(self):
+        """ Takes the smallest free row, its values have to be written by the caller"""
+        row = self._pool.allocate()
+        if row >= self._capacity:
+            self._grow()
+        self._columns["used"][row] = 1
+        return row
+
+    def allocate_many(self, n):
+        """ Takes the n smallest free rows"""
+        rows = self._pool.allocate_many(n)
+        if self._pool.high > self._capacity:
+            self._grow()
+        used = self._columns["used"]
+        for row in rows:
+            used[row] = 1
+        return rows
+
+    def release(self, row):
+        """ Marks the row as free, the values of a row are all written again when it is taken"""
+        self._columns["used"][row] = 0
+        self._pool.release(row)
+
+    def release_many(self, rows):
+        """ Releases rows given in increasing order (as given by allocate_many)"""
+        used = self._columns["used"]
+        for row in rows:
+            used[row] = 0
+        self._pool.release_many(rows)
+
+    def reclaim(self, row):
+        """ Takes back a row that was released, with its values"""
+        self._pool.reclaim(row)
+        if row >= self._capacity:
+            self._grow()
+        self._columns["used"][row] = 1
+
+    def columns(self):
+        """ Names of the columns, 'used' included"""
+        return list(self._columns)
+
+    def typecode(self, name):
+        return self._columns[name].typecode
+
+    def restore(self, arrays):
+        """ Replaces the content of the table by the given arrays (one per column, of the same length)
+        The columns are modified in place, so that the columns given by column() stay valid"""
+        rows = len(arrays["used"])
+        capacity = self._capacity
+        while capacity < rows:
+            capacity *= 2
+        for name, (typecode, default) in self._defaults.items():
+            column = self._columns[name]
+            del column[:]
+            column.frombytes(np.ascontiguousarray(arrays[name], dtype=np.dtype(typecode)).tobytes())
+            column.extend(array(typecode, [default]) * (capacity - rows))
+        self._capacity = capacity
+        self._pool = IdPool.from_used(np.asarray(arrays["used"]).tolist())
+
+    def numpy(self, name):
+        """ A numpy copy of the column, for the rows used at least once"""
+        column = self._columns[name]
+        return np.frombuffer(column, dtype=np.dtype(column.typecode), count=self.rows).copy()
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self._columns.values())
@@ -0,0 +1,78 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Id pool
+# Gives the ids of the vertices, subvertices and edges of a PavingGraph,
+# the smallest free id is always given first so that the tables stay dense
+# --------------------------------------------------------- #
+
+import heapq
+
+
+class IdPool:
+    """ The ids that were never used are the ones from the high-water mark on,
+    the ids released below it are kept in a min-heap
+
+    allocate and release are O(log n), and O(1) when the last allocated id is released first
+    (which is what happens when a PavingGraph is rolled back)"""
+
+    def __init__(self):
+        self._free = [] # min-heap of the free ids below the high-water mark
+        self._high = 0 # ids from here on were never used
+
+    @classmethod
+    def from_used(cls, used):
+        """ The pool whose ids in use are the indices of the true values of used"""
+        pool = cls()
+        pool._high = len(used)
+        pool._free = [id for id, u in enumerate(used) if not u] # increasing, so already a heap
+        return pool
+
+    @property
+    def high(self):
+        return self._high
+
+    def __len__(self):
+        """ Number of ids in use"""
+        return self._high - len(self._free)
+
+    def allocate(self):
+        if self._free:
+            return heapq.heappop(self._free)
+        self._high += 1
+        return self._high - 1
+
+    def allocate_many(self, n):
+        """ The n smallest free ids, in increasing order"""
+        ids = []
+        while self._free and len(ids) < n:
+            ids.append(heapq.heappop(self._free))
+        start = self._high
+        self._high += n - len(ids)
+        ids.extend(range(start, self._high))
+        return ids
+
+    def release(self, id):
+        if id == self._high - 1:
+            self._high -= 1
+        else:
+            heapq.heappush(self._free, id)
+
+    def release_many(self, ids):
+        """ Releases ids given in increasing order, O(1) when they are the last ones allocated"""
+        if ids and ids[-1] == self._high - 1 and ids[-1] - ids[0] == len(ids) - 1:
+            self._high = ids[0]
+        else:
+            for id in reversed(ids):
+                self.release(id)
+
+    def reclaim(self, id):
+        """ Takes back a released id (to undo its release), in O(n)"""
+        if id >= self._high:
+            self._free.extend(range(self._high, id))
+            heapq.heapify(self._free)
+            self._high = id + 1
+        else:
+            self._free.remove(id)
+            heapq.heapify(self._free)
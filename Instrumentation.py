@@ -0,0 +1,137 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Instrumentation
+# Counters of a paving search: pavings extended at each depth, quads accepted and refused by add_quad (and why),
+# time spent in each stage of the search, area covered and branching factor.
+# A search without a Probe is not slowed down: the probe replaces the stages of the search by timed versions
+# when it is attached, nothing is counted otherwise
+# --------------------------------------------------------- #
+
+import json
+import time
+from collections import Counter
+
+import numpy as np
+
+
+class Probe:
+    """ Counters of a PavingSearch (given to it with probe=...)
+
+    nodes, placements: number of pavings extended and of (vertex, quad) pairs to try from them, by depth
+    accepted, rejects: quads added by add_quad, and reasons of the refusals ("length AB", "angle B"...)
+    times: seconds spent in each stage (placements, quad bound, add_quad, signature, paving bound, verify, copy)
+
+    callback(snapshot) is called every `every` seconds and at the end of the search,
+    the snapshot is also written to path (JSON) if given"""
+
+    def __init__(self, callback=None, every=1.0, path=None):
+        self.callback, self.every, self.path = callback, every, path
+        self.nodes = Counter()
+        self.placements = Counter()
+        self.accepted = 0
+        self.rejects = Counter()
+        self.times = Counter()
+        self.aire = 0.
+        self.max_aire = 0.
+        self._search = None
+        self._start = time.perf_counter()
+        self._next = self._start + every
+
+    def attach(self, search):
+        """ Replaces the stages of the search by timed versions"""
+        self._search = search
+        search.children = self.timed("placements", search.children)
+        search._signature = self.timed("signature", search._signature)
+        search._valid = self.timed("verify", search._valid)
+        search._result = self.timed("copy", search._result)
+        search._add_quad = self._timed_add_quad(search._add_quad)
+        if search._bounds is not None:
+            search._bounds.quad_ok = self.timed("quad bound", search._bounds.quad_ok)
+            search._bounds.paving_ok = self.timed("paving bound", search._bounds.paving_ok)
+
+    def watch(self, graphe):
+        """ Counts the reasons why add_quad refuses quads on this paving"""
+        graphe.rejects = self.rejects
+
+    def timed(self, stage, function):
+        times, clock = self.times, time.perf_counter
+
+        def timed_function(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                times[stage] += clock() - start
+        return timed_function
+
+    def _timed_add_quad(self, add_quad):
+        times, clock = self.times, time.perf_counter
+
+        def timed_add_quad(graphe, quad, vertex_id):
+            start = clock()
+            ok = add_quad(graphe, quad, vertex_id)
+            times["add_quad"] += clock() - start
+            self.accepted += ok
+            return ok
+        return timed_add_quad
+
+    def node(self, depth, n_placements, aire):
+        """ A paving with depth quads is extended, it has n_placements children to try"""
+        self.nodes[depth] += 1
+        self.placements[depth] += n_placements
+        self.aire = aire
+        self.max_aire = max(self.max_aire, aire)
+        if time.perf_counter() >= self._next:
+            self.report()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def branching(self):
+        """ Mean number of children tried, and of new pavings made, per paving extended"""
+        n = sum(self.nodes.values())
+        if n == 0:
+            return 0., 0.
+        explored = self._search.n_explored if self._search is not None else 0
+        return sum(self.placements.values()) / n, explored / n
+
+    def snapshot(self):
+        """ The counters as a dict that JSON can write"""
+        tried, made = self.branching()
+        search = self._search
+        return {"elapsed": self.elapsed,
+                "nodes": sum(self.nodes.values()),
+                "nodes by depth": {str(d): n for d, n in sorted(self.nodes.items())},
+                "branching by depth": {str(d): self.placements[d] / n for d, n in sorted(self.nodes.items())},
+                "branching": tried, "new pavings per node": made,
+                "explored": search.n_explored if search is not None else 0,
+                "results": search.n_results if search is not None else 0,
+                "accepted": self.accepted, "rejects": dict(self.rejects.most_common()),
+                "times": dict(self.times.most_common()),
+                "area": self.aire / (4 * np.pi), "max area": self.max_aire / (4 * np.pi),
+                "stats": dict(search.stats) if search is not None else {}}
+
+    def report(self):
+        """ Gives the snapshot to the callback and writes it to the file"""
+        self._next = time.perf_counter() + self.every
+        snapshot = self.snapshot()
+        if self.callback is not None:
+            self.callback(snapshot)
+        if self.path is not None:
+            self.save(self.path, snapshot)
+        return snapshot
+
+    def save(self, path, snapshot=None):
+        with open(path, "w") as file:
+            json.dump(self.snapshot() if snapshot is None else snapshot, file, indent=2)
+
+
+def show(snapshot):
+    """ A callback printing one line of progress"""
+    rejects = sum(snapshot["rejects"].values())
+    print(f"{snapshot['elapsed']:8.1f}s  {snapshot['nodes']} pavings extended, {snapshot['explored']} made, "
+          f"{snapshot['results']} found, area {snapshot['max area']:.0%} at most, "
+          f"add_quad {snapshot['accepted']} ok / {rejects} refused, branching {snapshot['branching']:.1f}")
@@ -0,0 +1,183 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Mesh
+# Writes pavings as quad meshes (binary PLY or OBJ) to look at them in a mesh viewer.
+# Each quad of a paving is placed on the sphere (see Embedding) and cut into resolution x resolution small quads
+# whose sides follow the great circles of its sides. The pavings are read one at a time from any iterable
+# (a PavingSearch, a PavingFile...) and the mesh is written in chunks, so the memory used does not grow
+# with the number of pavings
+# --------------------------------------------------------- #
+
+import os
+
+import numpy as np
+
+from Embedding import embed
+
+FORMATS = ("ply", "obj")
+
+# A face of the PLY file: 4 vertices, the number of the paving and of its quad in the paving
+_PLY_FACE = np.dtype([("n", "u1"), ("vertices", "<i4", (4,)), ("paving", "<i4"), ("quad", "<i4")])
+_PLY_COUNT = "{:>12d}" # the counts are written again when the file is closed, with the same width
+
+
+def slerp(p, q, t):
+    """ Points at the fractions t of the great circle arcs from p to q (unit vectors, the last axis of size 3)"""
+    cos_arc = np.clip(np.sum(p * q, axis=-1, keepdims=True), -1., 1.)
+    arc = np.arccos(cos_arc)
+    sin_arc = np.sin(arc)
+    small = sin_arc < 1e-9
+    safe = np.where(small, 1., sin_arc)
+    a = np.where(small, 1 - t, np.sin((1 - t) * arc) / safe)
+    b = np.where(small, t, np.sin(t * arc) / safe)
+    points = a * p + b * q
+    return points / np.linalg.norm(points, axis=-1, keepdims=True)
+
+
+def grid(corners, resolution):
+    """ The (resolution + 1) x (resolution + 1) points of each quad (F, 4, 3) -> (F, r + 1, r + 1, 3)
+
+    Point (i, j) is at the fraction j / r of the arc between the points at i / r of the sides AD and BC,
+    so the four sides of the grid are the arcs AB, BC, CD (from D) and DA (from A)"""
+    t = np.linspace(0., 1., resolution + 1)[:, None]
+    a, b, c, d = (corners[:, None, k] for k in range(4))
+    first, second = slerp(a, d, t), slerp(b, c, t) # (F, r + 1, 3)
+    return slerp(first[:, :, None], second[:, :, None], t[None, None])
+
+
+def _grid_faces(resolution):
+    """ The small quads of a grid, as indices of its points (r * r, 4), turning the same way as ABCD"""
+    n = resolution + 1
+    i, j = np.meshgrid(np.arange(resolution), np.arange(resolution), indexing="ij")
+    corner = (i * n + j).ravel()
+    return np.stack([corner, corner + 1, corner + n + 1, corner + n], axis=1)
+
+
+class MeshWriter:
+    """ A mesh file being written: write(graphe) adds a paving, close() finishes the file
+
+    path: .ply (binary, little endian) or .obj, or format given
+    resolution: number of small quads along each side of a quad
+    spacing: if not 0, paving k is moved to the cell k of a grid of columns columns with this spacing
+    chunk: number of vertices kept in memory before they are written
+
+    The vertices of the quads are not shared between neighbouring quads (the sides of a quad are exactly
+    on the great circles, the viewer may merge the vertices). PLY faces carry the number of their paving
+    and of their quad, OBJ faces are grouped by paving (o paving_k)"""
+
+    def __init__(self, path, resolution=4, format=None, spacing=0., columns=10, chunk=1 << 16):
+        self.path = path
+        self.format = (format or os.path.splitext(path)[1][1:]).lower()
+        if self.format not in FORMATS:
+            raise ValueError(f"unknown mesh format {self.format!r}, expected one of {FORMATS}")
+        if resolution < 1:
+            raise ValueError("resolution has to be at least 1")
+        self.resolution, self.spacing, self.columns = resolution, spacing, columns
+        self.chunk = max(chunk, (resolution + 1) ** 2)
+        self._local_faces = _grid_faces(resolution)
+        self.n_pavings = self.n_vertices = self.n_faces = 0
+        self._vertices, self._faces, self._buffered = [], [], 0
+        self._vertex_file = open(path, "wb")
+        if self.format == "ply":
+            # The faces are written to a second file, appended to the vertices when the counts are known
+            self._face_file = open(path + ".faces", "wb")
+            self._vertex_file.write(self._ply_header())
+        else:
+            self._face_file = None
+            self._vertex_file.write(b"# pavings of the sphere by quads\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _ply_header(self):
+        count = _PLY_COUNT.format
+        return ("ply\nformat binary_little_endian 1.0\ncomment pavings of the sphere by quads\n"
+                f"element vertex {count(self.n_vertices)}\n"
+                "property float x\nproperty float y\nproperty float z\n"
+                f"element face {count(self.n_faces)}\n"
+                "property list uchar int vertex_indices\nproperty int paving\nproperty int quad\n"
+                "end_header\n").encode()
+
+    def _offset(self, k):
+        if not self.spacing:
+            return np.zeros(3)
+        row, column = divmod(k, self.columns)
+        return np.array([column * self.spacing, -row * self.spacing, 0.])
+
+    def write(self, graphe):
+        """ Adds a paving (or a (paving, ...) pair as given by PavingSearch)"""
+        if isinstance(graphe, tuple):
+            graphe = graphe[0]
+        k = self.n_pavings
+        self.n_pavings += 1
+        corners = embed(graphe).corners
+        if self.format == "obj":
+            self._flush()
+            self._vertex_file.write(f"o paving_{k}\n".encode())
+        offset = self._offset(k)
+        per_quad = (self.resolution + 1) ** 2
+        block = max(1, self.chunk // per_quad)
+        for start in range(0, len(corners), block):
+            points = grid(corners[start:start + block], self.resolution) + offset
+            F = len(points)
+            faces = (self._local_faces[None] + (self.n_vertices + per_quad * np.arange(F))[:, None, None])
+            quads = np.repeat(np.arange(start, start + F), len(self._local_faces))
+            self._add(points.reshape(-1, 3), faces.reshape(-1, 4), k, quads)
+
+    def _add(self, vertices, faces, k, quads):
+        self.n_vertices += len(vertices)
+        self.n_faces += len(faces)
+        if self.format == "ply":
+            record = np.empty(len(faces), dtype=_PLY_FACE)
+            record["n"], record["vertices"], record["paving"], record["quad"] = 4, faces, k, quads
+            faces = record
+        self._vertices.append(vertices)
+        self._faces.append(faces)
+        self._buffered += len(vertices)
+        if self._buffered >= self.chunk:
+            self._flush()
+
+    def _flush(self):
+        if not self._vertices:
+            return
+        vertices, faces = np.concatenate(self._vertices), np.concatenate(self._faces)
+        self._vertices, self._faces, self._buffered = [], [], 0
+        if self.format == "ply":
+            self._vertex_file.write(vertices.astype("<f4").tobytes())
+            self._face_file.write(faces.tobytes())
+        else:
+            np.savetxt(self._vertex_file, vertices, fmt="v %.7f %.7f %.7f")
+            np.savetxt(self._vertex_file, faces + 1, fmt="f %d %d %d %d")
+
+    def close(self):
+        if self._vertex_file.closed:
+            return
+        self._flush()
+        if self.format == "ply":
+            self._face_file.close()
+            with open(self._face_file.name, "rb") as faces:
+                while True:
+                    data = faces.read(1 << 24)
+                    if not data:
+                        break
+                    self._vertex_file.write(data)
+            os.remove(self._face_file.name)
+            self._vertex_file.seek(0)
+            self._vertex_file.write(self._ply_header())
+        self._vertex_file.close()
+
+
+def export(pavings, path, resolution=4, format=None, spacing=0., columns=10, chunk=1 << 16, limit=None):
+    """ Writes the pavings of an iterable (pavings or (paving, ...) pairs) to a mesh file, see MeshWriter
+    Only the first limit pavings are written if limit is given. Returns (pavings, vertices, faces) written"""
+    with MeshWriter(path, resolution, format, spacing, columns, chunk) as writer:
+        for graphe in pavings:
+            if limit is not None and writer.n_pavings >= limit:
+                break
+            writer.write(graphe)
+    return writer.n_pavings, writer.n_vertices, writer.n_faces
@@ -0,0 +1,134 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Node enumeration
+# A node is a cyclic chain of quad corners around one point of the paving,
+# the angles of the corners add up to 2pi and two consecutive corners share a side length.
+# Here all the partial nodes are extended at once with numpy arrays, and pruned as soon as possible
+# --------------------------------------------------------- #
+
+import numpy as np
+
+import Canonical as cn
+import Quadrangle as qd
+import Tolerance as tl
+
+ANGLES = ["alpha", "beta", "gamma", "delta"]
+
+
+class CornerCatalogue:
+    """The oriented corners of a list of quads, stored in arrays
+
+    The corner `4*i + j` is the corner ANGLES[j] of the i th quad,
+    its left side is quad.cote_gauche(ANGLES[j]) and its right side is quad.cote_droite(ANGLES[j]).
+    Two sides match when their lengths are equal for the tolerance policy, units are the angles in units
+    of pi/denominator (None if one of them is not snapped, see Tolerance)"""
+
+    def __init__(self, liste_quad, tolerance=None):
+        self._quads = list(liste_quad)
+        self.tolerance = tol = tl.policy if tolerance is None else tolerance
+        batch = qd.QuadBatch.from_quads(self._quads)
+        self._angles = batch.angles.ravel()
+        self._units = tol.units(self._angles)
+        self._left = batch.sides.ravel()
+        self._right = np.column_stack([batch.right_side(j) for j in range(4)]).reshape(-1)
+
+        # Same key for the same corner of the original quad, whatever the rotation of the quad in the list
+        numbers = {}
+        self._keys = np.array([numbers.setdefault(cn.corner_key(quad, angle), len(numbers))
+                               for quad in self._quads for angle in ANGLES], dtype=np.int64)
+
+        # Successors of each corner (corners whose left side is the right side of this one), in CSR form
+        compat = np.abs(self._right[:, None] - self._left[None, :]) <= tol.length
+        self._succ_ptr = np.concatenate(([0], np.cumsum(compat.sum(axis=1))))
+        self._succ = np.nonzero(compat)[1]
+
+    @property
+    def quads(self):
+        return self._quads
+
+    @property
+    def angles(self):
+        return self._angles
+
+    @property
+    def units(self):
+        return self._units
+
+    @property
+    def left(self):
+        return self._left
+
+    @property
+    def right(self):
+        return self._right
+
+    @property
+    def keys(self):
+        return self._keys
+
+    def __len__(self):
+        return len(self._angles)
+
+    def corner(self, code):
+        """The [quad, angle] pair of a corner code"""
+        return [self._quads[code // 4], ANGLES[code % 4]]
+
+    def to_nodes(self, codes):
+        """Converts an array of corner codes (one node per row) to the list format of possible_noeud"""
+        return [[self.corner(int(code)) for code in row] for row in codes]
+
+    def successors(self, last):
+        """For an array of corner codes, returns (rows, next_codes) listing every compatible next corner"""
+        start = self._succ_ptr[last]
+        counts = self._succ_ptr[last + 1] - start
+        rows = np.repeat(np.arange(len(last)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, self._succ[np.repeat(start, counts) + offsets]
+
+
+def enumerate_nodes(liste_quad, valence, chunk=1 << 18, unique=False, reflexion=False):
+    """Returns all the nodes of a given valence as an (M, valence) array of corner codes (see CornerCatalogue)
+
+    A partial node is dropped as soon as its angles cannot add up to 2pi with the corners left to add,
+    or as soon as two consecutive sides do not match (for the tolerance of the catalogue).
+    When all the angles are snapped, the angles are added in integer units and have to add up to 2pi exactly.
+    `chunk` bounds the number of partial nodes extended at once, to bound the memory used.
+    With unique=True, each node is given once instead of once per rotation of its chain (see Canonical)"""
+    cat = liste_quad if isinstance(liste_quad, CornerCatalogue) else CornerCatalogue(liste_quad)
+    if valence < 1 or len(cat) == 0:
+        return np.zeros((0, max(valence, 0)), dtype=np.int64)
+    tol = cat.tolerance
+    if cat.units is not None:
+        ang, turn, eps = cat.units, tol.turn, 0
+    else:
+        ang, turn, eps = cat.angles, 2 * np.pi, tol.angle
+    min_ang, max_ang = ang.min(), ang.max()
+
+    def feasible(sums, remaining):
+        return (sums + remaining * min_ang <= turn + eps) & (sums + remaining * max_ang >= turn - eps)
+
+    codes = np.arange(len(cat))
+    keep = feasible(ang, valence - 1)
+    nodes, sums = codes[keep, None], ang[keep]
+
+    for k in range(1, valence):
+        new_nodes, new_sums = [], []
+        for i in range(0, len(nodes), chunk):
+            part, part_sums = nodes[i:i + chunk], sums[i:i + chunk]
+            rows, nxt = cat.successors(part[:, -1])
+            s = part_sums[rows] + ang[nxt]
+            keep = feasible(s, valence - 1 - k)
+            new_nodes.append(np.column_stack((part[rows[keep]], nxt[keep])))
+            new_sums.append(s[keep])
+        if not new_nodes:
+            return np.zeros((0, valence), dtype=np.int64)
+        nodes, sums = np.concatenate(new_nodes), np.concatenate(new_sums)
+
+    # The node has to close: the right side of the last corner is the left side of the first one
+    closed = (np.abs(sums - turn) <= eps) & (np.abs(cat.right[nodes[:, -1]] - cat.left[nodes[:, 0]]) <= tol.length)
+    nodes = nodes[closed]
+    if unique:
+        nodes = nodes[cn.canonical_rows(cat.keys[nodes], reflexion)]
+    return nodes
@@ -0,0 +1,153 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Parallel search
+# The search tree of construction_graphe is cut at a given depth, each subtree is an independent subproblem
+# (a pickled paving and the quads) explored by a process of a pool.
+# A subproblem that takes too long gives back what it has not explored yet, so that idle processes can take it
+# --------------------------------------------------------- #
+
+import heapq
+import pickle
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import Canonical as cn
+import PavingGraph as pg
+from Bounds import Bounds
+from PavingSearch import PavingSearch
+from Scheduler import Scheduler, policy_for
+
+
+def is_solution(graphe, aire, seuil):
+    """ The paving is closed, or covers more than seuil (as in PavingSearch)"""
+    return aire > seuil or not graphe.exterior_vertices()
+
+
+def explore(task):
+    """ Depth first search of one subproblem (see PavingSearch), run by a process of the pool
+
+    task = (key, pickled paving, area, first child to try, options)
+    The search stops after options["budget"] new pavings and then returns what is left as new subproblems.
+    Returns (solutions, subproblems, stats of the bounds), a solution being (key, signature, pickled paving)"""
+    key, data, aire, start, options = task
+    reflexion = options["reflexion"]
+    search = PavingSearch(options["quadrangles"], frontier=[(key, data, aire, start)], seuil=options["seuil"],
+                          max_depth=options["max_depth"], reflexion=reflexion, bound=options["bound"],
+                          budget=options["budget"], stop_key=options["best"], policy=options["policy"])
+    solutions = []
+    for graphe, complete in search:
+        solutions.append((search.last_key, cn.graph_signature(graphe, reflexion), pickle.dumps(graphe)))
+        if options["first_only"]:
+            search.stop_key = search.last_key # Everything left comes after this solution
+    return solutions, search.frontier(), Counter(search.stats)
+
+
+def split(quadrangles, graphe, aire, depth, seuil, max_depth, reflexion=False, bounds=None, policy=None):
+    """ Breadth first search from the root down to the given depth, each paving is kept once (see Canonical)
+    Returns the solutions found on the way and the subproblems (key, pickled paving, area, 0),
+    the keys are the ones of PavingSearch with the same policy (see Scheduler.policy_for)"""
+    scheduler = Scheduler(quadrangles, policy_for(policy, seuil))
+    level = [((), graphe, aire)]
+    seen = {cn.graph_signature(graphe, reflexion)}
+    solutions = []
+    for _ in range(depth):
+        next_level = []
+        for key, g, g_aire in level:
+            for i, (vertex_id, quad) in enumerate(scheduler.placements(g)):
+                if bounds is not None and not bounds.quad_ok(g, g_aire, vertex_id, quad):
+                    continue
+                checkpoint = g.checkpoint()
+                if g.add_quad(quad, vertex_id):
+                    signature = cn.graph_signature(g, reflexion)
+                    child_aire = g_aire + quad.area()
+                    if signature not in seen:
+                        seen.add(signature)
+                        child = pg.PavingGraph()
+                        child.copy(g)
+                        if is_solution(child, child_aire, seuil):
+                            solutions.append((key + (i,), signature, pickle.dumps(child)))
+                        elif ((bounds is None or bounds.paving_ok(child, child_aire)) and
+                              (max_depth is None or len(child._faces) < max_depth)):
+                            next_level.append((key + (i,), child, child_aire))
+                g.rollback(checkpoint)
+        level = next_level
+    return solutions, [(key, pickle.dumps(g), g_aire, 0) for key, g, g_aire in level]
+
+
+def parallel_search(quadrangles, quad_init, split_depth=2, workers=None, first_only=True, budget=2000,
+                    seuil=0.80*4*np.pi, max_depth=None, reflexion=False, bound=True, stats=None,
+                    policy=None):
+    """ Search of pavings with the given quads, starting from quad_init, on a pool of processes
+
+    The search tree is cut at split_depth, the subtrees are explored by the processes of the pool
+    (smallest keys first), a subtree explored for more than budget pavings is cut again.
+    first_only: returns the first solution in the order of construction_graphe, the subproblems that come
+    after the best solution found so far are cancelled.
+    Otherwise every solution is returned once, sorted by signature.
+    The result does not depend on the number of workers (workers=0 runs everything in this process)
+    bound, policy: see PavingSearch, the statistics of the bounds are added to the Counter stats if it is given"""
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(quad_init)
+    policy = policy_for(policy, seuil)
+    options = {"quadrangles": list(quadrangles), "seuil": seuil, "max_depth": max_depth,
+               "budget": budget, "first_only": first_only, "best": None, "reflexion": reflexion, "bound": bound,
+               "policy": policy}
+    bounds = Bounds(quadrangles, seuil=seuil) if bound else None
+    solutions, subproblems = split(quadrangles, graphe, graphe.area(), split_depth, seuil, max_depth, reflexion,
+                                   bounds, policy)
+    if stats is not None and bounds is not None:
+        stats.update(bounds.stats)
+    # Heap of the subproblems, ordered by the first key they cover
+    pending = [(subproblem[0] + (subproblem[3],), subproblem) for subproblem in subproblems]
+    heapq.heapify(pending)
+
+    def best_key():
+        return min(solutions)[0] if first_only and solutions else None
+
+    def collect(result):
+        found, left, counts = result
+        solutions.extend(found)
+        if stats is not None:
+            stats.update(counts)
+        best = best_key()
+        for subproblem in left:
+            if best is None or subproblem[0] < best:
+                heapq.heappush(pending, (subproblem[0] + (subproblem[3],), subproblem))
+
+    if workers == 0:
+        while pending:
+            key, data, aire, start = heapq.heappop(pending)[1]
+            if best_key() is None or key < best_key():
+                collect(explore((key, data, aire, start, dict(options, best=best_key()))))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            n_workers = executor._max_workers
+            running = {}
+            while pending or running:
+                while pending and len(running) < 2 * n_workers:
+                    key, data, aire, start = heapq.heappop(pending)[1]
+                    if best_key() is None or key < best_key():
+                        task = (key, data, aire, start, dict(options, best=best_key()))
+                        running[executor.submit(explore, task)] = key
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    collect(future.result())
+                best = best_key()
+                if best is not None:
+                    for future, key in list(running.items()):
+                        if key > best and future.cancel():
+                            del running[future]
+
+    if first_only:
+        return [pickle.loads(min(solutions)[2])] if solutions else []
+    unique = {}
+    for key, signature, data in sorted(solutions):
+        unique.setdefault(signature, data)
+    return [pickle.loads(unique[signature]) for signature in sorted(unique)]
@@ -9,11 +9,34 @@
 # Red ones that join points that adjacent in our paving (connected)
 # --------------------------------------------------------- #
 
-import Quadrangle as qd
+from copy import deepcopy
+
+import Canonical as cn
+import GraphStorage as gs
+import NodeEnumeration as ne
+import Tolerance as tl
 import numpy as np
 
+try:
+    import scipy.sparse as sp
+    from scipy.sparse import csgraph
+except ImportError:
+    sp = None
+
 pi = np.pi
-eps = 1e-4
+
+NONE = gs.NONE
+RED, BLUE = 0, 1
+COLORS = ["red", "blue"]
+
+
+def _id(obj):
+    """ The id of a Vertex, SubVertex or Edge, or the id itself"""
+    return obj.id if isinstance(obj, (Vertex, SubVertex, Edge)) else obj
+
+
+def _or_none(id):
+    return None if id == NONE else id
 
 
 class Vertex:
@@ -23,13 +46,24 @@ class Vertex:
     then the subvertices should be in the clockwise order for the quad it is a part of.
         If it is on the inside (Used by two quads) then subvertices are in the clockwise order for the oldest one
     and the anticlockwise order for the new one,
-    but it should be okay because we can't 'build' anything in this edge anymore"""
-    def __init__(self, sub_vertex1, sub_vertex2, length, id=None):
-        """ The id will be used to get the position of the Vertex in the Vertex list"""
+    but it should be okay because we can't 'build' anything in this edge anymore
+
+    The vertex is stored in the columns of its graph, this object is only a view on them"""
+    __slots__ = ("_graph", "_id")
+
+    def __init__(self, graph, id):
+        """ The id is the row of the Vertex in the vertex table of the graph"""
+        self._graph = graph
         self._id = id
-        self._points = [sub_vertex1, sub_vertex2]
-        self._length = length # == an angle on the sphere
-        self._inside_edge = Edge(self, self, sub_vertex1, sub_vertex2, length, "blue")
+
+    def __eq__(self, other):
+        return type(other) is Vertex and other._graph is self._graph and other._id == self._id
+
+    def __hash__(self):
+        return hash(("vertex", self._id))
+
+    def __repr__(self):
+        return f"Vertex({self._id})"
 
     @property
     def id(self):
@@ -37,34 +71,39 @@ class Vertex:
 
     @property
     def points(self):
-        return self._points
+        g = self._graph
+        return [SubVertex(g, g._v_sub0[self._id]), SubVertex(g, g._v_sub1[self._id])]
 
     @property
-    def inside_edge(self):
-        return self._inside_edge
+    def length(self):
+        return self._graph._v_length[self._id] # == an angle on the sphere
 
-    def set_id(self, id):
-        self._id = id
-        for sub_v in self._points:
-            sub_v.set_parent_id(id)
-
-    def set_inside_edge(self, edge):
-        self._inside_edge = edge
+    @property
+    def inside_edge(self):
+        return Edge(self._graph, self._graph._v_edge[self._id])
 
 
 class SubVertex:
-    """ A subVertex is a point of a quadrangle on the Sphere Paving"""
+    """ A subVertex is a point of a quadrangle on the Sphere Paving
+
+    A subvertex can represent the same vertex in "real life" ('A' for instance),
+    A subvetex representing A is connected to another subvertex by a blue edge iff this one also represents A
+    The subvertex is stored in the columns of its graph, this object is only a view on them"""
+    __slots__ = ("_graph", "_id")
 
-    def __init__(self, parent_id=None, in_edge_id=None, out_edge_id=None, neighbour_edge_id=None, id=None):
+    def __init__(self, graph, id):
         """ A SubVertex may be part of multiple vertices, to recognize a SubVertex we use its id"""
-        self._parent_id = parent_id #id of the vertex it is in
-        self._in_edge_id = in_edge_id #id of the edge that goes from another subvertex to this one
-        self._out_edge_id = out_edge_id #id of the edge that goes from this vertex to another
-        self._neighbour_edge_id = neighbour_edge_id #id of the blue edge that goes to this neighbour
-        #self._node_id = node_id
-        self._id = id #Name of this subvertex, unique
-        #A subvertex can represent the same vertex in "real life" ('A' for instance),
-        #A subvetex representing A is connected to another subvertex by a red edge iff this one also represents A
+        self._graph = graph
+        self._id = id
+
+    def __eq__(self, other):
+        return type(other) is SubVertex and other._graph is self._graph and other._id == self._id
+
+    def __hash__(self):
+        return hash(("subvertex", self._id))
+
+    def __repr__(self):
+        return f"SubVertex({self._id})"
 
     @property
     def id(self):
@@ -72,52 +111,52 @@ class SubVertex:
 
     @property
     def neighbour_edge_id(self):
-        return self._neighbour_edge_id
+        return _or_none(self._graph._s_neighbour[self._id]) #id of the red edge that goes to this neighbour
 
     @property
     def in_edge_id(self):
-        if self._out_edge_id is None:
-            return -1
-        else:
-            return self._in_edge_id
+        return _or_none(self._graph._s_in[self._id]) #id of the blue edge that goes from another subvertex to this one
 
     @property
     def out_edge_id(self):
-        if self._out_edge_id is None:
-            return -1
-        else:
-            return self._out_edge_id
+        return _or_none(self._graph._s_out[self._id]) #id of the blue edge that goes from this vertex to another
 
     @property
     def parent_id(self):
-        return self.parent_id
-
-    def set_id(self, id):
-        self._id = id
+        return _or_none(self._graph._s_parent[self._id]) #id of the vertex it is in
 
     def set_neighbour_edge_id(self, id):
-        self._neighbour_edge_id = id
+        self._graph._s_neighbour[self._id] = NONE if id is None else id
 
     def set_parent_id(self, id):
-        self._parent_id = id
+        self._graph._s_parent[self._id] = NONE if id is None else id
 
     def set_in_edge_id(self, id):
-        self._in_edge_id = id
+        self._graph._s_in[self._id] = NONE if id is None else id
 
     def set_out_edge_id(self, id):
-        self._out_edge_id = id
+        self._graph._s_out[self._id] = NONE if id is None else id
+
 
 class Edge:
-    """An Edge here corresponds to the connection of two edges on the sphere, it's weight is the angle between them """
+    """An Edge here corresponds to the connection of two edges on the sphere, it's weight is the angle between them
+
+    The edge is stored in the columns of its graph, this object is only a view on them"""
+    __slots__ = ("_graph", "_id")
 
-    def __init__(self, vertex1, vertex2, subvertex1, subvertex2, angle, color, id=None):
-        """ The id will be used to get the position of the Vertex in the Vertex list"""
+    def __init__(self, graph, id):
+        """ The id is the row of the Edge in the edge table of the graph"""
+        self._graph = graph
         self._id = id
-        self._vertices = [vertex1, vertex2]
-        self._subvertices = [subvertex1, subvertex2] #The first one is the one this edge originates from,
-                                                    # the second is the destination
-        self._weight = angle
-        self._color = color
+
+    def __eq__(self, other):
+        return type(other) is Edge and other._graph is self._graph and other._id == self._id
+
+    def __hash__(self):
+        return hash(("edge", self._id))
+
+    def __repr__(self):
+        return f"Edge({self._id})"
 
     @property
     def id(self):
@@ -125,295 +164,598 @@ class Edge:
 
     @property
     def vertices(self):
-        return self._vertices
+        g = self._graph
+        return [Vertex(g, g._e_vert0[self._id]), Vertex(g, g._e_vert1[self._id])]
 
     @property
     def subvertices(self):
-        return self._subvertices
+        """The first one is the one this edge originates from, the second is the destination"""
+        g = self._graph
+        return [SubVertex(g, g._e_sub0[self._id]), SubVertex(g, g._e_sub1[self._id])]
 
     @property
     def weight(self):
-        return self._weight
+        return self._graph._e_weight[self._id]
 
     @property
     def color(self):
-        return self._color
+        return COLORS[self._graph._e_color[self._id]]
 
     def set_color(self, color):
-        self._color = color
-
-    def set_id(self, id):
-        out_subv, in_subv = self._subvertices[0], self._subvertices[1]
-        if self._color == "red":
-            out_subv.set_out_edge_id(id)
-            in_subv.set_in_edge_id(id)
-        elif self._color == "blue":
-            out_subv.set_neighbour_edge_id(id)
-            in_subv.set_neighbour_edge_id(id)
-        self._id = id
+        self._graph._e_color[self._id] = COLORS.index(color)
+
 
 class PavingGraph:
     """ A paving graph should be able to entirely represent a Paving and should be able to represent the addition/
-    substraction of a quadrangle to the paving """
-
-    def __init__(self, vertices, edges):
-        """ Vertices is a list of all the vertices
-            Edges is a list of edges (of the shape [[v1, v2], weight, id])"""
-        self._vertices = vertices
-        self._subvertices = []
-        self._edges = edges
-        self._used_vert_ids = {}
-        self._next_vert_id = 0
-        self._used_subv_ids = {}
-        self._next_subv_id = 0
-        self._used_edge_ids = {}
-        self._next_edge_id = 0
-
-
-        for vertex in self._vertices:
-            self._subvertices.append(vertex.points[0])
-            self._subvertices.append(vertex.points[1])
-            vertex.set_id(self._next_vert_id)
-            self._used_vert_ids[self._next_vert_id] = True
-            self._next_vert_id += 1
-            self._edges.append(vertex.inside_edge)
-
-        for edge in self._edges:
-            edge.set_id(self._next_edge_id)
-            self._used_edge_ids[self._next_edge_id] = True
-            self._next_edge_id += 1
-
-        for sv in self._subvertices:
-            sv.set_id(self._next_subv_id)
-            self._used_subv_ids[self._next_subv_id] = True
-            self._next_subv_id += 1
-
+    substraction of a quadrangle to the paving
+
+    The vertices, subvertices and edges are rows of three tables of columns (see GraphStorage),
+    Vertex, SubVertex and Edge objects are views on these rows. A row whose 'used' flag is 0 is free
+
+    The subvertices of a real life point form a chain of blue edges (its fan), each chain is represented
+    by one of its subvertices which keeps the first and last subvertices of the chain, their number,
+    the sum of the angles and whether the fan is closed. This is updated when blue edges are added (or rolled back)"""
+
+    rejects = None # Counter of the reasons why add_quad refused quads, when they are counted (see Instrumentation)
+    fans = None # FanTable of the catalogue: add_quad then refuses the quads leaving a fan that cannot be finished
+
+    def __init__(self, capacity=64, validate=False):
+        """ capacity is the number of vertices preallocated (twice as many subvertices and edges)
+        With validate=True, every fan lookup is checked against a walk along the chain"""
+        self._validate = validate
+        self._vert = gs.Table({"sub0": ("i", NONE), "sub1": ("i", NONE),
+                               "edge": ("i", NONE), "length": ("d", 0.)}, capacity)
+        self._subv = gs.Table({"parent": ("i", NONE), "in_edge": ("i", NONE),
+                               "out_edge": ("i", NONE), "neighbour": ("i", NONE),
+                               "point": ("i", NONE), "first": ("i", NONE), "last": ("i", NONE),
+                               "size": ("i", 0), "angle": ("d", 0.), "closed": ("b", 0)}, 2 * capacity)
+        self._edge = gs.Table({"vert0": ("i", NONE), "vert1": ("i", NONE),
+                               "sub0": ("i", NONE), "sub1": ("i", NONE),
+                               "weight": ("d", 0.), "color": ("b", RED)}, 2 * capacity)
+        self._faces = [] # [quad, [id of AB, BC, CD, DA]] for each quad of the paving, quad being rotated so that AB is its side a
+        self._journal = [] # Undo log of the changes made to the graph, see checkpoint and rollback
+
+        # Short names for the columns (they are extended in place, so they stay valid)
+        self._v_used, self._v_sub0, self._v_sub1, self._v_edge, self._v_length = \
+            (self._vert.column(name) for name in ["used", "sub0", "sub1", "edge", "length"])
+        self._s_used, self._s_parent, self._s_in, self._s_out, self._s_neighbour = \
+            (self._subv.column(name) for name in ["used", "parent", "in_edge", "out_edge", "neighbour"])
+        self._s_point, self._s_first, self._s_last, self._s_size, self._s_angle, self._s_closed = \
+            (self._subv.column(name) for name in ["point", "first", "last", "size", "angle", "closed"])
+        self._e_used, self._e_vert0, self._e_vert1, self._e_sub0, self._e_sub1, self._e_weight, self._e_color = \
+            (self._edge.column(name) for name in ["used", "vert0", "vert1", "sub0", "sub1", "weight", "color"])
+
+    def __getstate__(self):
+        """ The undo log is not pickled (nor copied), it refers to the columns of this graph only
+        (nor are the counts of rejects and the fan table)"""
+        return {key: value for key, value in self.__dict__.items() if key not in ("_journal", "rejects", "fans")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._journal = []
 
     def copy(self, graphe):
-        self._vertices = graphe._vertices
-        self._subvertices = graphe._subvertices
-        self._edges = graphe._edges
-        self._used_vert_ids = graphe._used_vert_ids
-        self._next_vert_id = graphe._next_vert_id
-        self._used_subv_ids = graphe._used_subv_ids
-        self._next_subv_id = graphe._next_subv_id
-        self._used_edge_ids = graphe._used_edge_ids
-        self._next_edge_id = graphe._next_edge_id
-
-    def add_subvertex(self, subv):
-        """ Adds a subvertex and updates the subvertex registry"""
-        if self._next_subv_id >= len(self._subvertices):
-            self._subvertices.append(subv)
+        """ Makes this graph an independent copy of graphe (the quads are shared, they are never modified)
+        The copy starts with an empty undo log"""
+        memo = {id(face[0]): face[0] for face in graphe._faces}
+        self.__setstate__(deepcopy(graphe.__getstate__(), memo))
+
+    def checkpoint(self):
+        """ Returns a mark of the current state of the graph, to come back to it with rollback"""
+        return len(self._journal)
+
+    def rollback(self, checkpoint=0):
+        """ Undoes every change made since the checkpoint, in O(number of changes)"""
+        journal = self._journal
+        for entry in reversed(journal[checkpoint:]):
+            if len(entry) == 3: # a value written in a column: (column, row, old value)
+                entry[0][entry[1]] = entry[2]
+            else:
+                self._undo(entry)
+        del journal[checkpoint:]
+
+    def clear_journal(self):
+        """ Forgets the undo log: the current state can no longer be rolled back"""
+        self._journal = []
+
+    def _undo(self, entry):
+        kind = entry[0]
+        if kind == "face":
+            self._faces.pop()
+        elif kind == "fan":
+            _, point, first, last, size, angle, closed = entry
+            self._s_first[point], self._s_last[point], self._s_size[point] = first, last, size
+            self._s_angle[point], self._s_closed[point] = angle, closed
+        elif kind == "removed vertex":
+            self._vert.reclaim(entry[1])
         else:
-            self._subvertices[self._next_subv_id] = subv
-        subv.set_id(self._next_subv_id)
-        self._used_subv_ids[self._next_subv_id] = True
-        self._next_subv_id += 1
-        while self._used_subv_ids.get(self._next_subv_id, default=False):
-            self._next_vert_id += 1
-
-    def add_vertex(self, vertex):
-        """ Adds a vertex, at the end of the list of vertices is complete or in the middle if the list is sparse"""
-        if self._next_vert_id >= len(self._vertices):
-            self._vertices.append(vertex)
+            table, rows = entry # rows taken from a table
+            table.release_many(rows)
+
+    def vertex(self, id):
+        return Vertex(self, id)
+
+    def subvertex(self, id):
+        return SubVertex(self, id)
+
+    def edge(self, id):
+        return Edge(self, id)
+
+    @property
+    def vertices(self):
+        return [Vertex(self, id) for id in range(self._vert.rows) if self._v_used[id]]
+
+    @property
+    def subvertices(self):
+        return [SubVertex(self, id) for id in range(self._subv.rows) if self._s_used[id]]
+
+    @property
+    def edges(self):
+        return [Edge(self, id) for id in range(self._edge.rows) if self._e_used[id]]
+
+    def nbytes(self):
+        """ Memory used by the tables of the graph"""
+        return self._vert.nbytes() + self._subv.nbytes() + self._edge.nbytes()
+
+    def _set_subvertex(self, id):
+        self._s_parent[id] = self._s_in[id] = self._s_out[id] = self._s_neighbour[id] = NONE
+        # A new subvertex is alone in its chain
+        self._s_point[id] = self._s_first[id] = self._s_last[id] = id
+        self._s_size[id] = 1
+        self._s_angle[id] = 0.
+        self._s_closed[id] = 0
+
+    def _write(self, column, row, value):
+        """ Writes a value in a column, and records the old one in the undo log"""
+        self._journal.append((column, row, column[row]))
+        column[row] = value
+
+    def _join_fans(self, sub0, sub1, weight):
+        """ Updates the fans when a blue edge of weight goes from sub0 (end of its chain) to sub1 (start of its chain)"""
+        s_point, s_first, s_last, s_size, s_angle = self._s_point, self._s_first, self._s_last, self._s_size, self._s_angle
+        p0, p1 = s_point[sub0], s_point[sub1]
+        if p0 == p1: # The fan is closed
+            self._save_fan(p0)
+            s_angle[p0] += weight
+            self._s_closed[p0] = 1
+            return
+        first, last = s_first[p0], s_last[p1]
+        angle = s_angle[p0] + weight + s_angle[p1]
+        size = s_size[p0] + s_size[p1]
+        keep, gone = (p0, p1) if s_size[p0] >= s_size[p1] else (p1, p0)
+        subv = s_first[gone]
+        while True:
+            self._write(s_point, subv, keep)
+            if subv == s_last[gone]:
+                break
+            subv = self._e_sub1[self._s_out[subv]]
+        self._save_fan(keep)
+        s_first[keep], s_last[keep], s_angle[keep], s_size[keep] = first, last, angle, size
+
+    def _save_fan(self, point):
+        """ Records the fan of a point in the undo log before it is modified"""
+        self._journal.append(("fan", point, self._s_first[point], self._s_last[point],
+                              self._s_size[point], self._s_angle[point], self._s_closed[point]))
+
+    def _set_vertex(self, id, sub0, sub1, length, edge=NONE):
+        self._v_sub0[id] = sub0
+        self._v_sub1[id] = sub1
+        self._v_length[id] = length
+        self._v_edge[id] = edge
+        self._s_parent[sub0] = id
+        self._s_parent[sub1] = id
+
+    def _set_edge(self, id, sub0, sub1, weight, color, vert0, vert1):
+        """ A blue edge becomes the out edge of sub0 and the in edge of sub1, a red edge their neighbour edge"""
+        journal = self._journal
+        self._e_vert0[id] = vert0
+        self._e_vert1[id] = vert1
+        self._e_sub0[id] = sub0
+        self._e_sub1[id] = sub1
+        self._e_weight[id] = weight
+        self._e_color[id] = color
+        if color == BLUE:
+            self._join_fans(sub0, sub1, weight)
+            s_out, s_in = self._s_out, self._s_in
+            journal.append((s_out, sub0, s_out[sub0]))
+            journal.append((s_in, sub1, s_in[sub1]))
+            s_out[sub0] = id
+            s_in[sub1] = id
         else:
-            self._vertices[self._next_vert_id] = vertex
-        vertex.set_id(self._next_vert_id)
-        self._used_vert_ids[self._next_vert_id] = True
-        self._next_vert_id += 1
-        while self._used_vert_ids.get(self._next_vert_id, default=False):
-            self._next_vert_id += 1
+            s_neighbour = self._s_neighbour
+            journal.append((s_neighbour, sub0, s_neighbour[sub0]))
+            journal.append((s_neighbour, sub1, s_neighbour[sub1]))
+            s_neighbour[sub0] = id
+            s_neighbour[sub1] = id
+
+    def add_subvertex(self):
+        """ Adds a subvertex with the smallest free id, returns its id"""
+        id = self._subv.allocate()
+        self._journal.append((self._subv, [id]))
+        self._set_subvertex(id)
+        return id
+
+    def add_vertex(self, sub0, sub1, length):
+        """ Adds a vertex made of two (new) subvertices with the smallest free id, returns its id"""
+        id = self._vert.allocate()
+        self._journal.append((self._vert, [id]))
+        self._set_vertex(id, sub0, sub1, length)
+        return id
 
     def remove_vertex(self, vertex):
-        """ Removes a vertex by sparsifying the list of used vertices ids"""
-        self._used_vert_ids[vertex.id] = False
-        self._next_vert_id = min(vertex.id, self._next_vert_id)
-
-    def add_edge(self, edge):
-        """ Adds an edge, at the end of the list of edges is complete or in the middle if the list is sparse"""
-        if self._next_edge_id >= len(self._edges):
-            self._edges.append(edge)
+        """ Removes a vertex, its id is free again"""
+        vertex = _id(vertex)
+        self._journal.append(("removed vertex", vertex))
+        self._vert.release(vertex)
+
+    def add_edge(self, sub0, sub1, weight, color, vert0=NONE, vert1=NONE):
+        """ Adds an edge from sub0 to sub1 with the smallest free id, returns its id
+
+        A blue edge becomes the out edge of sub0 and the in edge of sub1, a red edge their neighbour edge"""
+        id = self._edge.allocate()
+        self._journal.append((self._edge, [id]))
+        self._set_edge(id, sub0, sub1, weight, color, vert0, vert1)
+        return id
+
+    def _allocate(self, n_vertices, n_edges):
+        """ Takes in one go the rows of n_vertices new vertices (with their subvertices and red edges)
+        and of n_edges other edges, returns iterators over the ids of the subvertices, vertices and edges"""
+        subs = self._subv.allocate_many(2 * n_vertices)
+        verts = self._vert.allocate_many(n_vertices)
+        edges = self._edge.allocate_many(n_vertices + n_edges)
+        self._journal.extend(((self._subv, subs), (self._vert, verts), (self._edge, edges)))
+        return iter(subs), iter(verts), iter(edges)
+
+    def _make_vertex(self, length, subs, verts, edges):
+        """ Writes a vertex AB, its two subvertices and its red edge in rows taken with _allocate,
+        returns the ids of A, B and AB"""
+        A, B, AB, AB_edge = next(subs), next(subs), next(verts), next(edges)
+        self._set_subvertex(A)
+        self._set_subvertex(B)
+        self._set_vertex(AB, A, B, length, AB_edge)
+        self._set_edge(AB_edge, A, B, length, RED, AB, AB)
+        return A, B, AB
+
+    def adjacency_coo(self, weighted=False, color=None):
+        """ Sparse adjacency between subvertices, as (rows, cols, data) arrays
+
+        Blue edges go from their first subvertex to the second one, red edges go both ways.
+        weighted: data holds the weights of the edges (angles or lengths) instead of ones
+        color: "red" or "blue" to keep only one layer, None for both"""
+        used = self._edge.numpy("used") == 1
+        if color is not None:
+            used &= self._edge.numpy("color") == COLORS.index(color)
+        sub0, sub1 = self._edge.numpy("sub0")[used], self._edge.numpy("sub1")[used]
+        data = self._edge.numpy("weight")[used] if weighted else np.ones(len(sub0))
+        red = self._edge.numpy("color")[used] == RED
+        rows = np.concatenate((sub0, sub1[red])).astype(np.int64)
+        cols = np.concatenate((sub1, sub0[red])).astype(np.int64)
+        return rows, cols, np.concatenate((data, data[red]))
+
+    def adjacency_csr(self, weighted=False, color=None):
+        """ Sparse adjacency between subvertices, as (indptr, indices, data) arrays (see adjacency_coo)
+        The neighbours of subvertex i are indices[indptr[i]:indptr[i+1]]"""
+        rows, cols, data = self.adjacency_coo(weighted, color)
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(self._subv.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self._subv.rows), out=indptr[1:])
+        return indptr, cols[order], data[order]
+
+    def adjacency_scipy(self, weighted=False, color=None):
+        """ Sparse adjacency between subvertices as a scipy.sparse csr matrix (needs scipy)"""
+        if sp is None:
+            raise ImportError("adjacency_scipy needs scipy, use adjacency_coo or adjacency_csr instead")
+        N = self._subv.rows
+        rows, cols, data = self.adjacency_coo(weighted, color)
+        return sp.csr_matrix((data, (rows, cols)), shape=(N, N))
+
+    def connected_components(self, color=None):
+        """ Label of the connected component of each subvertex (-1 for the free rows), edges taken undirected
+        With color="blue", the components are the real life points"""
+        N = self._subv.rows
+        rows, cols, _ = self.adjacency_coo(color=color)
+        used = self._subv.numpy("used") == 1
+        if sp is not None:
+            _, labels = csgraph.connected_components(sp.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(N, N)),
+                                                     directed=False)
         else:
-            self._edges[self._next_edge_id] = edge
-        edge.set_id(self._next_edge_id)
-        self._used_edge_ids[self._next_edge_id] = True
-        self._next_edge_id += 1
-        while self._used_edge_ids.get(self._next_edge_id, default=False):
-            self._next_edge_id += 1
+            parent = list(range(N)) # union find
+            for i, j in zip(rows.tolist(), cols.tolist()):
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                while parent[j] != j:
+                    parent[j] = parent[parent[j]]
+                    j = parent[j]
+                if i != j:
+                    parent[max(i, j)] = min(i, j)
+            for i in range(N):
+                parent[i] = parent[parent[i]]
+            labels = np.array(parent, dtype=np.int64)
+        components = np.full(N, -1, dtype=np.int64)
+        components[used] = np.unique(labels[used], return_inverse=True)[1]
+        return components
+
+    def fan_labels(self):
+        """ The real life point of each subvertex (the representative of its fan, -1 for the free rows),
+        read from the fan cache without any graph walk"""
+        return np.where(self._subv.numpy("used") == 1, self._subv.numpy("point"), -1)
 
     def total_adjacency_mat(self):
-        """ Generates the adjacency matrix independently of whether the edges are red or blue"""
-        N = len(self._subvertices)
+        """ Generates the adjacency matrix independently of whether the edges are red or blue
+        It is dense (N x N floats): use adjacency_coo or adjacency_csr for large pavings"""
+        N = self._subv.rows
         adj_mat = np.zeros((N, N))
-        for edge in self._edges:
-            adj_mat[edge.subvertices[0].id, edge.subvertices[1].id] = 1 # or edge.weight ?
-        for vertex in self._vertices:
-            adj_mat[vertex.points[0].id, vertex.points[1].id] = 1 # or vertex.length ?
-            adj_mat[vertex.points[1].id, vertex.points[0].id] = 1 # or vertex.length ?
+        rows, cols, data = self.adjacency_coo()
+        adj_mat[rows, cols] = data
         return adj_mat
 
     def find_last_subvertex(self, subvertex):
-        """A function that finds the last subvertex and the angle around a certain subvertex"""
+        """A function that finds the last subvertex and the angle around a certain subvertex
+
+        The subvertex has to be an end of its chain of blue edges (the edges around a real life point),
+        the other end of the chain is returned with the sum of the angles of the chain"""
+        tot_angle, subv = self._find_last(_id(subvertex))
+        return tot_angle, SubVertex(self, subv)
+
+    def _find_last(self, subv):
+        """ find_last_subvertex on ids, read from the fan of the subvertex"""
+        # Either p1.in_edge_id or p1.out_edge_id should be none
+        assert self._s_in[subv] == NONE or self._s_out[subv] == NONE
+        point = self._s_point[subv]
+        if self._s_out[subv] == NONE:
+            tot_angle, last = self._s_angle[point], self._s_first[point]
+        else:
+            tot_angle, last = self._s_angle[point], self._s_last[point]
+        if self._validate:
+            walk_angle, walk_last = self._walk_last(subv)
+            assert walk_last == last and abs(walk_angle - tot_angle) <= 1e-9, (subv, walk_last, last)
+        return tot_angle, last
+
+    def remaining_angle(self, subvertex):
+        """ The angle left to fill around the real life point of the subvertex"""
+        return 2 * pi - self._s_angle[self._s_point[_id(subvertex)]]
+
+    def _walk_last(self, subv):
+        """ find_last_subvertex on ids, by walking along the chain"""
         tot_angle = 0
-        subv = subvertex
         # Either p1.in_edge_id or p1.out_edge_id should be none
-        assert subv.in_edge_id is None or subv.out_edge_id is None
-        while subv.in_edge_id is not None:
-            la_edge = self._edges[subv.in_edge_id]
-            tot_angle += la_edge.weight
-            subv = la_edge.subvertices[0]
-        while subv.out_edge_id is not None:
-            la_edge = self._edges[subv.out_edge_id]
-            tot_angle += la_edge.weight
-            subv = la_edge.subvertices[1]
+        assert self._s_in[subv] == NONE or self._s_out[subv] == NONE
+        if self._s_out[subv] == NONE:
+            while self._s_in[subv] != NONE:
+                la_edge = self._s_in[subv]
+                tot_angle += self._e_weight[la_edge]
+                subv = self._e_sub0[la_edge]
+        else:
+            while self._s_out[subv] != NONE:
+                la_edge = self._s_out[subv]
+                tot_angle += self._e_weight[la_edge]
+                subv = self._e_sub1[la_edge]
         return tot_angle, subv
 
+    def corner_fits(self, subv_in, subv_out, angle):
+        """Checks whether a blue edge (a quad corner) of weight angle can go from subv_in to subv_out
+
+        subv_in has to be the last subvertex of its chain and subv_out the first one of its chain
+        (None stands for a subvertex that is not created yet),
+        the angle around the point cannot exceed 2pi, and it is 2pi iff the chain is then closed"""
+        tot_in, tot_out, first = 0, 0, None
+        if subv_in is not None:
+            subv_in = _id(subv_in)
+            if self._s_out[subv_in] != NONE:
+                return False
+            tot_in, first = self._find_last(subv_in)
+        if subv_out is not None:
+            subv_out = _id(subv_out)
+            if self._s_in[subv_out] != NONE:
+                return False
+            if first == subv_out:
+                return abs(tot_in + angle - 2 * pi) <= tl.policy.angle
+            tot_out = self._find_last(subv_out)[0]
+        return tot_in + angle + tot_out < 2 * pi - tl.policy.angle
+
     def create_vertex(self, length):
-        A = SubVertex()
-        B = SubVertex()
-        self.add_subvertex(A)
-        self.add_subvertex(B)
-        AB = Vertex(A, B, length)
-        self.add_vertex(AB)
-        AB_edge = Edge(AB, AB, A, B, length, "red")
-        self.add_edge(AB_edge)
-        return A, B, AB
+        """ Creates a vertex AB with its two subvertices and its red edge, returns the ids of A, B and AB"""
+        return self._make_vertex(length, *self._allocate(1, 0))
+
+    def is_exterior(self, vertex):
+        """ A vertex is exterior if it is used by only one quad:
+        the quad it was created for gives an in edge to its first point, the second one gives it an out edge"""
+        return self._s_out[self._v_sub0[_id(vertex)]] == NONE
+
+    def exterior_vertices(self):
+        return [Vertex(self, id) for id in range(self._vert.rows)
+                if self._v_used[id] and self._s_out[self._v_sub0[id]] == NONE]
+
+    def boundary(self):
+        """ The exterior vertices as cycles of ids, each vertex is followed by the one that shares its first point
+        (the other end of the chain of blue edges of that point)"""
+        sub0, sub1, parent = self._v_sub0, self._v_sub1, self._s_parent
+        cycles, vus = [], set()
+        for vertex in self.exterior_vertices():
+            id = vertex.id
+            cycle = []
+            while id not in vus:
+                vus.add(id)
+                cycle.append(id)
+                id = parent[self._find_last(sub0[id])[1]]
+            if cycle:
+                cycles.append(cycle)
+        return cycles
+
+    def area(self):
+        """ The area of the sphere covered by the paving"""
+        return sum(face[0].area() for face in self._faces)
+
+    def add_first_quad(self, quad):
+        """ Starts the paving with a single quad, its vertices are AB, BC, CD, DA in this order"""
+        A, B1, AB = self.create_vertex(quad.a)
+        B, C1, BC = self.create_vertex(quad.b)
+        C, D1, CD = self.create_vertex(quad.c)
+        D, A1, DA = self.create_vertex(quad.d)
+        self.add_edge(B1, B, quad.beta, BLUE, AB, BC)
+        self.add_edge(C1, C, quad.gamma, BLUE, BC, CD)
+        self.add_edge(D1, D, quad.delta, BLUE, CD, DA)
+        self.add_edge(A1, A, quad.alpha, BLUE, DA, AB)
+        self._faces.append([quad, [AB, BC, CD, DA]])
+        self._journal.append(("face",))
+
+    def _open_fan(self, subvertices):
+        """ The first of the fans of these subvertices that cannot be finished (see Fans), None if there is none"""
+        fans, length, parent = self.fans, self._v_length, self._s_parent
+        s_point, s_closed, s_angle, s_first, s_last = \
+            self._s_point, self._s_closed, self._s_angle, self._s_first, self._s_last
+        for subv in subvertices:
+            point = s_point[subv]
+            if not s_closed[point] and not fans.completes(length[parent[s_last[point]]],
+                                                          length[parent[s_first[point]]], 2 * pi - s_angle[point]):
+                return subv
+        return None
+
+    def _reject(self, reason):
+        """ add_quad refuses a quad, the reason is counted if rejects is set"""
+        if self.rejects is not None:
+            self.rejects[reason] += 1
+        return False
 
     def add_quad(self, quad, vertex_AB, side=0):
         """ Tries to append a quad to the graph
         by merging its i th side/edge (default first)
-        and a specified vertex (a.k.a. real life edge) from the graph
+        and a specified vertex (a.k.a. real life edge, a Vertex or its id) from the graph
 
         We consider the quad we have as an ABCD quad with: B = p1, C = p3, A = p2 and D = ?
 
-        If it is possible to add a quad here, does so and returns 0
-        else returns -1"""
+        If it is possible to add a quad here, does so and returns True
+        else returns False
+        Angles and lengths are compared with the tolerances of the policy in use (see Tolerance).
+        With a fan table (fans), the quad is also refused if one of its corners is in a fan that cannot be finished"""
         quad = quad.rotate(side)
+        vertex_AB = _id(vertex_AB)
+        length, sub0, sub1, parent = self._v_length, self._v_sub0, self._v_sub1, self._s_parent
         add_BC, add_CD1, add_CD2, add_DA = True, True, True, True
-        if quad.sides[0] != vertex_AB.length: #Potentiellement ajouter une tolérance d'erreur (?)
-            return -1
+        eps, eps_length = tl.policy.angle, tl.policy.length # angles and lengths equal up to the tolerance policy
+        if abs(quad.sides[0] - length[vertex_AB]) > eps_length:
+            return self._reject("length AB")
         #The first side of our quad fits on another edge : no need to create a vertex
         # We need to check for each edge of our quad whether it is free
         # or it coincides with another real life edge (a graph vertex)
         # 1st, we test for the 1st edge (in the clockwise order == edge[0] if we rotate the quad once anticlockwise)
-        p1 = vertex_AB.points[0] #Le point B
-        tot_angle_p1, n_p1 = self.find_last_subvertex(p1) #N_p1 est le point B mais contenu dans le dernier vertex
+        p1 = sub0[vertex_AB] #Le point B
+        tot_angle_p1, n_p1 = self._find_last(p1) #N_p1 est le point B mais contenu dans le dernier vertex
         tot_angle_p1 += quad.beta #The first angle clockwise
-        if tot_angle_p1 > 2*pi: #+tolerance if we want some tolerance
-            return False
-        elif tot_angle_p1 - 2*pi == 0: # < ... if we offer tolerance
-            vertex_BC = self._vertices[n_p1.parent_id]
-            if quad.b != vertex_BC.length:
-                return False
+        if tot_angle_p1 > 2*pi + eps:
+            return self._reject("angle B")
+        elif tot_angle_p1 >= 2*pi - eps:
+            vertex_BC = parent[n_p1]
+            if abs(quad.b - length[vertex_BC]) > eps_length:
+                return self._reject("length BC")
             else:
                 add_BC = False #The second side of our quad fits on another edge : no need to create a vertex
-                if vertex_BC.points[0].id == n_p1.id:
-                    p3 = vertex_BC.points[1]
+                if sub0[vertex_BC] == n_p1:
+                    p3 = sub1[vertex_BC]
                 else:
-                    p3 = vertex_BC.points[0]
-                tot_angle_p3, n_p3 = self.find_last_subvertex(p3) #n_p3 est le point C mais dans le dernier vertex
+                    p3 = sub0[vertex_BC]
+                tot_angle_p3, n_p3 = self._find_last(p3) #n_p3 est le point C mais dans le dernier vertex
                 tot_angle_p3 += quad.gamma
-                if tot_angle_p3 > 2 * pi:  # +tolerance if we want some tolerance
-                    return False
-                elif tot_angle_p3 - 2 * pi == 0:  # < ... if we offer tolerance
-                    vertex_CD1 = self._vertices[n_p3.parent_id]
-                    if quad.c != vertex_CD1.length:
-                        return False
+                if tot_angle_p3 > 2 * pi + eps:
+                    return self._reject("angle C")
+                elif tot_angle_p3 >= 2 * pi - eps:
+                    vertex_CD1 = parent[n_p3]
+                    if abs(quad.c - length[vertex_CD1]) > eps_length:
+                        return self._reject("length CD")
                     else:
                         add_CD1 = False #The third side of our quad fits on another edge : no need to create a vertex
-                        if vertex_CD1.points[0].id == n_p3.id:
-                            p4b = vertex_CD1.points[1]
+                        if sub0[vertex_CD1] == n_p3:
+                            p4b = sub1[vertex_CD1]
                         else:
-                            p4b = vertex_CD1.points[0]
+                            p4b = sub0[vertex_CD1]
 
-        p2 = vertex_AB.points[1] #Should be A
-        tot_angle_p2, n_p2 = self.find_last_subvertex(p2) #A but in the last vertex (furthest from AB)
+        p2 = sub1[vertex_AB] #Should be A
+        tot_angle_p2, n_p2 = self._find_last(p2) #A but in the last vertex (furthest from AB)
         tot_angle_p2 += quad.alpha  # The first angle clockwise
-        if tot_angle_p2 > 2 * pi:  # +tolerance if we want some tolerance
-            return False
-        elif tot_angle_p2 - 2 * pi == 0:  # < ... if we offer tolerance
-            vertex_DA = self._vertices[n_p2.parent_id]
-            if quad.d != vertex_DA.length:
-                return False
+        if tot_angle_p2 > 2 * pi + eps:
+            return self._reject("angle A")
+        elif tot_angle_p2 >= 2 * pi - eps:
+            vertex_DA = parent[n_p2]
+            if abs(quad.d - length[vertex_DA]) > eps_length:
+                return self._reject("length DA")
             else:
                 add_DA = False #The fourth edge of our quad fits on another edge : no need to create a vertex
-                if vertex_DA.points[0].id == n_p2.id:
-                    p4 = vertex_DA.points[1]
+                if sub0[vertex_DA] == n_p2:
+                    p4 = sub1[vertex_DA]
                 else:
-                    p4 = vertex_DA.points[0]
-                tot_angle_p4, n_p4 = self.find_last_subvertex(p4)
+                    p4 = sub0[vertex_DA]
+                tot_angle_p4, n_p4 = self._find_last(p4)
                 tot_angle_p4 += quad.delta
-                if tot_angle_p4 > 2 * pi:  # +tolerance if we want some tolerance
-                    return False
-                elif tot_angle_p4 - 2 * pi == 0:  # < ... if we offer tolerance
-                    vertex_CD2 = self._vertices[n_p4.parent_id]
-                    if quad.c != vertex_CD2.length:
-                        return False
+                if tot_angle_p4 > 2 * pi + eps:
+                    return self._reject("angle D")
+                elif tot_angle_p4 >= 2 * pi - eps:
+                    vertex_CD2 = parent[n_p4]
+                    if abs(quad.c - length[vertex_CD2]) > eps_length:
+                        return self._reject("length CD")
                     else:
                         add_CD2 = False #The third side of our quad fits on another edge : no need to create a vertex
-                        if vertex_CD2.points[0].id == n_p4.id:
-                            p3b = vertex_CD2.points[1]
+                        if sub0[vertex_CD2] == n_p4:
+                            p3b = sub1[vertex_CD2]
                         else:
-                            p3b = vertex_CD2.points[0]
+                            p3b = sub0[vertex_CD2]
+        if not add_CD1 and not add_CD2 and vertex_CD1 != vertex_CD2:
+            return self._reject("two sides CD")
+
+        # When CD comes from only one side, the corner on the other side may merge two chains of the same point
+        if not add_CD1 and not self.corner_fits(p4b, None if add_DA else p4, quad.delta):
+            return self._reject("corner D")
+        if not add_CD2 and not self.corner_fits(None if add_BC else p3, p3b, quad.gamma):
+            return self._reject("corner C")
+
+        checkpoint = len(self._journal)
+        # The rows of the new vertices (at most 3 with 6 subvertices) and of the 7 edges are taken at once
+        subs, verts, edges = self._allocate(add_BC + add_DA + (add_CD1 and add_CD2), 4)
         if add_BC:
-            B,C, BC = self.create_vertex(quad.b)
+            B,C, BC = self._make_vertex(quad.b, subs, verts, edges)
         else:
             B,C, BC = n_p1, p3,  vertex_BC #vertex_BC is no longer exterior
 
         if add_DA:
-            D,A, DA = self.create_vertex(quad.d)
+            D,A, DA = self._make_vertex(quad.d, subs, verts, edges)
         else:
-            D,A, DA = n_p2, p4, vertex_DA #vertex_DA is no longer exterior
+            D,A, DA = p4, n_p2, vertex_DA #vertex_DA is no longer exterior
 
         if add_CD1 and add_CD2:
-            Cd,Dc, CD = self.create_vertex(quad.c)
+            Cd,Dc, CD = self._make_vertex(quad.c, subs, verts, edges)
         elif add_CD2:
             Cd,Dc, CD = n_p3, p4b, vertex_CD1
         else:
             Cd,Dc, CD = p3b, n_p4, vertex_CD2
 
-        ABC = Edge(vertex_AB, BC, n_p1, B, quad.beta, "blue")
-        self.add_edge(ABC)
-        BCD = Edge(BC, CD, C, Cd, quad.gamma, "blue")
-        self.add_edge(BCD)
-        CDA = Edge(CD, DA, Dc, D, quad.delta, "blue")
-        self.add_edge(CDA)
-        DAB = Edge(DA, vertex_AB, A, n_p2, quad.alpha, "blue")
-        self.add_edge(DAB)
-
+        self._set_edge(next(edges), p1, B, quad.beta, BLUE, vertex_AB, BC) #ABC
+        self._set_edge(next(edges), C, Cd, quad.gamma, BLUE, BC, CD) #BCD
+        self._set_edge(next(edges), Dc, D, quad.delta, BLUE, CD, DA) #CDA
+        self._set_edge(next(edges), A, p2, quad.alpha, BLUE, DA, vertex_AB) #DAB
+        self._faces.append([quad, [vertex_AB, BC, CD, DA]])
+        self._journal.append(("face",))
+
+        if self.fans is not None:
+            corners = (p1, C, Dc, A)
+            dead = self._open_fan(corners)
+            if dead is not None:
+                self.rollback(checkpoint)
+                return self._reject("fan " + "BCDA"[corners.index(dead)])
         return True
 
 
-
-
-
-
-
-
-
-
-
-
-
-
 def add_quad(noeud, quad, angle, cote="d"):
-    S = 0
-    for i in range(len(noeud)):
-        S += noeud[i][0].angle(noeud[i][1])
-    cond = (S + quad.angle(angle)) < 2 * pi
+    """ Tries to add the corner `angle` of `quad` to the right (cote="d") or to the left of a node
+    Returns the new node (the given one is not modified) and whether it was possible"""
+    S = somme_angle_noeud(noeud)
+    cond = (S + quad.angle(angle)) <= 2 * pi + tl.policy.angle
     if cond:
-        if S >= 2 * pi - eps:
-            cond = cond and (quad.cote_gauche(angle) == noeud[-1][0].cote_droite(noeud[-1][1])) and (
-                    quad.cote_droit(angle) == noeud[-1][0].cote_gauche(noeud[-1][1]))
-            if cond:
-                noeud.append([quad, angle])
         if cote == "d":
-            cond = cond and (quad.cote_gauche(angle) == noeud[-1][0].cote_droite(noeud[-1][1]))
+            cond = quad.cote_gauche(angle) == noeud[-1][0].cote_droite(noeud[-1][1])
             if cond:
-                noeud.append([quad, angle])
-
+                noeud = noeud + [[quad, angle]]
         else:
-            cond = cond and (quad.cote_droit(angle) == noeud[-1][0].cote_gauche(noeud[-1][1]))
+            cond = quad.cote_droite(angle) == noeud[0][0].cote_gauche(noeud[0][1])
             if cond:
                 noeud = [[quad, angle]] + noeud
     return noeud, cond
@@ -426,12 +768,13 @@ def somme_angle_noeud(noeud):
     return S
 
 
-def possible_noeud(liste_quad, valence):
+def possible_noeud_naif(liste_quad, valence, unique=False):
+    """ Brute force version of possible_noeud, kept to check the results of the enumeration engine"""
     liste_oriente = []
     for quad in liste_quad:
         for angle in ["alpha", "beta", "gamma", "delta"]:
             liste_oriente.append([quad, angle])
-    noeud_possible = liste_oriente
+    noeud_possible = [[coin] for coin in liste_oriente]
     for k in range(valence - 1):
         noeud_popo = []
         for i in range(len(noeud_possible)):
@@ -441,37 +784,40 @@ def possible_noeud(liste_quad, valence):
                     noeud_popo.append(new_noeud)
         noeud_possible = noeud_popo
     noeuds_finaux = []
-    for i in range(len(noeud_possible)):
-        if somme_angle_noeud(noeud_possible[i]) > 2 * pi - eps:
-            noeuds_finaux.append(noeud_possible[i])
+    for noeud in noeud_possible:
+        ferme = noeud[0][0].cote_gauche(noeud[0][1]) == noeud[-1][0].cote_droite(noeud[-1][1])
+        if abs(somme_angle_noeud(noeud) - 2 * pi) <= tl.policy.angle and ferme:
+            noeuds_finaux.append(noeud)
+    if unique:
+        noeuds_finaux = cn.unique_nodes(noeuds_finaux)
     return noeuds_finaux
 
 
-def construction_graphe(quadrangles, quad_init, graphe, aire):
-
-    graph = PavingGraph([], [])
-    quad_dispo = []
-    for quad in quadrangles:
-        quad_dispo.append(quad);
-        quad_dispo.append(quad.rotate());
-        quad_dispo.append(quad.rotate().rotate());
-        quad_dispo.append(quad.rotate().rotate().rotate());
-    n = len(quad_dispo)
-    compt = 0
-    for vertex in graphe._vertex:
-        for quad in quad_dispo:
-            g = PavingGraph([],[]);
-            g.copy(graphe)
-            ajout_bool = g.add_quad(quad, vertex)
-            if ajout_bool:
-                compt += 1
-                g,bool = construction_graphe(quadrangles, g, aire + quad.area())
-            if bool:
-                return g, bool
-            if aire > 0.80*4*np.pi:
-                print("cette formation couvre plus de 80% de la sphère")
-                return g, True
-    return g, False
-
-
-
+def possible_noeud(liste_quad, valence, unique=True):
+    """ Lists all the nodes (cyclic chains of [quad, angle] whose angles add up to 2pi) of a given valence
+    With unique=True, a node is given once and not once per rotation of its chain.
+    The sides and angles are compared with the tolerance policy (see Tolerance)"""
+    cat = ne.CornerCatalogue(liste_quad)
+    return cat.to_nodes(ne.enumerate_nodes(cat, valence, unique=unique))
+
+
+def construction_graphe(quadrangles, quad_init=None, graphe=None, aire=None, deja_vus=None, reflexion=False,
+                        probe=None, policy=None):
+    """ Depth first search of a paving of the sphere with the given quadrangles,
+    starting from quad_init alone or from the paving graphe
+
+    The search is the one of PavingSearch, stopped at the first paving covering 80% of the sphere.
+    Each paving is explored once, whatever the order in which its quads were added (see Canonical).
+    A Probe (see Instrumentation) follows the progress of the search,
+    policy chooses the side of the boundary where the quads are tried (see Scheduler).
+    Returns the paving found and True, or the starting paving and False"""
+    import PavingSearch as ps # PavingSearch imports this module
+    if graphe is None:
+        graphe = PavingGraph()
+        graphe.add_first_quad(quad_init)
+    for g, complete in ps.PavingSearch(quadrangles, graphe=graphe, aire=aire, max_results=1,
+                                       reflexion=reflexion, deja_vus=deja_vus, probe=probe,
+                                       policy=policy):
+        print("cette formation couvre plus de 80% de la sphère")
+        return g, True
+    return graphe, False
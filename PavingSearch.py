@@ -0,0 +1,282 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Paving search
+# Depth first search of pavings with an explicit stack (no recursion), the pavings are given as they are found.
+# The search can be stopped and its frontier saved, to go on later from there
+# --------------------------------------------------------- #
+
+import heapq
+import pickle
+from collections import Counter
+
+import numpy as np
+
+import Canonical as cn
+import PavingGraph as pg
+from Bounds import Bounds
+from Fans import FanTable
+from Scheduler import Scheduler, policy_for
+from Transposition import DEAD_END, SOLVABLE, boundary_key, catalogue_key
+import Serialization as se
+import Validity as vl
+
+
+class PavingSearch:
+    """ Iterating over a PavingSearch gives (paving, complete) pairs, the paving being a copy
+
+    A paving is complete when it is closed or when its area is above seuil (80% of the sphere by default),
+    a complete paving is not extended. With partial=True every new paving is given, not only the complete ones.
+    Pavings with max_depth quads are not extended, the search stops after max_results pavings
+    or after budget new pavings explored.
+    Each paving is explored once, whatever the order in which its quads were added (see Canonical).
+    With bound=True, the quads and pavings that cannot lead to a complete paving are discarded (see Bounds),
+    the numbers of quads tried and discarded are in stats.
+    With verify=True, each quad added is checked (Validity.check_face), and each closed paving is checked
+    in full before it is given (Validity.check_paving), the pavings that fail are counted in stats as "invalid".
+
+    policy (a Scheduler or the name of one of its policies) chooses the side of the boundary on which the quads
+    are tried: "list" tries every quad on every side, "constrained" the side where the fewest quads fit.
+    The policies that try one side need seuil to be the whole sphere, asking for one of them otherwise
+    raises a ValueError (see Scheduler.policy_for), by default "constrained" is used then, and "list" otherwise.
+
+    The frontier is a list of (key, paving as bytes, area, first child to try), the key of a paving being the
+    tuple of the indices of the children chosen from the root (as in ParallelSearch).
+    The search stops before the first paving whose key is above stop_key, last_key is the key of the last paving given.
+
+    With a TranspositionTable, the status of the boundary of each paving explored in full is kept in the table,
+    and a paving whose boundary is a known dead end is not explored (the boundary is taken as the state
+    of the search: two pavings with the same boundary are assumed to have the same future)
+
+    With fans (a FanTable, or True for the table of the quadrangles kept on disk, see Fans), the quads that leave
+    a fan of corners that no quads can finish are refused when they are added.
+    With a Probe (see Instrumentation), the pavings extended, the refusals of add_quad and the time spent
+    in each stage are counted"""
+
+    def __init__(self, quadrangles, quad_init=None, graphe=None, aire=None, max_depth=None, max_results=None,
+                 seuil=0.80*4*np.pi, partial=False, reflexion=False, frontier=None, deja_vus=None,
+                 bound=True, budget=None, stop_key=None, table=None, verify=False, probe=None,
+                 fans=None, policy=None):
+        policy = policy_for(policy, seuil)
+        self._scheduler = policy if isinstance(policy, Scheduler) else Scheduler(quadrangles, policy)
+        self._max_depth, self._max_results, self._budget = max_depth, max_results, budget
+        self._seuil, self._partial, self._reflexion = seuil, partial, reflexion
+        self._bounds = Bounds(quadrangles, seuil=seuil) if bound else None
+        self._table = table
+        self._verify = verify
+        self._fans = FanTable.cached(quadrangles) if fans is True else fans
+        if table is not None:
+            table.bind((catalogue_key(quadrangles), round(seuil, 9), bound, self._fans is not None,
+                        self._scheduler.policy, self._scheduler.seed))
+        self._stats = Counter()
+        self._add_quad = pg.PavingGraph.add_quad
+        self._signature = cn.graph_signature
+        self._probe = probe
+        if probe is not None:
+            probe.attach(self)
+        self.stop_key = stop_key
+        self.last_key = None
+        self._stack = []
+        self._graphe = None
+        self._n_results = 0
+        self._n_explored = 0
+        self._started = False
+        if frontier is None:
+            if graphe is None:
+                graphe = pg.PavingGraph()
+                graphe.add_first_quad(quad_init)
+            if aire is None:
+                aire = graphe.area()
+            frontier = [((), pickle.dumps(graphe), aire, 0)]
+            if deja_vus is None:
+                deja_vus = {cn.graph_signature(graphe, reflexion)}
+        # Heap of the subproblems, ordered by the first key they cover
+        self._pending = [(entry[0] + (entry[3],), entry) for entry in frontier]
+        heapq.heapify(self._pending)
+        self.deja_vus = set() if deja_vus is None else deja_vus
+
+    @property
+    def n_results(self):
+        return self._n_results
+
+    @property
+    def n_explored(self):
+        """ Number of new pavings made"""
+        return self._n_explored
+
+    @property
+    def stats(self):
+        """ Counts of the quads tried, of the quads and pavings discarded by the bounds,
+        and of the pavings not explored thanks to the transposition table"""
+        return self._stats + self._bounds.stats if self._bounds is not None else Counter(self._stats)
+
+    def is_complete(self, graphe, aire):
+        return aire > self._seuil or not graphe.exterior_vertices()
+
+    def children(self, graphe):
+        """ The (vertex id, quad) pairs to try from a paving, in a fixed order (see Scheduler)"""
+        return self._scheduler.placements(graphe)
+
+    def _result(self, graphe, key, complete):
+        self._n_results += 1
+        self.last_key = key
+        copie = pg.PavingGraph()
+        copie.copy(graphe)
+        return copie, complete
+
+    def _done(self):
+        return ((self._max_results is not None and self._n_results >= self._max_results) or
+                (self._budget is not None and self._n_explored >= self._budget))
+
+    def _depth(self, graphe):
+        """ Number of quads that can still be added"""
+        return float("inf") if self._max_depth is None else self._max_depth - len(graphe._faces)
+
+    def _boundary(self, graphe):
+        return boundary_key(cn.boundary_signature(graphe))
+
+    def _found(self):
+        """ A complete paving was found below every frame of the stack"""
+        for frame in self._stack:
+            frame[6] = True
+
+    def _push(self, graphe, key, aire, start=0):
+        """ Adds the frame of a paving to the stack, returns False if the paving is not to be extended
+
+        A frame is [checkpoint, children, next child, key, area, boundary, found, unknown]:
+        found when a complete paving was found from it, unknown when one of its children was not explored
+        and is not known to be a dead end (the frame cannot be stored as a dead end then)"""
+        table, depth = self._table, self._depth(graphe)
+        boundary = None
+        if table is not None:
+            boundary = self._boundary(graphe)
+            if depth <= 0:
+                table.put(boundary, DEAD_END, 0)
+            elif table.get(boundary, depth) == DEAD_END:
+                self._stats["transposition cut"] += 1
+                return False
+        if depth <= 0:
+            return False
+        choices = self.children(graphe)
+        self._stack.append([graphe.checkpoint(), choices, start, key, aire, boundary, False, start > 0])
+        if self._probe is not None:
+            self._probe.node(len(graphe._faces), len(choices) - start, aire)
+        return True
+
+    def _pop(self):
+        """ Removes the frame at the top of the stack, after all its children were explored"""
+        frame = self._stack.pop()
+        table, boundary, found, unknown = self._table, frame[5], frame[6], frame[7]
+        if table is None:
+            return
+        if found:
+            table.put(boundary, SOLVABLE)
+        elif unknown:
+            if self._stack:
+                self._stack[-1][7] = True
+        else:
+            self._graphe.rollback(frame[0])
+            table.put(boundary, DEAD_END, self._depth(self._graphe))
+
+    def _valid(self, graphe, aire):
+        if not vl.check_face(graphe, aire=aire).ok:
+            return False
+        return bool(graphe.exterior_vertices()) or vl.check_paving(graphe).ok
+
+    def _seen(self, graphe):
+        """ A child already seen: its status is read from the table"""
+        if self._table is None:
+            return
+        status = self._table.get(self._boundary(graphe), self._depth(graphe))
+        if status == SOLVABLE:
+            self._found()
+        elif status is None:
+            self._stack[-1][7] = True
+
+    def __iter__(self):
+        if self._started:
+            raise RuntimeError("a PavingSearch can be iterated only once, use its frontier to go on")
+        self._started = True
+        try:
+            yield from self._search()
+        finally:
+            if self._probe is not None:
+                self._probe.report()
+
+    def _search(self):
+        while not self._done() and (self._stack or self._pending):
+            if not self._stack:
+                key, data, aire, start = heapq.heappop(self._pending)[1]
+                self._graphe = graphe = se.loads(data)
+                graphe.fans = self._fans
+                if self._probe is not None:
+                    self._probe.watch(graphe)
+                if start == 0 and key == () and self.is_complete(graphe, aire):
+                    yield self._result(graphe, key, True)
+                    continue
+                self._push(graphe, key, aire, start)
+                continue
+            frame = self._stack[-1]
+            checkpoint, choices, i, key, aire = frame[:5]
+            if i == len(choices):
+                self._pop()
+                continue
+            child_key = key + (i,)
+            if self.stop_key is not None and child_key > self.stop_key:
+                self._stack.clear()
+                self._pending = []
+                break
+            frame[2] += 1
+            graphe.rollback(checkpoint)
+            vertex_id, quad = choices[i]
+            bounds = self._bounds
+            if bounds is not None and not bounds.quad_ok(graphe, aire, vertex_id, quad):
+                continue
+            if not self._add_quad(graphe, quad, vertex_id):
+                continue
+            signature = self._signature(graphe, self._reflexion)
+            if signature in self.deja_vus:
+                self._seen(graphe)
+                continue
+            self.deja_vus.add(signature)
+            self._n_explored += 1
+            child_aire = aire + quad.area()
+            complete = self.is_complete(graphe, child_aire)
+            if self._verify and not self._valid(graphe, child_aire):
+                self._stats["invalid"] += 1
+                continue
+            if complete:
+                self._found()
+                if self._table is not None:
+                    self._table.put(self._boundary(graphe), SOLVABLE)
+            else:
+                if bounds is not None and not bounds.paving_ok(graphe, child_aire):
+                    if self._table is not None:
+                        self._table.put(self._boundary(graphe), DEAD_END)
+                    continue
+                self._push(graphe, child_key, child_aire)
+            if complete or self._partial:
+                yield self._result(graphe, child_key, complete)
+
+    def frontier(self):
+        """ What is left to explore, the search cannot be iterated any more once its frontier is taken"""
+        frontier = [entry for _, entry in self._pending]
+        while self._stack:
+            checkpoint, choices, i, key, aire = self._stack.pop()[:5]
+            self._graphe.rollback(checkpoint)
+            if i < len(choices):
+                frontier.append((key, pickle.dumps(self._graphe), aire, i))
+        self._pending = []
+        self._started = True
+        return sorted(frontier, key=lambda entry: entry[0] + (entry[3],))
+
+    def save(self, path):
+        """ Saves the frontier and the pavings already seen, see Serialization.save_checkpoint
+        (max_results counts again from 0 after load)"""
+        se.save_checkpoint(path, self)
+
+    @staticmethod
+    def load(path, quadrangles, **options):
+        """ The search saved at path, the options (max_depth, seuil...) are given again"""
+        return se.load_checkpoint(path, quadrangles, **options)
@@ -0,0 +1,60 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Quad index
+# The quads (each of their rotations) grouped by the length of their first side,
+# to find the quads that can be put on a side of the boundary without trying all of them
+# --------------------------------------------------------- #
+
+from bisect import bisect_right
+
+import numpy as np
+
+import Canonical as cn
+import Tolerance as tl
+
+
+class QuadIndex:
+    """ The rotations of the quads are put in buckets of width 2*eps by the length of their first side
+    (eps being the length tolerance of the policy by default, see Tolerance),
+    a length is compared to the quads of at most two buckets.
+    In a bucket the quads are sorted by beta, the angle put at the first point of the side by add_quad"""
+
+    def __init__(self, quadrangles, eps=None):
+        self.eps = eps = tl.policy.length if eps is None else eps
+        self._width = 2 * eps
+        self._quads = cn.unique_rotations(quadrangles)
+        self._buckets = {}
+        for i, quad in enumerate(self._quads):
+            self._buckets.setdefault(self._bucket(quad.a), []).append((quad.beta, i))
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._betas = {key: [beta for beta, _ in bucket] for key, bucket in self._buckets.items()}
+
+    @property
+    def quads(self):
+        """ The quads and their rotations, in the order of Canonical.unique_rotations"""
+        return self._quads
+
+    def _bucket(self, length):
+        return int(np.floor(length / self._width))
+
+    def candidates(self, length, gap_first=2*np.pi, gap_second=2*np.pi):
+        """ The quads whose first side has this length (+/- eps) and whose corners beta and alpha fit in the angles
+        left at the first and second points of the side, in the order of quads"""
+        found = []
+        for key in range(self._bucket(length - self.eps), self._bucket(length + self.eps) + 1):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            for beta, i in bucket[:bisect_right(self._betas[key], gap_first + self.eps)]:
+                quad = self._quads[i]
+                if abs(quad.a - length) <= self.eps and quad.alpha <= gap_second + self.eps:
+                    found.append(i)
+        return [self._quads[i] for i in sorted(found)]
+
+    def placements(self, graphe):
+        """ The (vertex id, quad) pairs that can be tried on the boundary of a paving, side by side"""
+        return [(vertex.id, quad) for vertex in graphe.exterior_vertices()
+                for quad in self.candidates(vertex.length, *map(graphe.remaining_angle, vertex.points))]
@@ -5,112 +5,251 @@
 # Quadrangle Class
 # After a gaussian transform, a quad on the sphere represents a node in real life,
 # Our quads are determined by the four angles separating each two consecutive side
+# The quads are stored by batches (QuadBatch), a Quad is a view on one row of a batch
 # --------------------------------------------------------- #
+from array import array
+
 import numpy as np
 
+import Tolerance as tl
+
+ANGLES = ["alpha", "beta", "gamma", "delta"]
+ALPHA, BETA, GAMMA, DELTA = range(4) # corner codes
+CORNERS = {name: code for code, name in enumerate(ANGLES)}
+
+
+def _code(ang):
+    """ The corner code of an angle name, or the code itself"""
+    return CORNERS[ang] if isinstance(ang, str) else ang
+
+
+class QuadBatch:
+    """ N quads, stored as the rows of flat arrays of angles and sides (4 values per quad)
+    and a rotation for each row
+
+    Row i with rotation r is the original quad i rotated r times (see Quad.rotate):
+    its corner j is the corner (j + r) % 4 of the original quad,
+    its side j (the left side of corner j) is the side (j + r) % 4 of the original quad.
+    Rotating a batch only changes the rotations, the angles and sides are shared.
+    The angles are snapped to multiples of pi/denominator by the tolerance policy (see Tolerance)"""
+
+    def __init__(self, ids, angles, sides, rotations=None):
+        """ angles and sides are (N, 4) arrays, [alpha, beta, gamma, delta] and [a, b, c, d] of each original quad"""
+        self._ids = list(ids)
+        self._angles = array("d", tl.policy.snap(angles).ravel().tolist())
+        self._sides = array("d", np.asarray(sides, dtype=np.float64).ravel().tolist())
+        assert len(self._angles) == len(self._sides) == 4 * len(self._ids)
+        self._rotations = np.zeros(len(self._ids), dtype=np.int64) if rotations is None else \
+            np.asarray(rotations, dtype=np.int64) % 4
+
+    @classmethod
+    def from_quads(cls, quads):
+        """ A batch of the given quads (with their rotations)"""
+        quads = list(quads)
+        batch = cls([quad.id for quad in quads], [quad.original_angles for quad in quads],
+                    [quad.original_sides for quad in quads], [quad.rotation for quad in quads])
+        return batch
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        return Quad._view(self, i, int(self._rotations[i]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def quad(self, row, rotation=0):
+        """ The quad of the row, rotated rotation times from the original one"""
+        return Quad._view(self, row, rotation % 4)
+
+    @property
+    def ids(self):
+        return self._ids
+
+    @property
+    def rotations(self):
+        return self._rotations
+
+    def original_angles(self):
+        """ (N, 4) view on the angles of the original quads, not a copy"""
+        return np.frombuffer(self._angles, dtype=np.float64).reshape(-1, 4)
+
+    def original_sides(self):
+        """ (N, 4) view on the sides of the original quads, not a copy"""
+        return np.frombuffer(self._sides, dtype=np.float64).reshape(-1, 4)
+
+    def original_units(self):
+        """ (N, 4) angles of the original quads in units of pi/denominator, None if they are not all snapped"""
+        return tl.policy.units(self.original_angles())
+
+    def corner_index(self, corner):
+        """ Index in the original quads of the corner (a code, or an array of one code per row) of each row"""
+        return (_code(corner) + self._rotations) % 4
+
+    def _read(self, values, index):
+        return np.take_along_axis(values, np.reshape(index, (-1, 1)) % 4, axis=1)[:, 0]
+
+    def angle(self, corner):
+        """ Angle of the corner of each row"""
+        return self._read(self.original_angles(), self.corner_index(corner))
+
+    def left_side(self, corner):
+        """ cote_gauche of the corner of each row"""
+        return self._read(self.original_sides(), self.corner_index(corner))
+
+    def right_side(self, corner):
+        """ cote_droite of the corner of each row"""
+        return self._read(self.original_sides(), self.corner_index(corner) - 1)
+
+    @property
+    def angles(self):
+        """ (N, 4) array of alpha, beta, gamma, delta of each row"""
+        return np.column_stack([self.angle(j) for j in range(4)]) if len(self) else np.zeros((0, 4))
+
+    @property
+    def sides(self):
+        """ (N, 4) array of a, b, c, d of each row"""
+        return np.column_stack([self.left_side(j) for j in range(4)]) if len(self) else np.zeros((0, 4))
+
+    def area(self):
+        """ Area (spherical excess) of each quad"""
+        return self.original_angles().sum(axis=1) - 2 * np.pi
+
+    def rotate(self, number_rotations=1):
+        """ The same quads rotated (number_rotations can be one number per row), the arrays are not copied"""
+        rotated = object.__new__(QuadBatch)
+        rotated._ids, rotated._angles, rotated._sides = self._ids, self._angles, self._sides
+        rotated._rotations = (self._rotations + np.asarray(number_rotations, dtype=np.int64)) % 4
+        return rotated
+
 
 class Quad:
     """A quadrangle can be defined by four angles and the length of a side (also an angle in spherical geometry)
-    Here we define it with all the angles and all the side lengths in order not to have to compute anything """
+    Here we define it with all the angles and all the side lengths in order not to have to compute anything
+
+    The quad is a view on a row of a QuadBatch, Quad(...) makes a batch of one quad"""
+    __slots__ = ("_batch", "_row", "_rotation")
+
+    def __init__(self, id, alpha, beta, gamma, delta, a, b, c, d, rotation=0):
+        """ rotation is the number of anti clockwise rotations from the original quad (see rotate) """
+        # The values given are the ones of the rotated quad: value j is value (j + rotation) % 4 of the original one
+        shift = [(j - rotation) % 4 for j in range(4)]
+        angles, sides = [alpha, beta, gamma, delta], [a, b, c, d]
+        self._batch = QuadBatch([id], [[angles[j] for j in shift]], [[sides[j] for j in shift]], [rotation])
+        self._row = 0
+        self._rotation = rotation % 4
+
+    @classmethod
+    def _view(cls, batch, row, rotation):
+        quad = object.__new__(cls)
+        quad._batch, quad._row, quad._rotation = batch, row, rotation
+        return quad
 
-    def __init__(self, id, alpha, beta, gamma, delta, a, b, c, d):
-        self._id = id
-        self._angles = [alpha, beta, gamma, delta]
-        self._sides = [a, b, c, d]
+    def __getstate__(self):
+        return self._batch, self._row, self._rotation
+
+    def __setstate__(self, state):
+        self._batch, self._row, self._rotation = state
+
+    def _angle(self, j):
+        return self._batch._angles[4 * self._row + (j + self._rotation) % 4]
+
+    def _side(self, j):
+        return self._batch._sides[4 * self._row + (j + self._rotation) % 4]
 
     @property
     def a(self):
-        return self._sides[0]
+        return self._side(0)
 
     @property
     def b(self):
-        return self._sides[1]
+        return self._side(1)
 
     @property
     def c(self):
-        return self._sides[2]
+        return self._side(2)
 
     @property
     def d(self):
-        return self._sides[3]
+        return self._side(3)
 
     @property
     def alpha(self):
-        return self._angles[0]
+        return self._angle(0)
 
     @property
     def beta(self):
-        return self._angles[1]
+        return self._angle(1)
 
     @property
     def gamma(self):
-        return self._angles[2]
+        return self._angle(2)
 
     @property
     def delta(self):
-        return self._angles[3]
+        return self._angle(3)
 
     @property
     def id(self):
-        return self._id
+        return self._batch._ids[self._row]
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @property
+    def batch(self):
+        return self._batch
+
+    @property
+    def row(self):
+        return self._row
+
+    @property
+    def angles(self):
+        return [self._angle(j) for j in range(4)]
+
+    @property
+    def sides(self):
+        return [self._side(j) for j in range(4)]
+
+    @property
+    def original_angles(self):
+        """ The angles of the quad before any rotation"""
+        return self._batch._angles[4 * self._row: 4 * self._row + 4].tolist()
+
+    @property
+    def original_sides(self):
+        return self._batch._sides[4 * self._row: 4 * self._row + 4].tolist()
 
     def __str__(self):
         """Short string representaition of a Quad, returns only its _id value
         """
-        return f"{self._id}"
+        return f"{self.id}"
 
     def __repr__(self):
         """Long string representation of a Quad"""
-        desc = f"Quad {self._id} is an ABCD quad with " \
+        desc = f"Quad {self.id} is an ABCD quad with " \
                f"\n AB = {self.a}, BC = {self.b}, CD = {self.c}, DA = {self.d}" \
                f"\n and DAB = {self.alpha}, ABC = {self.beta}, BCD = {self.gamma}, CDA = {self.delta}"
         return desc
 
     def rotate(self, number_rotations=1):
         """ Rotates the quad in the anti clock wise direction
-        ABCD.rotate(1) -> BCDA """
-        ang = self._angles
-        cot = self._sides
-        number_rotations = -number_rotations
-        n_rot = number_rotations%4
-        n_rot = 4-n_rot
-        ang = ang[n_rot:] + ang[:n_rot]
-        cot = cot[n_rot:] + cot[:n_rot]
-        return Quad(self._id, ang[0], ang[1], ang[2], ang[3], cot[0], cot[1], cot[2], cot[3])
+        ABCD.rotate(1) -> BCDA
+        The rotated quad is a view on the same row of the batch"""
+        return Quad._view(self._batch, self._row, (self._rotation + number_rotations) % 4)
 
     def cote_gauche(self, ang):
-        if ang == "alpha":
-            return self._sides[0]
-        if ang == "beta":
-            return self._sides[1]
-        if ang == "gamma":
-            return self._sides[2]
-        if ang == "delta":
-            return self._sides[3]
+        """ ang is a corner name ("alpha"...) or code (ALPHA...)"""
+        return self._side(_code(ang))
 
     def cote_droite(self, ang):
-        if ang == "alpha":
-            return self._sides[3]
-        if ang == "beta":
-            return self._sides[0]
-        if ang == "gamma":
-            return self._sides[1]
-        if ang == "delta":
-            return self._sides[2]
+        return self._side(_code(ang) - 1)
 
     def angle(self, ang):
-        if ang == "alpha":
-            return self._angles[0]
-        if ang == "beta":
-            return self._angles[1]
-        if ang == "gamma":
-            return self._angles[2]
-        if ang == "delta":
-            return self._angles[3]
-
+        return self._angle(_code(ang))
 
     def area(self):
         return self.alpha + self.beta + self.gamma + self.delta - 2 * np.pi
-
-
-
@@ -0,0 +1,194 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Scheduler
+# Which side of the boundary the search puts its next quad on. Every side of the boundary of a closed paving
+# is covered by a quad, so it is enough to try all the quads on one side: the side with the fewest quads
+# that fit gives the smallest number of children (a side where nothing fits ends the branch at once).
+# This needs every one of these quads to be added as it is in the paving: add_quad only joins a side of the quad
+# to a side of the boundary when the fan of their point is full, so a quad whose free corner falls on a point
+# of the boundary (the boundary then touches itself there) gets a new point instead, and the pavings behind it
+# are out of reach. A side is only chosen when none of its quads does that (the points are placed on the sphere,
+# see Embedding), if every side has such a quad, every quad is tried on every side.
+# The sides are kept in a heap whose entries are checked when they come on top (lazy invalidation),
+# only the sides next to the quads added or removed since the last choice are pushed again.
+# This is only true of closed pavings: a paving covering 80% of the sphere may leave the chosen side uncovered,
+# so the searches for such pavings try every side, asking them for another policy is an error (see policy_for)
+# --------------------------------------------------------- #
+
+import heapq
+
+from numpy import pi
+
+import PavingGraph as pg
+import Tolerance as tl
+from Bounds import WHOLE_SPHERE
+from Embedding import embed
+from QuadIndex import QuadIndex
+
+POLICIES = ("constrained", "smallest gap", "largest gap", "random", "list")
+
+
+def policy_for(policy, seuil):
+    """ The policy (name or Scheduler) of a complete search for pavings covering more than seuil:
+    None gives "constrained" for closed pavings and "list" otherwise.
+    The policies that try a single side only give every closed paving,
+    asking for one of them with seuil below the whole sphere raises a ValueError"""
+    if policy is None:
+        return "constrained" if seuil >= WHOLE_SPHERE else "list"
+    name = policy.policy if isinstance(policy, Scheduler) else policy
+    if name != "list" and seuil < WHOLE_SPHERE:
+        raise ValueError(f"the policy {name!r} only gives closed pavings, "
+                         "use the policy 'list' for pavings covering part of the sphere")
+    return policy
+
+
+class Scheduler:
+    """ The children of a paving for the search: the (vertex id, quad) pairs to try, in a fixed order
+
+    policy is one of
+    "constrained": the side with the fewest quads that fit, then with the smallest angle left at its points,
+    "smallest gap", "largest gap": the side with the smallest (largest) angle left at one of its points,
+    "random": a side drawn from the seed, the side and the paving (the same paving always gets the same side),
+    "list": every quad on every side, in the order of the vertices (as QuadIndex.placements).
+    The other policies skip the sides where a quad would make the boundary touch itself at a point,
+    and try every quad on every side when there is no other side.
+    Only "list" gives every paving covering more than seuil, the others give every closed paving.
+    The ties are broken by the vertex id, so the children only depend on the paving"""
+
+    def __init__(self, quadrangles=None, policy="constrained", seed=0, index=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}, expected one of {POLICIES}")
+        self.index = QuadIndex(quadrangles) if index is None else index
+        self.policy, self.seed = policy, seed
+        self._graphe = None
+        self._faces = []
+        self._heap = []
+        self._candidates = {} # quads that fit on a side, by (length, angles left at its two points)
+
+    def __getstate__(self):
+        """ The heap refers to a paving, only the settings are pickled"""
+        return {"index": self.index, "policy": self.policy, "seed": self.seed}
+
+    def __setstate__(self, state):
+        self.__init__(policy=state["policy"], seed=state["seed"], index=state["index"])
+
+    def _state(self, vertex):
+        """ Length of the side and angles left at its two points: the quads that fit only depend on this"""
+        graphe = self._graphe
+        s_point, s_angle = graphe._s_point, graphe._s_angle
+        return (graphe._v_length[vertex], 2 * pi - s_angle[s_point[graphe._v_sub0[vertex]]],
+                2 * pi - s_angle[s_point[graphe._v_sub1[vertex]]])
+
+    def candidates(self, state):
+        found = self._candidates.get(state)
+        if found is None:
+            if len(self._candidates) > 1 << 16:
+                self._candidates.clear()
+            found = self._candidates[state] = self.index.candidates(*state)
+        return found
+
+    def _priority(self, vertex, state):
+        _, first, second = state
+        policy = self.policy
+        if policy == "constrained":
+            return len(self.candidates(state)), min(first, second)
+        if policy == "smallest gap":
+            return min(first, second), len(self.candidates(state))
+        if policy == "largest gap":
+            return -max(first, second), len(self.candidates(state))
+        return hash((self.seed, vertex) + state),
+
+    def _exterior(self, vertex):
+        graphe = self._graphe
+        return (vertex < graphe._vert.rows and graphe._v_used[vertex] and
+                graphe._s_out[graphe._v_sub0[vertex]] == pg.NONE)
+
+    def _push(self, vertex):
+        if self._exterior(vertex):
+            state = self._state(vertex)
+            heapq.heappush(self._heap, (self._priority(vertex, state), vertex, state))
+
+    def _touch(self, face):
+        """ Pushes again the sides of a quad added or removed, and the sides of the boundary next to its corners"""
+        graphe = self._graphe
+        v_used, sub0, sub1, parent = graphe._v_used, graphe._v_sub0, graphe._v_sub1, graphe._s_parent
+        s_point, s_first, s_last = graphe._s_point, graphe._s_first, graphe._s_last
+        for vertex in face[1]:
+            if vertex >= graphe._vert.rows or not v_used[vertex]:
+                continue
+            self._push(vertex)
+            for subv in (sub0[vertex], sub1[vertex]):
+                point = s_point[subv]
+                self._push(parent[s_first[point]])
+                self._push(parent[s_last[point]])
+
+    def _rebuild(self, graphe):
+        self._graphe = graphe
+        self._faces = list(graphe._faces)
+        self._heap = []
+        for vertex in graphe.exterior_vertices():
+            self._push(vertex.id)
+
+    def _sync(self, graphe):
+        """ Brings the heap up to date with the paving: the quads removed and added since the last call
+        are found by comparing the lists of faces (the search adds and removes the last quads only)"""
+        if graphe is not self._graphe or len(self._heap) > 64 * (len(graphe._faces) + 4):
+            self._rebuild(graphe)
+            return
+        old, faces = self._faces, graphe._faces
+        k, n = 0, min(len(old), len(faces))
+        while k < n and old[k] is faces[k]:
+            k += 1
+        for face in old[k:] + faces[k:]:
+            self._touch(face)
+        self._faces = list(faces)
+
+    def choose(self, graphe):
+        """ The side (vertex id) to put the next quad on and its state, None if the paving is closed"""
+        self._sync(graphe)
+        heap = self._heap
+        while heap:
+            _, vertex, state = heap[0]
+            if self._exterior(vertex) and self._state(vertex) == state:
+                return vertex, state
+            heapq.heappop(heap)
+        return None
+
+    def placements(self, graphe):
+        """ The (vertex id, quad) pairs to try from a paving"""
+        if self.policy == "list":
+            return self.index.placements(graphe)
+        if self.choose(graphe) is None:
+            return []
+        tried = set()
+        for _, vertex, state in sorted(self._heap):
+            if (vertex, state) in tried or not self._exterior(vertex) or self._state(vertex) != state:
+                continue
+            tried.add((vertex, state))
+            quads = self.candidates(state)
+            if not self._touches(graphe, vertex, quads):
+                return [(vertex, quad) for quad in quads]
+        return self.index.placements(graphe)
+
+    def _touches(self, graphe, vertex, quads):
+        """ Whether one of the quads put on the side makes two points of the paving meet
+        (the paving is given back as it was, the refusals of add_quad are not counted)"""
+        eps = tl.policy.length
+        before = None
+        rejects, graphe.rejects = graphe.rejects, None
+        try:
+            for quad in quads:
+                checkpoint = graphe.checkpoint()
+                if not graphe.add_quad(quad, vertex):
+                    continue
+                after = embed(graphe).meetings(eps)
+                graphe.rollback(checkpoint)
+                if before is None:
+                    before = embed(graphe).meetings(eps)
+                if after > before:
+                    return True
+        finally:
+            graphe.rejects = rejects
+        return False
@@ -0,0 +1,255 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Serialization
+# Binary files of pavings: a file is a header followed by records, one record per paving.
+# A record is a small JSON description followed by the columns of the graph and the quads as flat arrays,
+# so that a file can be read with a memory map without reading the whole of it.
+# The offsets of the records are kept next to the file (path + ".idx") to append pavings and find them quickly
+# --------------------------------------------------------- #
+
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+import PavingGraph as pg
+import Quadrangle as qd
+
+MAGIC = b"PAVGRAPH"
+VERSION = 1
+_HEADER = struct.Struct("<8sII") # magic, version, reserved
+_LENGTH = struct.Struct("<Q") # length of a record
+_META = struct.Struct("<4sI") # tag and length of the JSON description of a record
+TAG = b"PAVR"
+
+TABLES = ["vert", "subv", "edge"]
+
+
+def _pad(n):
+    return -n % 8
+
+
+def _arrays(graphe):
+    """ The flat arrays of a paving: the columns of its tables, its quads and its faces"""
+    arrays = {}
+    for table in TABLES:
+        t = getattr(graphe, "_" + table)
+        for name in t.columns():
+            arrays[f"{table}.{name}"] = t.numpy(name)
+    rows, ids, angles, sides = {}, [], [], []
+    for quad, _ in graphe._faces:
+        key = (id(quad.batch), quad.row)
+        if key not in rows:
+            rows[key] = len(ids)
+            ids.append(quad.id)
+            angles.append(quad.original_angles)
+            sides.append(quad.original_sides)
+    arrays["quad.angles"] = np.array(angles, dtype=np.float64).reshape(-1, 4)
+    arrays["quad.sides"] = np.array(sides, dtype=np.float64).reshape(-1, 4)
+    arrays["face.quad"] = np.array([rows[(id(quad.batch), quad.row)] for quad, _ in graphe._faces], dtype=np.int32)
+    arrays["face.rotation"] = np.array([quad.rotation for quad, _ in graphe._faces], dtype=np.int8)
+    arrays["face.sides"] = np.array([sides for _, sides in graphe._faces], dtype=np.int32).reshape(-1, 4)
+    return arrays, ids
+
+
+def dumps(graphe, info=None):
+    """ The record of a paving, as bytes. info is anything JSON can write, kept with the paving
+    The quad ids have to be written by JSON too (strings or numbers)"""
+    arrays, ids = _arrays(graphe)
+    description = {"version": VERSION, "validate": graphe._validate, "quad_ids": ids, "info": info,
+                   "arrays": [[name, a.dtype.str, list(a.shape)] for name, a in arrays.items()]}
+    meta = json.dumps(description).encode()
+    parts = [_META.pack(TAG, len(meta)), meta, bytes(_pad(_META.size + len(meta)))]
+    for a in arrays.values():
+        data = np.ascontiguousarray(a).tobytes()
+        parts += [data, bytes(_pad(len(data)))]
+    return b"".join(parts)
+
+
+def _description(buffer, offset=0):
+    """ The JSON description of the record at offset, and where it ends"""
+    tag, n = _META.unpack_from(buffer, offset)
+    if tag != TAG:
+        raise ValueError("not a paving record")
+    start = offset + _META.size
+    description = json.loads(bytes(buffer[start:start + n]))
+    if description["version"] > VERSION:
+        raise ValueError(f"paving written by a newer version ({description['version']} > {VERSION})")
+    return description, start + n
+
+
+def _read(buffer, offset=0):
+    """ The description and the arrays (views on buffer, not copies) of the record at offset"""
+    description, end = _description(buffer, offset)
+    position = end + _pad(end - offset)
+    arrays = {}
+    for name, dtype, shape in description["arrays"]:
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=position).reshape(shape)
+        size = count * np.dtype(dtype).itemsize
+        position += size + _pad(size)
+    return description, arrays
+
+
+def _graph(description, arrays):
+    graphe = pg.PavingGraph(validate=description["validate"])
+    for table in TABLES:
+        t = getattr(graphe, "_" + table)
+        t.restore({name: arrays[f"{table}.{name}"] for name in t.columns()})
+    batch = qd.QuadBatch(description["quad_ids"], arrays["quad.angles"], arrays["quad.sides"])
+    graphe._faces = [[batch.quad(int(q), int(rotation)), [int(v) for v in sides]] for q, rotation, sides in
+                     zip(arrays["face.quad"], arrays["face.rotation"], arrays["face.sides"])]
+    return graphe
+
+
+def loads(data):
+    """ The paving of a record made by dumps, or of a pickled paving"""
+    if data[:len(TAG)] != TAG:
+        return pickle.loads(data)
+    return _graph(*_read(memoryview(data)))
+
+
+def _write_header(file):
+    file.write(_HEADER.pack(MAGIC, VERSION, 0))
+
+
+def _index_path(path):
+    return path + ".idx"
+
+
+def append(path, graphe, info=None):
+    """ Adds a paving at the end of the file (created if needed), returns its number in the file"""
+    return append_many(path, [(graphe, info)])[0]
+
+
+def append_many(path, pavings):
+    """ Adds (paving, info) pairs at the end of the file, returns their numbers in the file"""
+    offsets = list(_index(path)) if os.path.exists(path) else []
+    with open(path, "ab") as file:
+        if file.tell() == 0:
+            _write_header(file)
+        new = []
+        for graphe, info in pavings:
+            record = dumps(graphe, info)
+            new.append(file.tell())
+            file.write(_LENGTH.pack(len(record)))
+            file.write(record)
+    with open(_index_path(path), "ab") as index:
+        index.write(np.array(new, dtype=np.int64).tobytes())
+    return list(range(len(offsets), len(offsets) + len(new)))
+
+
+def save(path, graphe, info=None):
+    """ Writes a file with this paving only"""
+    save_many(path, [(graphe, info)])
+
+
+def load(path, i=0):
+    return PavingFile(path)[i]
+
+
+def _index(path):
+    """ The offsets of the records of a file, read from its index, or found again (and written) if the index
+    is missing or does not match the file"""
+    size = os.path.getsize(path)
+    name = _index_path(path)
+    if os.path.exists(name):
+        offsets = np.fromfile(name, dtype=np.int64)
+        if len(offsets) == 0 and size == _HEADER.size:
+            return offsets
+        if len(offsets):
+            with open(path, "rb") as file:
+                file.seek(offsets[-1])
+                (n,) = _LENGTH.unpack(file.read(_LENGTH.size))
+            if offsets[-1] + _LENGTH.size + n == size:
+                return offsets
+    offsets = []
+    with open(path, "rb") as file:
+        magic, version, _ = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a paving file")
+        position = _HEADER.size
+        while position < size:
+            offsets.append(position)
+            file.seek(position)
+            (n,) = _LENGTH.unpack(file.read(_LENGTH.size))
+            position += _LENGTH.size + n
+    offsets = np.array(offsets, dtype=np.int64)
+    offsets.tofile(name)
+    return offsets
+
+
+class PavingFile:
+    """ The pavings of a file, read through a memory map: only the records used are read"""
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = _index(path)
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, _ = _HEADER.unpack(self._map[:_HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a paving file")
+        if version > VERSION:
+            raise ValueError(f"{path} was written by a newer version ({version} > {VERSION})")
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def raw(self, i):
+        """ The bytes of record i (see loads)"""
+        start = int(self._offsets[i])
+        (n,) = _LENGTH.unpack(self._map[start:start + _LENGTH.size].tobytes())
+        return self._map[start + _LENGTH.size:start + _LENGTH.size + n].tobytes()
+
+    def record(self, i):
+        """ The description and the arrays of paving i, the arrays are read only views on the file"""
+        return _read(self._map, int(self._offsets[i]) + _LENGTH.size)
+
+    def info(self, i):
+        return self.record(i)[0]["info"]
+
+    def arrays(self, i):
+        return self.record(i)[1]
+
+    def __getitem__(self, i):
+        return _graph(*self.record(i))
+
+
+def save_checkpoint(path, search):
+    """ Saves the frontier of a PavingSearch, one record per subproblem (its key, area and first child in info),
+    and the pavings already seen (pickled in path + ".seen")"""
+    frontier = search.frontier()
+    with open(path + ".seen", "wb") as file:
+        pickle.dump(search.deja_vus, file, protocol=pickle.HIGHEST_PROTOCOL)
+    save_many(path, [(loads(data), {"key": list(key), "aire": aire, "start": start})
+                     for key, data, aire, start in frontier])
+
+
+def save_many(path, pavings):
+    """ Writes a file with these (paving, info) pairs only"""
+    for name in (path, _index_path(path)):
+        if os.path.exists(name):
+            os.remove(name)
+    append_many(path, pavings)
+
+
+def load_checkpoint(path, quadrangles, **options):
+    """ The PavingSearch saved by save_checkpoint, the options (max_depth, seuil...) are given again.
+    Only the descriptions of the records are read, each paving is read when the search gets to it"""
+    from PavingSearch import PavingSearch # PavingSearch imports this module
+    pavings = PavingFile(path)
+    frontier = []
+    for i in range(len(pavings)):
+        data = pavings.raw(i)
+        info = _description(data)[0]["info"]
+        frontier.append((tuple(info["key"]), data, info["aire"], info["start"]))
+    with open(path + ".seen", "rb") as file:
+        deja_vus = pickle.load(file)
+    return PavingSearch(quadrangles, frontier=frontier, deja_vus=deja_vus, **options)
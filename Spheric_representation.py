@@ -4,20 +4,68 @@
 #
 # Spheric representation
 # We use this to represent points on our sphere and plot spheres
+# The meshes are only computed when they are asked for, and the last ones are kept
 # --------------------------------------------------------- #
 
+from functools import lru_cache
+
 import numpy as np
 
-# Create a sphere
 r = 1.0
 pi = np.pi
 cos = np.cos
 sin = np.sin
-phi, theta = np.mgrid[0:pi:101j, 0:2 * pi:101j]
 
-x = r*sin(phi)*cos(theta)
-y = r*sin(phi)*sin(theta)
-z = r*cos(phi)
 
+def _read_only(*arrays):
+    for a in arrays:
+        a.setflags(write=False)
+    return arrays
+
+
+@lru_cache(maxsize=8)
+def angle_grid(resolution=101, dtype=np.float64):
+    """ phi (from 0 to pi) and theta (from 0 to 2pi) on a resolution x resolution grid"""
+    phi, theta = np.mgrid[0:pi:resolution * 1j, 0:2 * pi:resolution * 1j]
+    return _read_only(phi.astype(dtype, copy=False), theta.astype(dtype, copy=False))
+
+
+@lru_cache(maxsize=8)
+def sphere_mesh(resolution=101, dtype=np.float64):
+    """ x, y, z of a sphere of radius r on a resolution x resolution grid (for plot_surface)
+    The arrays are cached, they are read only"""
+    phi, theta = angle_grid(resolution, dtype)
+    return _read_only(r * sin(phi) * cos(theta), r * sin(phi) * sin(theta), r * cos(phi))
+
+
+@lru_cache(maxsize=8)
+def icosphere(subdivisions=2, dtype=np.float64):
+    """ vertices (V, 3) and triangles (T, 3) of an icosahedron whose triangles are cut in 4,
+    subdivisions times, with the new vertices pushed onto the sphere (lighter than sphere_mesh for many plots)"""
+    t = (1 + 5 ** 0.5) / 2
+    vertices = [[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t],
+                [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]]
+    triangles = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4],
+                          [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8],
+                          [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]])
+    vertices = np.array(vertices, dtype=np.float64)
+    for _ in range(subdivisions):
+        edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+        unique, inverse = np.unique(edges, axis=0, return_inverse=True)
+        middles = len(vertices) + inverse.reshape(3, -1).T # middle of the sides 01, 12 and 20 of each triangle
+        vertices = np.concatenate([vertices, vertices[unique].mean(axis=1)])
+        a, b, c = triangles.T
+        ab, bc, ca = middles.T
+        triangles = np.concatenate([np.stack(corners, axis=1) for corners in
+                                    [(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)]])
+    vertices = r * vertices / np.linalg.norm(vertices, axis=1, keepdims=True)
+    return _read_only(vertices.astype(dtype, copy=False), triangles)
 
 
+def __getattr__(name):
+    """ phi, theta, x, y, z of the default 101 x 101 grid, computed the first time they are used"""
+    if name in ("phi", "theta"):
+        return angle_grid()[("phi", "theta").index(name)]
+    if name in ("x", "y", "z"):
+        return sphere_mesh()[("x", "y", "z").index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,74 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Tolerance
+# When two angles or two lengths are taken as equal. The policy is shared by the quads, add_quad,
+# the node enumeration, the quad index and the bounds, so that they all agree on what fits.
+# Angles close to a multiple of pi/denominator are snapped to it: the angles of the usual quads (pi/2, 2pi/3...)
+# are then counted in integer units, and the angles around a node add up to 2pi exactly
+# --------------------------------------------------------- #
+
+import math
+
+import numpy as np
+
+
+class Tolerance:
+    """ A tolerance policy
+
+    absolute: two values are equal when they differ by at most absolute
+    ulps: (instead of absolute) when they differ by at most ulps units in the last place,
+    taken at 2pi for the angles around a point and at pi for the lengths (for inputs exact up to rounding)
+    denominator, snap: an angle within snap of a multiple of pi/denominator is snapped to it (snap=None: never)
+    The tolerance has to be positive: the quad index, the fan table and the boundary signatures
+    round the values to buckets of its width"""
+
+    def __init__(self, absolute=1e-4, ulps=None, denominator=2520, snap=1e-9):
+        self.absolute, self.ulps = absolute, ulps
+        if ulps is None:
+            self.angle, self.length = absolute, absolute
+        else:
+            self.angle, self.length = ulps * math.ulp(2 * math.pi), ulps * math.ulp(math.pi)
+        if not (self.angle > 0 and self.length > 0):
+            raise ValueError(f"the tolerance has to be positive, not absolute={absolute}, ulps={ulps}")
+        self.denominator, self.snap_eps = denominator, snap
+        self.unit = math.pi / denominator # the angle of one unit
+        self.turn = 2 * denominator # 2pi, in units
+
+    def __repr__(self):
+        kind = f"ulps={self.ulps}" if self.ulps is not None else f"absolute={self.absolute}"
+        return f"Tolerance({kind}, denominator={self.denominator}, snap={self.snap_eps})"
+
+    def same_length(self, x, y):
+        return abs(x - y) <= self.length
+
+    def same_angle(self, x, y):
+        return abs(x - y) <= self.angle
+
+    def units(self, angles):
+        """ The angles in units of pi/denominator (an int64 array), None if one of them is not snapped"""
+        if self.snap_eps is None:
+            return None
+        k = np.rint(np.asarray(angles, dtype=np.float64) / self.unit)
+        if np.any(np.abs(k * self.unit - angles) > self.snap_eps):
+            return None
+        return k.astype(np.int64)
+
+    def snap(self, angles):
+        """ The angles, those within snap of a multiple of pi/denominator being replaced by the multiple"""
+        angles = np.asarray(angles, dtype=np.float64)
+        if self.snap_eps is None:
+            return angles
+        k = np.rint(angles / self.unit)
+        return np.where(np.abs(k * self.unit - angles) <= self.snap_eps, k * self.unit, angles)
+
+
+policy = Tolerance() # the policy in use, read when it is needed (use set_policy to change it)
+
+
+def set_policy(tolerance):
+    """ Uses this policy from now on (quads made before keep their snapped angles), returns the previous one"""
+    global policy
+    previous, policy = policy, tolerance
+    return previous
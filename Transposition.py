@@ -0,0 +1,88 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Transposition table
+# Pavings made in different ways often have the same boundary, and then the same future.
+# The table remembers, for a boundary (see Canonical.boundary_signature), whether the search found a complete
+# paving from it or not, so that a dead end is explored only once
+# --------------------------------------------------------- #
+
+import hashlib
+import pickle
+from collections import OrderedDict
+
+DEAD_END = "dead end"
+SOLVABLE = "solvable"
+
+
+def boundary_key(signature):
+    """ A 16 bytes digest of a boundary signature, to keep the table small"""
+    return hashlib.blake2b(repr(signature).encode(), digest_size=16).digest()
+
+
+def catalogue_key(quadrangles):
+    """ The same for the same quads (angles and sides), whatever their order"""
+    return boundary_key(sorted((tuple(round(x, 9) for x in quad.angles), tuple(round(x, 9) for x in quad.sides))
+                               for quad in quadrangles))
+
+
+class TranspositionTable:
+    """ Status (DEAD_END or SOLVABLE) of boundaries, with the number of quads that could still be added to them
+    (depth, float("inf") without a maximum depth): a dead end with depth d is also a dead end for a smaller depth.
+
+    The table keeps at most max_entries boundaries, the least recently used one is forgotten first.
+    It is tied to a context (the quads and the options of the search), it is emptied if used in another one"""
+
+    def __init__(self, max_entries=1 << 20):
+        self.max_entries = max_entries
+        self.context = None
+        self._entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, context):
+        if context != self.context:
+            self._entries.clear()
+            self.context = context
+
+    def get(self, key, depth=float("inf")):
+        """ The status of the boundary for this depth, None if it is not known"""
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] == DEAD_END and entry[1] < depth):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, status, depth=float("inf")):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == SOLVABLE or (status == DEAD_END and entry[1] >= depth):
+                self._entries.move_to_end(key)
+                return
+        self._entries[key] = (status, depth)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            pickle.dump({"context": self.context, "entries": list(self._entries.items())}, file)
+
+    @classmethod
+    def load(cls, path, max_entries=1 << 20):
+        """ The table saved at path, the most recently used boundaries are kept if there are more than max_entries"""
+        table = cls(max_entries)
+        with open(path, "rb") as file:
+            state = pickle.load(file)
+        table.context = state["context"]
+        table._entries.update(state["entries"][-max_entries:])
+        return table
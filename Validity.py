@@ -0,0 +1,119 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Validity
+# Checks that a paving is a paving of the sphere: the angles around each point add up to 2pi,
+# each side is used by two quads, the area is 4pi and V - E + F = 2.
+# check_paving reads the columns of the graph once, check_face only looks at the last quad added (for the search)
+# --------------------------------------------------------- #
+
+import numpy as np
+
+import PavingGraph as pg
+import Tolerance as tl
+
+
+class Report:
+    """ The violations found, each one is (check, id, value):
+    check is one of "angle", "open fan", "blue edge", "side use", "side length", "area", "euler",
+    id is the id of the point, subvertex, edge, vertex or face concerned (None for the whole paving)
+    and value the value found (angle, number of quads...)"""
+
+    def __init__(self):
+        self.violations = []
+        self.counts = {} # number of points, sides and faces, area, euler characteristic
+
+    @property
+    def ok(self):
+        return not self.violations
+
+    def add(self, check, id, value):
+        self.violations.append((check, id, value))
+
+    def checks(self):
+        """ The checks that failed"""
+        return sorted({check for check, _, _ in self.violations})
+
+    def __repr__(self):
+        if self.ok:
+            return f"Valid paving {self.counts}"
+        return f"Invalid paving {self.counts}: " + ", ".join(f"{check} {id} ({value})"
+                                                             for check, id, value in self.violations[:20])
+
+
+def _tolerances(eps):
+    """ The angle and length tolerances: eps for both if it is given, else those of the policy (see Tolerance)"""
+    return (tl.policy.angle, tl.policy.length) if eps is None else (eps, eps)
+
+
+def check_paving(graphe, closed=True, eps=None):
+    """ Checks a paving, in linear time
+
+    closed=True checks a finished paving of the sphere,
+    closed=False a paving being built: angles at most 2pi, sides used at most twice, area at most 4pi"""
+    report = Report()
+    eps, eps_length = _tolerances(eps)
+    subv_used = graphe._subv.numpy("used") == 1
+    points = graphe.fan_labels()
+
+    # Angles around each point, added along the blue edges
+    edge_used = graphe._edge.numpy("used") == 1
+    blue = np.flatnonzero(edge_used & (graphe._edge.numpy("color") == pg.BLUE))
+    sub0, sub1 = graphe._edge.numpy("sub0")[blue], graphe._edge.numpy("sub1")[blue]
+    for e in blue[points[sub0] != points[sub1]]:
+        report.add("blue edge", int(e), None)
+    angles = np.bincount(points[sub0], weights=graphe._edge.numpy("weight")[blue], minlength=len(points))
+    point_ids = np.unique(points[subv_used])
+    closed_fans = graphe._subv.numpy("closed") == 1
+    for p in point_ids:
+        if angles[p] > 2 * np.pi + eps or ((closed or closed_fans[p]) and angles[p] < 2 * np.pi - eps):
+            report.add("angle", int(p), float(angles[p]))
+    if closed:
+        open_subv = subv_used & ((graphe._subv.numpy("in_edge") == pg.NONE) | (graphe._subv.numpy("out_edge") == pg.NONE))
+        for s in np.flatnonzero(open_subv):
+            report.add("open fan", int(s), None)
+
+    # Sides: each one is used by two quads, with the length of the quad side
+    vert_used = graphe._vert.numpy("used") == 1
+    lengths = graphe._vert.numpy("length")
+    faces = graphe._faces
+    face_vertices = np.array([sides for _, sides in faces], dtype=np.int64).reshape(-1, 4)
+    face_sides = np.array([quad.sides for quad, _ in faces], dtype=np.float64).reshape(-1, 4)
+    uses = np.bincount(face_vertices.ravel(), minlength=len(vert_used))
+    for v in np.flatnonzero(vert_used & ((uses != 2) if closed else (uses > 2))):
+        report.add("side use", int(v), int(uses[v]))
+    for f in np.flatnonzero((np.abs(lengths[face_vertices] - face_sides) > eps_length).any(axis=1)):
+        report.add("side length", int(f), None)
+
+    area = sum(quad.area() for quad, _ in faces)
+    if area > 4 * np.pi + eps or (closed and area < 4 * np.pi - eps):
+        report.add("area", None, area)
+    V, E, F = len(point_ids), int(vert_used.sum()), len(faces)
+    if closed and V - E + F != 2:
+        report.add("euler", None, V - E + F)
+    report.counts = {"points": V, "sides": E, "faces": F, "area": area, "euler": V - E + F}
+    return report
+
+
+def check_face(graphe, face=-1, aire=None, eps=None):
+    """ Checks what the quad face (the last one by default) changed: the angles around its four corners,
+    the lengths of its sides and the area (aire, if given), in constant time.
+    Fails as soon as a paving being built cannot be a part of a paving of the sphere"""
+    report = Report()
+    eps, eps_length = _tolerances(eps)
+    quad, sides = graphe._faces[face]
+    length, sub0, sub1 = graphe._v_length, graphe._v_sub0, graphe._v_sub1
+    s_point, s_angle, s_closed = graphe._s_point, graphe._s_angle, graphe._s_closed
+    for side, vertex in zip(quad.sides, sides):
+        if abs(length[vertex] - side) > eps_length:
+            report.add("side length", vertex, length[vertex])
+        for subv in (sub0[vertex], sub1[vertex]):
+            p = s_point[subv]
+            angle = s_angle[p]
+            if angle > 2 * np.pi + eps or (s_closed[p] and angle < 2 * np.pi - eps) or \
+                    (not s_closed[p] and angle >= 2 * np.pi - eps):
+                report.add("angle", p, angle)
+    if aire is not None and aire > 4 * np.pi + eps:
+        report.add("area", None, aire)
+    return report
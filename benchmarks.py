@@ -0,0 +1,282 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Benchmarks
+# Run with: python benchmarks.py [--json results.json] [--compare old.json] [--quick]
+# Every catalogue is built from fixed values or a fixed seed, so that two runs time the same work
+# --------------------------------------------------------- #
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+
+import numpy as np
+
+import PavingGraph as pg
+import Quadrangle as qd
+from IdPool import IdPool
+
+
+class DictRegistry:
+    """ The id registry PavingGraph used before IdPool: a dict of booleans and a forward scan for the next id"""
+
+    def __init__(self):
+        self._used_ids = {}
+        self._next_id = 0
+
+    def allocate(self):
+        id = self._next_id
+        self._used_ids[id] = True
+        self._next_id += 1
+        while self._used_ids.get(self._next_id, False):
+            self._next_id += 1
+        return id
+
+    def release(self, id):
+        self._used_ids[id] = False
+        self._next_id = min(id, self._next_id)
+
+
+def churn(registry, n_live=10000, n_ops=20000, seed=0):
+    """ Fills the registry, then releases a random id and allocates one again n_ops times"""
+    rnd = random.Random(seed)
+    live = [registry.allocate() for _ in range(n_live)]
+    for _ in range(n_ops):
+        i = rnd.randrange(len(live))
+        registry.release(live[i])
+        live[i] = registry.allocate()
+
+
+def bench(stmt, number, repeat=5):
+    """ Best time of one call, in microseconds"""
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6
+
+
+# Catalogues
+
+def square_rectangle():
+    """ The square and the rectangle of main.py"""
+    return [qd.Quad("carré", np.pi/2, np.pi/2, np.pi/2, np.pi/2, 1, 1, 1, 1),
+            qd.Quad("rectangle", np.pi/2, np.pi/2, np.pi/2, np.pi/2, 1, 2, 1, 2)]
+
+
+def cube():
+    """ The face of the cube projected on the sphere"""
+    c = np.arccos(1 / 3)
+    return [qd.Quad("cube", 2 * np.pi / 3, 2 * np.pi / 3, 2 * np.pi / 3, 2 * np.pi / 3, c, c, c, c)]
+
+
+def spherical_quad(id, points):
+    """ The quad whose corners A, B, C, D are the given points of the sphere (in the direct order)"""
+    points = [np.asarray(p, dtype=np.float64) / np.linalg.norm(p) for p in points]
+    sides = [np.arccos(np.clip(points[k] @ points[(k + 1) % 4], -1, 1)) for k in range(4)]
+    angles = []
+    for k in range(4):
+        p, before, after = points[k], points[k - 1], points[(k + 1) % 4]
+        t1, t2 = after - (after @ p) * p, before - (before @ p) * p
+        angles.append(np.arccos(np.clip(t1 @ t2 / np.linalg.norm(t1) / np.linalg.norm(t2), -1, 1)))
+    return qd.Quad(id, *angles, *sides)
+
+
+def is_convex(quad):
+    """ The angles are between 0 and pi and add up to more than 2pi (the area is positive)"""
+    return all(0 < angle < np.pi for angle in quad.angles) and quad.area() > 0
+
+
+def kite(id, p, q, r):
+    """ The spherical kite A, B, C, D with the angles 2pi/p at A, 2pi/q at C and 2pi/r at B and D
+    (AB = DA, BC = CD): it is the triangle of angles pi/p, 2pi/r, pi/q and its mirror image along AC,
+    None if there is no such triangle"""
+    a, b, c = np.pi / p, 2 * np.pi / r, np.pi / q
+    if a + b + c <= np.pi or b >= np.pi:
+        return None
+    ab = np.arccos((np.cos(c) + np.cos(a) * np.cos(b)) / (np.sin(a) * np.sin(b)))
+    bc = np.arccos((np.cos(a) + np.cos(b) * np.cos(c)) / (np.sin(b) * np.sin(c)))
+    return qd.Quad(id, 2 * a, b, 2 * c, b, ab, bc, bc, ab)
+
+
+def random_quads(n=6, seed=0, valences=(3, 4, 5, 6)):
+    """ n random convex spherical quads that meet: kites (see kite) whose angles are 2pi/k, k drawn among
+    the valences (drawn again until the kite exists), quad i having an angle 2pi/valences[i % len(valences)].
+    Around a point the corners of the same angle of a kite meet, so there are nodes of every valence"""
+    rng = np.random.default_rng(seed)
+    quads = []
+    while len(quads) < n:
+        p = valences[len(quads) % len(valences)]
+        q, r = rng.choice(valences, 2)
+        quad = kite(f"random {len(quads)}", p, q, r)
+        if quad is not None:
+            quads.append(quad.rotate(int(rng.integers(4))))
+    return quads
+
+
+CATALOGUES = {"square and rectangle": square_rectangle, "cube": cube, "random": random_quads}
+
+
+# Benchmarks
+
+def bench_id_pool():
+    results = {}
+    for name, cls in [("dict registry", DictRegistry), ("IdPool", IdPool)]:
+        results[name + " churn, 10k live 20k ops (us)"] = bench(lambda: churn(cls()), 1, repeat=1)
+
+    pool = IdPool()
+    results["IdPool allocate + release (us)"] = bench(lambda: pool.release(pool.allocate()), 100000)
+    results["IdPool allocate_many(7) + release (us)"] = \
+        bench(lambda: [pool.release(id) for id in reversed(pool.allocate_many(7))], 100000)
+    return results
+
+
+def bench_nodes(valences=range(3, 7)):
+    """ possible_noeud on each catalogue"""
+    results = {}
+    for name, catalogue in CATALOGUES.items():
+        quads = catalogue()
+        for valence in valences:
+            start = time.perf_counter()
+            nodes = pg.possible_noeud(quads, valence)
+            elapsed = time.perf_counter() - start
+            number = max(1, min(100, int(0.2 / max(elapsed, 1e-6))))
+            results[f"possible_noeud {name} valence {valence} (us)"] = \
+                bench(lambda: pg.possible_noeud(quads, valence), number, repeat=3)
+            results[f"possible_noeud {name} valence {valence} (nodes)"] = len(nodes)
+    return results
+
+
+def bench_add_quad():
+    """ add_quad when the quad fits, and when it is rejected on a length or on an angle"""
+    carre, rect = square_rectangle()
+    face = cube()[0]
+    wide = qd.Quad("wide", 0.5, 5.0, 0.5, 0.5, 1, 1, 1, 1) # its angle beta cannot fit next to a square
+    results = {}
+    for name, first, quad, expected in [("success", face, face, True), ("reject length", carre, rect.rotate(1), False),
+                                        ("reject angle", carre, wide, False)]:
+        graphe = pg.PavingGraph()
+        graphe.add_first_quad(first)
+        vertex = graphe.exterior_vertices()[0].id
+        checkpoint = graphe.checkpoint()
+        assert graphe.add_quad(quad, vertex) == expected
+        graphe.rollback(checkpoint)
+
+        def add_and_rollback():
+            graphe.add_quad(quad, vertex)
+            graphe.rollback(checkpoint)
+        results[f"add_quad {name} + rollback (us)"] = bench(add_and_rollback, 10000)
+    return results
+
+
+def fan_graph(n_quads=10):
+    """ A paving where n_quads thin quads turn around one point, and the ends of the chain of that point"""
+    k = qd.Quad("k", np.pi / 6, np.pi / 2, 5 * np.pi / 6, np.pi / 2, 1, .5, .5, 1)
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(k)
+    for _ in range(n_quads):
+        for vertex in reversed(graphe.exterior_vertices()):
+            if abs(vertex.length - 1) < 1e-9 and graphe.add_quad(k.rotate(3), vertex):
+                break
+    ends = [p for vertex in graphe.exterior_vertices() for p in vertex.points]
+    return graphe, max(ends, key=lambda p: graphe.find_last_subvertex(p)[0])
+
+
+def bench_find_last():
+    graphe, end = fan_graph()
+    return {"find_last_subvertex, fan of 11 corners (us)": bench(lambda: graphe.find_last_subvertex(end), 100000),
+            "walk of the blue edges, fan of 11 corners (us)": bench(lambda: graphe._walk_last(end.id), 100000)}
+
+
+def bench_search():
+    """ construction_graphe (which stops at 80% of the sphere) and a search of a whole paving, on each catalogue
+    (0 quads when nothing is found)"""
+    from PavingSearch import PavingSearch
+
+    def first_closed(quads):
+        return next(iter(PavingSearch(quads, quads[0], seuil=4 * np.pi - 1e-6, max_results=1)), (None, False))[0]
+    results = {}
+    for name, catalogue in CATALOGUES.items():
+        quads = catalogue()
+        for search, function in [("construction_graphe", lambda: pg.construction_graphe(quads, quads[0])[0]),
+                                 ("PavingSearch first closed paving", lambda: first_closed(quads))]:
+            with contextlib.redirect_stdout(io.StringIO()): # construction_graphe prints its result
+                start = time.perf_counter()
+                graphe = function()
+                elapsed = time.perf_counter() - start
+                number = max(1, min(10, int(1 / max(elapsed, 1e-6))))
+                results[f"{search} {name} (ms)"] = bench(function, number, repeat=3) / 1000
+            results[f"{search} {name} (quads)"] = 0 if graphe is None else len(graphe._faces)
+    return results
+
+
+def bench_policies():
+    """ Pavings extended and time of the search of all the closed pavings with at most 6 quads, for each policy
+    of the Scheduler, with the cube face and a quad that looks like it but never closes"""
+    from Instrumentation import Probe
+    from PavingSearch import PavingSearch
+    from Scheduler import POLICIES
+    face = cube()[0]
+    c = np.arccos(1 / 3)
+    quads = [face, qd.Quad("odd", 2 * np.pi / 3, 2 * np.pi / 3, 2 * np.pi / 3, np.pi / 2, c, c, c, c)]
+    results = {}
+    for policy in POLICIES:
+        probe = Probe()
+        start = time.perf_counter()
+        for _ in PavingSearch(quads, face, seuil=4 * np.pi - 1e-6, max_depth=6, probe=probe, policy=policy):
+            pass
+        results[f"{policy} policy, closed pavings (ms)"] = (time.perf_counter() - start) * 1000
+        results[f"{policy} policy, closed pavings (pavings extended)"] = sum(probe.nodes.values())
+    return results
+
+
+BENCHMARKS = {"id pool": bench_id_pool, "nodes": bench_nodes, "add_quad": bench_add_quad,
+              "find_last_subvertex": bench_find_last, "search": bench_search, "policies": bench_policies}
+
+
+def environment():
+    return {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def run(names=None, quick=False):
+    """ The results of the benchmarks, {benchmark: {measure: value}}"""
+    results = {}
+    for name, function in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        if quick and name == "id pool":
+            continue
+        results[name] = function()
+    return {"environment": environment(), "results": results}
+
+
+def compare(new, old):
+    """ Prints the ratio new / old of each measure found in both runs"""
+    for group, measures in new["results"].items():
+        for name, value in measures.items():
+            before = old.get("results", {}).get(group, {}).get(name)
+            if before:
+                print(f"{name:60s} {before:12.2f} -> {value:12.2f}  x{value / before:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the paving search")
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--compare", help="compares with the results of an earlier run (a --json file)")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="runs these benchmarks only")
+    parser.add_argument("--quick", action="store_true", help="skips the slow id pool benchmark")
+    args = parser.parse_args()
+    report = run(args.only, args.quick)
+    for group, measures in report["results"].items():
+        for name, value in measures.items():
+            print(f"{name:60s} {value:12.2f}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
@@ -3,19 +3,101 @@
 #          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
 #
 # Main
+# python main.py run catalogues.json more.csv --db results.sqlite --workers 4
+# python main.py status --db results.sqlite
+# python main.py export HASH pavings.pav --db results.sqlite
+# python main.py mesh pavings.pav pavings.ply --resolution 8
+# A catalogue file is described in Batch (read_json, read_csv)
 # --------------------------------------------------------- #
-#import PavingGraph as pg
-import Quadrangle as qd
-import numpy as np
+import argparse
+import sys
 
-carre = qd.Quad("carré", np.pi/2, np.pi/2, np.pi/2, np.pi/2, 1, 1, 1, 1)
-print(carre)
-print(repr(carre))
+import Batch as bt
+import Mesh as ms
+import Serialization as se
+from Scheduler import POLICIES
 
-rect = qd.Quad("rectangle", np.pi/2, np.pi/2, np.pi/2, np.pi/2, 1, 2, 1, 2)
-print(repr(rect))
-print(repr(rect.rotate(401)))
 
-imposs = qd.Quad("Imposs", np.pi/2, np.pi/2, np.pi/2, np.pi/2, 1, 2, 3, 4)
-print(repr(imposs))
-print(repr(imposs.rotate(1)))
+def run(args):
+    bt.run_batch(args.files, args.db, workers=args.workers, valences=args.valences, coverage=args.coverage,
+                 max_results=args.max_results, max_depth=args.max_depth, budget=args.budget, policy=args.policy,
+                 force=args.force)
+
+
+def status(args):
+    store = bt.Store(args.db)
+    for name, count in sorted(store.counts().items()):
+        print(f"{name:10s} {count}")
+    for hash, name, state, seconds, explored, error in store.connection.execute(
+            "SELECT hash, name, status, seconds, explored, error FROM catalogues ORDER BY name"):
+        if args.verbose or state == "error":
+            print(f"{hash[:16]}  {name:30s} {state:10s} {seconds or 0:8.2f}s {explored or 0:8d} {error or ''}")
+    store.close()
+
+
+def export(args):
+    store = bt.Store(args.db)
+    hashes = [hash for (hash,) in store.connection.execute("SELECT hash FROM catalogues WHERE hash LIKE ?",
+                                                           (args.hash + "%",))]
+    if len(hashes) != 1:
+        sys.exit(f"{len(hashes)} catalogues start with {args.hash}")
+    pavings = store.pavings(hashes[0])
+    se.save_many(args.out, [(graphe, {"catalogue": hashes[0]}) for graphe in pavings])
+    print(f"{len(pavings)} pavings written to {args.out}")
+    store.close()
+
+
+def mesh(args):
+    n, vertices, faces = ms.export(se.PavingFile(args.pavings), args.out, resolution=args.resolution,
+                                   spacing=args.spacing, columns=args.columns, limit=args.limit)
+    print(f"{n} pavings written to {args.out} ({vertices} vertices, {faces} faces)")
+
+
+def parser():
+    main = argparse.ArgumentParser(description="Pavings of the sphere by quads")
+    commands = main.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("run", help="runs the catalogues of the files that are not done yet")
+    p.add_argument("files", nargs="+", help="JSON or CSV files of catalogues")
+    p.add_argument("--db", default="results.sqlite", help="SQLite file of the results")
+    p.add_argument("--workers", type=int, default=None, help="number of processes (all the cores by default)")
+    p.add_argument("--valences", type=int, nargs="*", default=[3, 4, 5, 6], help="valences of the nodes to count")
+    p.add_argument("--coverage", type=float, default=0.8,
+                   help="part of the sphere a paving has to cover to be kept (1 for closed pavings)")
+    p.add_argument("--max-results", type=int, default=1, help="pavings kept per catalogue")
+    p.add_argument("--max-depth", type=int, default=None, help="largest number of quads of a paving")
+    p.add_argument("--budget", type=int, default=None, help="largest number of pavings explored per catalogue")
+    p.add_argument("--policy", choices=POLICIES, default=None,
+                   help="see Scheduler, the policies other than list need --coverage 1 "
+                        "(constrained by default then, list otherwise)")
+    p.add_argument("--force", action="store_true", help="runs again the catalogues already done")
+    p.set_defaults(function=run)
+
+    p = commands.add_parser("status", help="number of catalogues of each status")
+    p.add_argument("--db", default="results.sqlite")
+    p.add_argument("-v", "--verbose", action="store_true", help="lists every catalogue")
+    p.set_defaults(function=status)
+
+    p = commands.add_parser("export", help="writes the pavings of a catalogue to a paving file (see Serialization)")
+    p.add_argument("hash", help="digest of the catalogue (or its first characters)")
+    p.add_argument("out")
+    p.add_argument("--db", default="results.sqlite")
+    p.set_defaults(function=export)
+
+    p = commands.add_parser("mesh", help="writes the pavings of a paving file to a mesh file (see Mesh)")
+    p.add_argument("pavings", help="paving file (see Serialization)")
+    p.add_argument("out", help=".ply or .obj file")
+    p.add_argument("--resolution", type=int, default=4, help="small quads along each side of a quad")
+    p.add_argument("--spacing", type=float, default=0., help="distance between the pavings (0: all on one sphere)")
+    p.add_argument("--columns", type=int, default=10, help="pavings on each row if spacing is given")
+    p.add_argument("--limit", type=int, default=None, help="largest number of pavings written")
+    p.set_defaults(function=mesh)
+    return main
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    try:
+        args.function(args)
+    except (OSError, ValueError) as error:
+        sys.exit(f"error: {error}")
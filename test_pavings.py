@@ -0,0 +1,581 @@
+# -------------------- Department Project -------------------- #
+# Authors: Eloi Trenquier (eloi.trenquier@eleves.enpc.fr)
+#          Maxim Legendre (maxim.legendre@eleves.enpc.fr)
+#
+# Tests
+# Run with: python -m pytest -q
+# --------------------------------------------------------- #
+
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import Batch as bt
+import BeamSearch
+import Canonical as cn
+import Mesh as ms
+import PavingGraph as pg
+import Quadrangle as qd
+import Serialization as se
+import Spheric_representation as sr
+import Tolerance as tl
+import Validity as vl
+from BeamSearch import beam, beam_search
+from Embedding import embed
+from Fans import FanTable
+from benchmarks import cube, is_convex, random_quads, spherical_quad, square_rectangle
+from Bounds import Bounds, fillable
+from IdPool import IdPool
+from Instrumentation import Probe
+from ParallelSearch import parallel_search
+from PavingSearch import PavingSearch
+from QuadIndex import QuadIndex
+from Scheduler import Scheduler, policy_for
+from Transposition import DEAD_END, SOLVABLE, TranspositionTable
+
+
+def odd():
+    """ The face of the cube with a right angle, it only fits with the cube face in some places"""
+    return qd.Quad("odd", 2 * np.pi / 3, 2 * np.pi / 3, 2 * np.pi / 3, np.pi / 2, *[np.arccos(1 / 3)] * 4)
+
+
+def signatures(pavings):
+    return sorted(cn.graph_signature(graphe) for graphe in pavings)
+
+
+# Quads
+
+def test_quad_batch_is_its_quads():
+    """ The vectorised queries of a batch give the values of each of its quads, rotated or not"""
+    quads = [quad.rotate(k) for k, quad in enumerate(random_quads(seed=2) + square_rectangle())]
+    batch = qd.QuadBatch.from_quads(quads)
+    for rotated, shift in ((batch, 0), (batch.rotate(1), 1), (batch.rotate(np.arange(len(quads))), None)):
+        rows = [quad.rotate(k if shift is None else shift) for k, quad in enumerate(quads)]
+        assert np.allclose(rotated.angles, [quad.angles for quad in rows])
+        assert np.allclose(rotated.sides, [quad.sides for quad in rows])
+        assert np.allclose(rotated.right_side(qd.BETA), [quad.cote_droite("beta") for quad in rows])
+        assert [rotated[i].angles for i in range(len(rows))] == [quad.angles for quad in rows]
+    assert np.allclose(batch.area(), [quad.area() for quad in quads])
+    assert batch.ids == [quad.id for quad in quads] and \
+        np.shares_memory(batch.rotate(2).original_angles(), batch.original_angles()) # rotating does not copy
+    quad = quads[0]
+    assert quad.rotate(1).angles == quad.angles[1:] + quad.angles[:1] and quad.rotate(4).angles == quad.angles
+
+
+# Node enumeration
+
+def test_possible_noeud_is_the_brute_force_enumeration():
+    def chains(nodes):
+        return Counter(tuple(cn.corner_key(quad, angle) for quad, angle in node) for node in nodes)
+    for quads in ([cube()[0], odd()], square_rectangle()):
+        for valence in range(1, 6):
+            assert chains(pg.possible_noeud(quads, valence, unique=False)) == \
+                chains(pg.possible_noeud_naif(quads, valence))
+            assert Counter(map(cn.node_signature, pg.possible_noeud(quads, valence))) == \
+                Counter(map(cn.node_signature, pg.possible_noeud_naif(quads, valence, unique=True)))
+
+
+def test_random_quads_are_convex_and_meet():
+    for seed in range(20):
+        quads = random_quads(seed=seed)
+        assert len(quads) == 6 and all(is_convex(quad) for quad in quads)
+        assert all(pg.possible_noeud(quads, valence) for valence in range(3, 7))
+
+
+# Undo log
+
+def test_rollback_gives_back_the_same_graph():
+    face = cube()[0]
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(face)
+    graphe.add_quad(face, graphe.exterior_vertices()[0].id)
+    before = (se.dumps(graphe), cn.graph_signature(graphe), cn.boundary_signature(graphe), graphe.area())
+    checkpoint = graphe.checkpoint()
+    added = 0
+    for vertex in graphe.exterior_vertices():
+        if graphe.is_exterior(vertex):
+            added += graphe.add_quad(face, vertex.id)
+    assert added
+    graphe.rollback(checkpoint)
+    assert (se.dumps(graphe), cn.graph_signature(graphe), cn.boundary_signature(graphe), graphe.area()) == before
+
+
+# Id pool
+
+def test_id_pool_gives_the_smallest_free_id():
+    rnd = random.Random(0)
+    pool, used = IdPool(), set()
+    for _ in range(2000):
+        if used and rnd.random() < 0.45:
+            id = rnd.choice(sorted(used))
+            pool.release(id)
+            used.remove(id)
+        elif rnd.random() < 0.2:
+            ids = pool.allocate_many(3)
+            assert ids == sorted(set(range(len(used) + 3)) - used)[:3]
+            used.update(ids)
+        else:
+            id = pool.allocate()
+            assert id == min(set(range(len(used) + 1)) - used)
+            used.add(id)
+        assert len(pool) == len(used)
+    assert IdPool.from_used([id in used for id in range(pool.high)]).allocate_many(5) == pool.allocate_many(5)
+
+
+def test_rolled_back_ids_are_given_again():
+    face = cube()[0]
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(face)
+    vertex = graphe.exterior_vertices()[0].id
+    checkpoint = graphe.checkpoint()
+    graphe.add_quad(face, vertex)
+    added = [vertex.id for vertex in graphe.vertices]
+    graphe.rollback(checkpoint)
+    graphe.add_quad(face, vertex)
+    assert [vertex.id for vertex in graphe.vertices] == added
+
+
+# Fan cache
+
+def test_fan_cache_is_the_walk_along_the_chain():
+    """ Every fan lookup of a search is checked against a walk (validate=True), and so are all the chain ends"""
+    quads = [cube()[0], odd()]
+    graphe = pg.PavingGraph(validate=True)
+    graphe.add_first_quad(quads[0])
+    for _ in range(6):
+        for vertex in graphe.exterior_vertices():
+            if graphe.is_exterior(vertex) and any(graphe.add_quad(quad, vertex.id) for quad in quads):
+                break
+        checkpoint = graphe.checkpoint()
+        for vertex in graphe.exterior_vertices():
+            for quad in quads:
+                if graphe.is_exterior(vertex) and graphe.add_quad(quad, vertex.id):
+                    break
+        graphe.rollback(checkpoint)
+        for subv in range(graphe._subv.rows):
+            if graphe._s_used[subv] and (graphe._s_in[subv] == pg.NONE or graphe._s_out[subv] == pg.NONE):
+                angle, last = graphe._walk_last(subv)
+                assert graphe._find_last(subv) == (pytest.approx(angle), last)
+    assert len(graphe._faces) > 4
+
+
+# Sparse adjacency
+
+def test_sparse_adjacency_is_the_dense_matrix():
+    face = cube()[0]
+    graphe = next(graphe for graphe, _ in PavingSearch([face], face, seuil=4 * np.pi, max_results=1))
+    N = graphe._subv.rows
+    indptr, indices, data = graphe.adjacency_csr()
+    dense = np.zeros((N, N))
+    for i in range(N):
+        dense[i, indices[indptr[i]:indptr[i + 1]]] = data[indptr[i]:indptr[i + 1]]
+    assert np.array_equal(dense, graphe.total_adjacency_mat()) and dense.sum() == len(indices)
+    blue = graphe.connected_components(color="blue")
+    labels = graphe.fan_labels()
+    assert len(set(blue[blue >= 0])) == 8 and len(set(zip(blue, labels))) == len(set(labels)) # the 8 corners
+
+
+# Canonical
+
+def test_cube_has_one_signature():
+    """ All the closed pavings with the face of the cube are the cube, whatever the side each face is entered from"""
+    face = cube()[0]
+    found = PavingSearch([face], face, seuil=4 * np.pi, max_depth=6, policy="list")
+    closed = [graphe for graphe, _ in found if not graphe.exterior_vertices()]
+    assert closed and all(vl.check_paving(graphe).ok for graphe in closed)
+    assert len({cn.graph_signature(graphe) for graphe in closed}) == 1
+
+
+def test_rotation_period():
+    c = np.arccos(1 / 3)
+    rectangle = qd.Quad("rectangle", np.pi / 2, np.pi / 2, np.pi / 2, np.pi / 2, 1, 2, 1, 2)
+    kite = qd.Quad("kite", 1., 2., 1., 2.5, c, c, 1., 1.)
+    assert [cn.rotation_period(quad.rotate(k)) for quad in (cube()[0], rectangle, kite) for k in (0, 1)] == \
+        [1, 1, 2, 2, 4, 4]
+
+
+def test_quads_are_not_told_apart_by_their_ids():
+    """ Two different quads with the same id are still two quads, and ids of different types are not compared"""
+    face, other = cube()[0], odd()
+    renamed = qd.Quad("cube", *other.angles, *other.sides)
+    for valence in (3, 4):
+        assert len(pg.possible_noeud([face, renamed], valence)) == len(pg.possible_noeud([face, other], valence))
+    numbered = qd.Quad(1, *face.angles, *face.sides)
+    seuil = 0.3 * 4 * np.pi
+    assert signatures(graphe for graphe, _ in PavingSearch([numbered, other], numbered, seuil=seuil)) == \
+        signatures(graphe for graphe, _ in PavingSearch([face, other], face, seuil=seuil))
+
+
+def test_signature_does_not_depend_on_the_order_of_the_quads():
+    """ The pavings made of a cube face and an odd quad are the same whichever of them is put first,
+    and whatever the rotation of the first one"""
+    face, other = cube()[0], odd()
+
+    def pairs(first):
+        return {cn.graph_signature(graphe) for graphe, _ in
+                PavingSearch([face, other], first, seuil=4 * np.pi, max_depth=2, partial=True, policy="list")
+                if len({quad.id for quad, _ in graphe._faces}) == 2}
+    assert pairs(face) and pairs(face) == pairs(other) == pairs(other.rotate(1)) == pairs(face.rotate(3))
+
+
+# Quad index
+
+def test_quad_index_is_the_brute_force_lookup():
+    quads = random_quads(seed=1) + cube()
+    index = QuadIndex(quads)
+    rnd = random.Random(0)
+    eps, found = tl.policy.length, 0
+    for _ in range(300):
+        quad = rnd.choice(index.quads)
+        length = quad.a + rnd.choice([0, eps / 2, -eps / 2, 2 * eps])
+        gaps = rnd.uniform(0, 2 * np.pi), rnd.choice([quad.alpha, rnd.uniform(0, 2 * np.pi)])
+        candidates = index.candidates(length, *gaps)
+        assert candidates == [q for q in index.quads if abs(q.a - length) <= eps and
+                              q.beta <= gaps[0] + eps and q.alpha <= gaps[1] + eps]
+        found += len(candidates)
+    assert found > 100
+
+
+# Scheduler
+
+def open_quad():
+    """ A quad that covers 80% of the sphere but cannot close it (its angle does not divide 2pi)"""
+    return qd.Quad("open", *[0.65 * np.pi] * 4, 1, 1, 1, 1)
+
+
+def test_every_policy_gives_the_closed_pavings():
+    """ The side chosen by a policy may only take quads whose free corner falls on a point of the boundary,
+    the policies then try every side (the kite and the rhombus pave the sphere with 24 and 12 quads)"""
+    kite = spherical_quad("kite", [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)])
+    side = np.arccos(1 / np.sqrt(3))
+    rhombus = qd.Quad("rhombus", 2 * np.pi / 3, np.pi / 2, 2 * np.pi / 3, np.pi / 2, side, side, side, side)
+    for quad, n, policies, seeds in ((kite, 2, ["constrained", "smallest gap"], (1, 3)),
+                                     (rhombus, 1, ["constrained", "smallest gap", "largest gap"], range(6))):
+        for policy in policies + [Scheduler([quad], "random", seed) for seed in seeds]:
+            closed = [graphe for graphe, _ in PavingSearch([quad], quad, seuil=4 * np.pi, max_depth=24, policy=policy)
+                      if not graphe.exterior_vertices()]
+            assert len(closed) == n and all(vl.check_paving(graphe).ok for graphe in closed)
+
+
+def test_policy_for():
+    assert policy_for(None, 4 * np.pi) == "constrained" and policy_for("random", 4 * np.pi) == "random"
+    assert policy_for(None, 0.8 * 4 * np.pi) == policy_for("list", 0.8 * 4 * np.pi) == "list"
+    for policy in ("constrained", Scheduler([open_quad()], "smallest gap")):
+        with pytest.raises(ValueError):
+            policy_for(policy, 0.8 * 4 * np.pi)
+
+
+def test_partial_pavings_with_every_policy(tmp_path):
+    """ The policies that try one side miss the pavings covering 80% of the sphere, they are refused for them"""
+    quad = open_quad()
+    for policy in (None, "list"):
+        assert len(list(PavingSearch([quad], quad, bound=False, policy=policy, max_results=1))) == 1
+    for policy in ("constrained", "random"):
+        with pytest.raises(ValueError):
+            PavingSearch([quad], quad, bound=False, policy=policy)
+    with pytest.raises(ValueError):
+        bt.run_batch([], str(tmp_path / "results.sqlite"), policy="random")
+    assert not (tmp_path / "results.sqlite").exists()
+
+
+# Bounds
+
+def test_bounds_keep_partial_pavings():
+    """ A paving covering 80% of the sphere that can never be closed is not cut by the bounds of such a search"""
+    quad = open_quad()
+    assert not Bounds([quad]).area_ok(quad.area()) or not Bounds([quad]).angle_ok(2 * np.pi - quad.alpha)
+    assert len(list(PavingSearch([quad], quad, bound=True, max_results=1))) == 1
+    assert pg.construction_graphe([quad], quad)[1]
+
+
+def test_bounds_and_checks_read_the_tolerance_policy():
+    face = cube()[0]
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(face)
+    graphe._v_length[graphe.exterior_vertices()[0].id] += 0.05
+    assert not fillable(0.05, 1., 2.) and not vl.check_face(graphe, 0).ok
+    previous = tl.set_policy(tl.Tolerance(absolute=0.1))
+    try:
+        assert fillable(0.05, 1., 2.) and vl.check_face(graphe, 0).ok
+    finally:
+        tl.set_policy(previous)
+
+
+def test_tolerance_is_positive():
+    for options in ({"absolute": 0.}, {"absolute": -1e-4}, {"ulps": 0}):
+        with pytest.raises(ValueError):
+            tl.Tolerance(**options)
+    assert tl.Tolerance(ulps=4).length > 0
+
+
+def test_bounds_of_flat_quads():
+    """ Quads of area 0 never cover 80% of the sphere"""
+    square = qd.Quad("carré", np.pi / 2, np.pi / 2, np.pi / 2, np.pi / 2, 1, 1, 1, 1)
+    assert not list(PavingSearch([square], square))
+
+
+def test_bounds_of_closed_pavings():
+    face = cube()[0]
+    bounds = Bounds([face], seuil=4 * np.pi)
+    assert bounds.area_ok(face.area()) and not bounds.area_ok(face.area() / 2)
+    closed = [g for g, _ in PavingSearch([face], face, seuil=4 * np.pi, max_results=1) if not g.exterior_vertices()]
+    assert len(closed) == 1
+
+
+# Transposition table
+
+def test_transposition_table_hits_and_misses():
+    table = TranspositionTable(max_entries=2)
+    table.put("a", DEAD_END, 3)
+    assert table.get("a", 2) == DEAD_END and table.get("a", 4) is None and table.get("b") is None
+    table.put("b", SOLVABLE)
+    table.put("c", DEAD_END)
+    assert table.get("a") is None and table.get("b") == SOLVABLE
+    assert table.stats() == {"entries": 2, "hits": 2, "misses": 3, "evictions": 1}
+
+
+def test_search_with_a_transposition_table():
+    """ The dead ends found by a search are not explored again by the next one, the pavings are the same"""
+    quads = [cube()[0], odd()]
+    plain = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6)
+    expected = signatures(graphe for graphe, _ in plain)
+    table = TranspositionTable()
+    first = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6, table=table)
+    assert signatures(graphe for graphe, _ in first) == expected and first.n_explored == plain.n_explored
+    hits, misses = table.hits, table.misses
+    second = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6, table=table)
+    assert signatures(graphe for graphe, _ in second) == expected and second.n_explored < first.n_explored
+    assert table.hits > hits and table.misses == misses and second.stats["transposition cut"] > 0
+
+
+# Validity
+
+def test_checks_of_a_paving():
+    quads = [cube()[0], odd()]
+    plain = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6)
+    expected = signatures(graphe for graphe, _ in plain)
+    verified = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6, verify=True)
+    pavings = [graphe for graphe, _ in verified]
+    assert signatures(pavings) == expected and verified.stats["invalid"] == 0
+    report = vl.check_paving(pavings[0])
+    assert report.ok and report.counts["faces"] == 6 and report.counts["points"] == 8 and report.counts["euler"] == 2
+    graphe = pg.PavingGraph()
+    graphe.add_first_quad(quads[0])
+    graphe.add_quad(quads[0], graphe.exterior_vertices()[0].id)
+    assert vl.check_paving(graphe, closed=False).ok and vl.check_face(graphe).ok
+    assert vl.check_paving(graphe).checks() == ["angle", "area", "euler", "open fan", "side use"]
+    graphe._v_length[graphe._faces[-1][1][2]] += 0.1
+    assert vl.check_face(graphe).checks() == vl.check_paving(graphe, closed=False).checks() == ["side length"]
+
+
+# Embedding
+
+def test_embedding_of_the_cube():
+    """ The quads close up around the corners of the cube (the error is only rounding), with their sides and angles"""
+    face = cube()[0]
+    graphe = next(graphe for graphe, _ in PavingSearch([face], face, seuil=4 * np.pi, max_results=1))
+    embedding = embed(graphe)
+    assert len(embedding.points) == 8 and embedding.max_error < 1e-14 and embedding.meetings() == 0
+    corners = embedding.corners
+    lengths = np.arccos(np.clip(np.einsum("fki,fki->fk", corners, np.roll(corners, -1, axis=1)), -1, 1))
+    assert np.allclose(lengths, np.arccos(1 / 3)) and np.allclose(np.linalg.norm(corners, axis=2), 1)
+    dots = np.sort(embedding.positions @ embedding.positions.T, axis=1)
+    assert np.allclose(dots, [-1, -1 / 3, -1 / 3, -1 / 3, 1 / 3, 1 / 3, 1 / 3, 1]) # the corners of a cube
+    assert np.allclose(embedding.corners[0, 0], [0, 0, 1]) and np.allclose(embedding.corners[0, 1] @ [0, 1, 0], 0)
+
+
+# Sphere meshes
+
+def test_sphere_meshes_are_cached():
+    x, y, z = sr.sphere_mesh(11)
+    assert sr.sphere_mesh(11)[0] is x and x.shape == (11, 11) and np.allclose(x ** 2 + y ** 2 + z ** 2, sr.r ** 2)
+    assert sr.sphere_mesh(21)[0].shape == (21, 21) and sr.x is sr.sphere_mesh()[0]
+    with pytest.raises(ValueError):
+        x[0, 0] = 0 # shared by every caller, so read only
+    vertices, triangles = sr.icosphere(1)
+    assert sr.icosphere(1)[0] is vertices and len(vertices) == 42 and len(triangles) == 80
+    assert np.allclose(np.linalg.norm(vertices, axis=1), sr.r)
+    with pytest.raises(AttributeError):
+        sr.w
+
+
+# Mesh export
+
+def read_ply(path):
+    """ The vertices and the faces (4 vertices, paving, quad) of a binary PLY file written by Mesh"""
+    with open(path, "rb") as file:
+        data = file.read()
+    end = data.index(b"end_header\n") + len(b"end_header\n")
+    counts = [int(line.split()[2]) for line in data[:end].decode().splitlines() if line.startswith("element")]
+    vertices = np.frombuffer(data, dtype="<f4", count=3 * counts[0], offset=end).reshape(-1, 3)
+    faces = np.frombuffer(data, dtype=ms._PLY_FACE, offset=end + 12 * counts[0])
+    assert len(faces) == counts[1] and (faces["n"] == 4).all()
+    return vertices, faces
+
+
+def test_mesh_export(tmp_path):
+    """ The PLY and OBJ files of two cubes hold the same mesh, written in several chunks, its faces facing out"""
+    face = cube()[0]
+    graphe = next(graphe for graphe, _ in PavingSearch([face], face, seuil=4 * np.pi, max_results=1))
+    ply, obj = str(tmp_path / "cubes.ply"), str(tmp_path / "cubes.obj")
+    assert ms.export([graphe, (graphe, True)], ply, resolution=3, chunk=20) == (2, 2 * 6 * 16, 2 * 6 * 9)
+    assert ms.export([graphe] * 3, obj, resolution=3, limit=2) == (2, 2 * 6 * 16, 2 * 6 * 9)
+    vertices, faces = read_ply(ply)
+    with open(obj) as file:
+        lines = [line.split() for line in file]
+    obj_vertices = np.array([line[1:] for line in lines if line[0] == "v"], dtype=np.float64)
+    obj_faces = np.array([line[1:] for line in lines if line[0] == "f"], dtype=np.int64) - 1
+    assert [line[1] for line in lines if line[0] == "o"] == ["paving_0", "paving_1"]
+    assert np.allclose(vertices, obj_vertices, atol=1e-6) and np.array_equal(faces["vertices"], obj_faces)
+    assert np.allclose(np.linalg.norm(vertices, axis=1), 1, atol=1e-6)
+    assert list(np.unique(faces["paving"])) == [0, 1] and list(np.unique(faces["quad"])) == list(range(6))
+    corners = vertices[faces["vertices"]].astype(np.float64)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 3] - corners[:, 0])
+    assert (np.einsum("fi,fi->f", normals, corners.mean(axis=1)) > 0).all()
+    assert not os.path.exists(ply + ".faces")
+
+
+# Beam search
+
+class Clock:
+    """ A time.monotonic that goes on by one second each time it is read"""
+
+    def __init__(self):
+        self.now = 0
+
+    def monotonic(self):
+        self.now += 1
+        return self.now
+
+
+def test_beam_search_cut_by_the_time_budget(monkeypatch):
+    """ A restart cut by the deadline gives what it found before it"""
+    face = cube()[0]
+    finished, found = beam([face], face, deadline=time.monotonic() - 1)
+    assert not finished and len(found) == 1
+    monkeypatch.setattr(BeamSearch, "time", Clock())
+    seuil = 0.8 * 4 * np.pi
+    finished, found = beam([face, odd()], face, width=4, seuil=seuil, deadline=12)
+    assert not finished and found and all(complete for *_, complete in found)
+    monkeypatch.setattr(BeamSearch, "time", Clock())
+    pavings = beam_search([face, odd()], face, width=4, seuil=seuil, time_budget=12)
+    assert pavings and all(complete for _, complete in pavings)
+
+
+# Batch
+
+def test_batch_settings_and_errors(tmp_path):
+    cube_quad = {"id": "cube", "angles": ["2*pi/3"] * 4, "sides": ["arccos(1/3)"] * 4}
+    path, db = str(tmp_path / "catalogues.json"), str(tmp_path / "results.sqlite")
+    with open(path, "w") as file:
+        json.dump([{"name": "cube", "quads": [cube_quad]},
+                   {"name": "bad", "quads": [dict(cube_quad, sides=["__import__('os')"] * 4)]},
+                   {"name": "init", "init": "nope", "quads": [cube_quad]}], file)
+    catalogues, errors = bt.read(path)
+    assert [name for name, _, _ in catalogues] == ["cube", "init"] and [name for name, _ in errors] == ["bad"]
+    assert bt.run_batch([path], db, workers=1, log=lambda message: None) == 2
+    assert bt.run_batch([path], db, workers=1, log=lambda message: None) == 1 # the error is run again
+    assert bt.run_batch([path], db, workers=1, coverage=1, log=lambda message: None) == 2
+    connection = sqlite3.connect(db)
+    statuses = sorted(connection.execute("SELECT name, status FROM catalogues"))
+    connection.close()
+    assert statuses == [("bad", "error"), ("cube", "solved"), ("cube", "solved"), ("init", "error"),
+                        ("init", "error")]
+
+
+def test_batch_formulas():
+    assert bt.number("2*pi/3") == 2 * np.pi / 3 and bt.number("sqrt(2)**2") == pytest.approx(2)
+    start = time.monotonic()
+    for formula in ("9**9**9", "1/0", "__import__('os')"):
+        with pytest.raises(ValueError):
+            bt.number(formula)
+    assert time.monotonic() - start < 1
+
+
+def test_batch_indices(tmp_path):
+    store = bt.Store(str(tmp_path / "results.sqlite"))
+    plan = store.connection.execute("EXPLAIN QUERY PLAN SELECT hash FROM catalogues WHERE catalogue = ?",
+                                    ("x",)).fetchall()
+    store.close()
+    assert "catalogues_catalogue" in str(plan)
+
+
+# Search
+
+def test_search_goes_on_from_its_frontier():
+    """ A search cut by its budget and started again from its frontier gives the pavings of the search in one go"""
+    quads, seuil = [cube()[0], odd()], 0.4 * 4 * np.pi
+    expected = signatures(graphe for graphe, _ in PavingSearch(quads, quads[0], seuil=seuil))
+    first = PavingSearch(quads, quads[0], seuil=seuil, budget=40)
+    found = [graphe for graphe, _ in first]
+    frontier = first.frontier()
+    assert frontier and first.n_explored == 40
+    found += [graphe for graphe, _ in PavingSearch(quads, seuil=seuil, frontier=frontier, deja_vus=first.deja_vus)]
+    assert signatures(found) == expected
+
+
+def test_probe_counts_the_search(tmp_path):
+    """ A probe counts the search without changing what it finds, and writes its last snapshot"""
+    quads = [cube()[0], odd()]
+    plain = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6)
+    expected = signatures(graphe for graphe, _ in plain)
+    snapshots = []
+    probe = Probe(callback=snapshots.append, every=3600, path=str(tmp_path / "probe.json"))
+    search = PavingSearch(quads, quads[0], seuil=4 * np.pi, max_depth=6, probe=probe)
+    assert signatures(graphe for graphe, _ in search) == expected and search.n_explored == plain.n_explored
+    assert probe.nodes[1] == 1 and max(probe.nodes) == 5 and probe.accepted >= search.n_explored
+    assert probe.rejects and all(reason.split()[0] in ("length", "angle", "two", "corner", "fan") for reason in probe.rejects)
+    assert {"placements", "add_quad", "signature"} <= set(probe.times)
+    with open(tmp_path / "probe.json") as file:
+        saved = json.load(file)
+    assert snapshots and saved == json.loads(json.dumps(snapshots[-1]))
+    assert saved["explored"] == search.n_explored and saved["nodes"] == sum(probe.nodes.values())
+
+
+def test_search_with_a_fan_table(tmp_path):
+    """ The quads refused by the fan table lead to no closed paving: the search gives the same closed pavings
+    with less work (the pavings covering 40% of the sphere that cannot be closed are not given)"""
+    quads = [cube()[0], odd()]
+    c = np.arccos(1 / 3)
+    fans = FanTable.cached(quads, cache_dir=str(tmp_path))
+    assert fans.completes(c, c, 2 * np.pi / 3) and fans.completes(c, c, 4 * np.pi / 3)
+    assert not fans.completes(c, c, np.pi / 3) and not fans.completes(c, 1., 2 * np.pi / 3)
+    assert len(FanTable.cached(quads, cache_dir=str(tmp_path))) == len(fans) and len(list(tmp_path.iterdir())) == 1
+    for seuil, options in ((4 * np.pi, {"max_depth": 6}), (0.4 * 4 * np.pi, {})):
+        plain = PavingSearch(quads, quads[0], seuil=seuil, **options)
+        expected = signatures(graphe for graphe, _ in plain)
+        pruned = PavingSearch(quads, quads[0], seuil=seuil, fans=fans, verify=True, **options)
+        found = signatures(graphe for graphe, _ in pruned)
+        assert pruned.stats["invalid"] == 0 and pruned.n_explored < plain.n_explored
+        if seuil == 4 * np.pi:
+            assert found == expected
+        else:
+            assert found and set(found) < set(expected)
+
+
+def test_save_and_resume(tmp_path):
+    """ A search stopped, saved and loaded again gives the same pavings as the search in one go"""
+    quads, seuil = [cube()[0], odd()], 0.4 * 4 * np.pi
+    expected = signatures(graphe for graphe, _ in PavingSearch(quads, quads[0], seuil=seuil))
+    first = PavingSearch(quads, quads[0], seuil=seuil, budget=40)
+    found = [graphe for graphe, _ in first]
+    path = str(tmp_path / "checkpoint.pav")
+    first.save(path)
+    found += [graphe for graphe, _ in PavingSearch.load(path, quads, seuil=seuil)]
+    assert len(expected) == 70 and signatures(found) == expected
+
+
+def test_parallel_search_is_the_search():
+    quads, seuil = [cube()[0], odd()], 0.4 * 4 * np.pi
+    expected = signatures(graphe for graphe, _ in PavingSearch(quads, quads[0], seuil=seuil))
+    assert signatures(parallel_search(quads, quads[0], workers=0, first_only=False, seuil=seuil)) == expected
+    assert signatures(parallel_search(quads, quads[0], workers=2, first_only=False, seuil=seuil, budget=5)) == \
+        expected
+    first = pg.construction_graphe(quads, quads[0])[0]
+    assert signatures(parallel_search(quads, quads[0], workers=2, budget=5)) == signatures([first])